@@ -0,0 +1,118 @@
+import os
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+from app import metrics
+from app.utils import MAX_AUDIO_SECONDS, TARGET_SR
+
+# Scratch memory one thread may keep between requests; a request that needs more gets one-off arrays.
+# Default: four float32 clips of MAX_AUDIO_SECONDS (about 30 MiB at 120 s)
+ARENA_MAX_BYTES = int(os.getenv('ARENA_MAX_BYTES', str(4 * int(MAX_AUDIO_SECONDS * TARGET_SR) * 4)))
+# Trace Python/NumPy allocations per analysis (tracemalloc; slows every allocation, diagnostics only)
+ALLOC_TRACE = os.getenv('ALLOC_TRACE', '0') == '1'
+
+
+class ScratchArena:
+    """Named, reusable scratch arrays for one thread.
+
+    `get(name, shape, dtype)` returns a view of a buffer kept from earlier calls, growing
+    it (to at least double its old size) only when the request is larger than anything
+    seen before. Contents are garbage on return and are overwritten by the next `get` of
+    the same name, so results must never be returned or stored in one. While `enabled`
+    is False (see `bypass_arena`) every call returns a one-off array.
+    """
+
+    def __init__(self, max_bytes: int = ARENA_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.enabled = True
+        self._buffers = {}
+        self.nbytes = 0
+        self.grows = 0
+        self.oversize = 0
+
+    def get(self, name: str, shape, dtype=np.float32) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        shape = (int(shape),) if np.isscalar(shape) else tuple(shape)
+        if not self.enabled:
+            return np.empty(shape, dtype)
+        n = int(np.prod(shape))
+        key = (name, dtype.str)
+        buf = self._buffers.get(key)
+        if buf is not None and buf.size >= n:
+            return buf[:n].reshape(shape)
+        held = buf.nbytes if buf is not None else 0
+        size = max(n, 2 * buf.size) if buf is not None else n
+        if self.nbytes - held + size * dtype.itemsize > self.max_bytes:
+            size = n
+        if self.nbytes - held + size * dtype.itemsize > self.max_bytes:
+            self.oversize += 1
+            metrics.inc('arena_oversize_total')
+            return np.empty(shape, dtype)
+        buf = np.empty(size, dtype)
+        self._buffers[key] = buf
+        self.nbytes += buf.nbytes - held
+        self.grows += 1
+        metrics.inc('arena_grow_total')
+        return buf[:n].reshape(shape)
+
+    def clear(self):
+        self._buffers.clear()
+        self.nbytes = 0
+
+
+_local = threading.local()
+
+
+def get_arena() -> ScratchArena:
+    """This thread's arena (threadpool threads and pool processes each get their own)."""
+    arena = getattr(_local, 'arena', None)
+    if arena is None:
+        arena = _local.arena = ScratchArena()
+    return arena
+
+
+@contextmanager
+def bypass_arena(bypass: bool = True):
+    """Give this thread one-off arrays inside the block (long job recordings), leaving its arena untouched."""
+    arena = get_arena()
+    enabled = arena.enabled
+    arena.enabled = enabled and not bypass
+    try:
+        yield
+    finally:
+        arena.enabled = enabled
+
+
+@contextmanager
+def measure_allocations(enabled: bool = True):
+    """Peak bytes, net allocated blocks and arena growth inside the block, filled into the yielded dict on exit.
+
+    Uses tracemalloc and sys.getallocatedblocks(), which are process-wide: with concurrent
+    analyses in one process the numbers include their allocations too, so measure under a
+    single request at a time. `blocks` counts Python-allocator blocks still held on exit
+    (a leak or cache-growth signal); large NumPy buffers show up in `peak_bytes` instead.
+    """
+    stats = {}
+    if not enabled:
+        yield stats
+        return
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    arena = get_arena()
+    grows = arena.grows
+    base, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    blocks = sys.getallocatedblocks()
+    try:
+        yield stats
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        stats['peak_bytes'] = max(0, peak - base)
+        stats['blocks'] = sys.getallocatedblocks() - blocks
+        stats['arena_grows'] = arena.grows - grows
+        # Under ALLOC_TRACE tracing stays on for the next request; one-off measurements switch it off again
+        if started and not ALLOC_TRACE:
+            tracemalloc.stop()
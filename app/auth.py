@@ -1,16 +1,112 @@
 import os
-from fastapi import Header, HTTPException
+import hmac
+import json
+import hashlib
+import threading
+from fastapi import HTTPException
 
 # Default to a development API key if none is set. In production, set a strong API_KEY in the environment.
 API_KEY = os.getenv('API_KEY', 'testkey')
+# Optional JSON file describing several tenants, each with its own key and limits:
+# {"keys": [{"id": "tenant-a", "key": "...", "rate": 5, "burst": 10, "max_concurrent": 2, "admin": false,
+#            "labeller": false}]}
+# The default API_KEY is the operator key and may call the /admin endpoints. Labels posted to
+# /api/feedback retrain the shared model, so only admin and "labeller" keys may post them.
+API_KEYS_FILE = os.getenv('API_KEYS_FILE')
 
-def validate_api_key(x_api_key: str | None):
-    print(f"DEBUG: Received key: '{x_api_key}'")
-    print(f"DEBUG: Internal key: '{API_KEY}'")
+# Default limits applied to registry keys that do not override them
+RATE_LIMIT_RPS = float(os.getenv('RATE_LIMIT_RPS', '5'))
+RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', '10'))
+MAX_CONCURRENT_PER_KEY = int(os.getenv('MAX_CONCURRENT_PER_KEY', '4'))
+# The default API_KEY is unlimited, as it was before per-key limits, so that deployments where every
+# client shares it keep their throughput; set to 1 to give it the default limits above
+API_KEY_LIMITED = os.getenv('API_KEY_LIMITED', '0') == '1'
+
+
+class KeyPolicy:
+    """Identity and limits attached to one API key. The raw key is never stored here."""
+    __slots__ = ('key_id', 'rate', 'burst', 'max_concurrent', 'admin', 'labeller')
+
+    def __init__(self, key_id, rate=None, burst=None, max_concurrent=None, admin=False, labeller=False):
+        self.key_id = key_id
+        self.rate = RATE_LIMIT_RPS if rate is None else float(rate)
+        self.burst = RATE_LIMIT_BURST if burst is None else float(burst)
+        self.max_concurrent = MAX_CONCURRENT_PER_KEY if max_concurrent is None else int(max_concurrent)
+        self.admin = bool(admin)
+        self.labeller = bool(labeller)
+
+    def __repr__(self):
+        return f'KeyPolicy({self.key_id!r}, rate={self.rate}, burst={self.burst}, max_concurrent={self.max_concurrent})'
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def _digest(key: str) -> bytes:
+    # Compare fixed-length digests so the comparison time does not depend on key length
+    return hashlib.sha256(key.strip().encode('utf-8')).digest()
+
+
+def load_key_registry():
+    """Build the key registry once (at startup) from API_KEYS_FILE and/or API_KEY."""
+    global _registry
+    with _registry_lock:
+        if _registry is not None:
+            return _registry
+        entries = []
+        if API_KEYS_FILE:
+            with open(API_KEYS_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            items = data.get('keys', []) if isinstance(data, dict) else data
+            for i, item in enumerate(items):
+                key = item.get('key')
+                if not key:
+                    raise ValueError(f'API_KEYS_FILE entry {i} has no key')
+                policy = KeyPolicy(
+                    item.get('id') or f'key-{i}',
+                    rate=item.get('rate'),
+                    burst=item.get('burst'),
+                    max_concurrent=item.get('max_concurrent'),
+                    admin=item.get('admin', False),
+                    labeller=item.get('labeller', False),
+                )
+                entries.append((_digest(key), policy))
+        if API_KEY:
+            if API_KEY_LIMITED:
+                entries.append((_digest(API_KEY), KeyPolicy('default', admin=True)))
+            else:
+                entries.append((_digest(API_KEY), KeyPolicy('default', rate=0, burst=0, max_concurrent=0, admin=True)))
+        _registry = entries
+        return _registry
+
+
+def validate_api_key(x_api_key: str | None) -> KeyPolicy:
     if x_api_key is None:
         raise HTTPException(status_code=401, detail='Missing API key')
-    if API_KEY is None:
+    registry = load_key_registry()
+    if not registry:
         raise HTTPException(status_code=500, detail='Server misconfiguration: API key not set')
-    if str(x_api_key).strip() != str(API_KEY).strip():
+    presented = _digest(str(x_api_key))
+    match = None
+    # Check every entry without an early exit so timing does not reveal which key matched
+    for digest, policy in registry:
+        if hmac.compare_digest(digest, presented):
+            match = policy
+    if match is None:
         raise HTTPException(status_code=403, detail='Invalid API key')
-    return True
+    return match
+
+
+def require_admin(x_api_key: str | None) -> KeyPolicy:
+    policy = validate_api_key(x_api_key)
+    if not policy.admin:
+        raise HTTPException(status_code=403, detail='Admin privileges required')
+    return policy
+
+
+def require_labeller(x_api_key: str | None) -> KeyPolicy:
+    policy = validate_api_key(x_api_key)
+    if not (policy.admin or policy.labeller):
+        raise HTTPException(status_code=403, detail='Labelling privileges required')
+    return policy
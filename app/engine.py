@@ -0,0 +1,149 @@
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from app import model as model_module
+from app.model import classify, explain
+from app.tracing import Trace, current_trace, trace_scope, span, annotate
+from app.arena import measure_allocations, bypass_arena, ALLOC_TRACE
+from app.threads import get_budget, apply_native_limits, run_cpu_bound
+
+# 'inline' runs features and inference in this worker's threadpool (under the CPU limiter); 'pool' hands decoded PCM
+# to a fixed set of CPU worker processes through shared memory
+INFERENCE_MODE = os.getenv('INFERENCE_MODE', 'inline')
+# Defaults to this uvicorn worker's share of the CPU budget (see app/threads.py)
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '0')) or None
+
+
+def analyze(y: np.ndarray, sr: int, language: str | None = None, profile: str = 'accurate',
+            scratch: bool = True) -> dict:
+    """Features, classification and explanation for one decoded clip.
+
+    `scratch=False` (job-length recordings) keeps the clip's temporaries out of the thread's
+    arena and the clip out of the fingerprint index, which would otherwise hold its hashes.
+    """
+    with bypass_arena(not scratch), measure_allocations(ALLOC_TRACE) as allocs:
+        label, confidence, meta, features = classify(y, sr, language, profile, fingerprinting=scratch)
+        with span('explain'):
+            explanation = explain(features, label)
+    for key, value in allocs.items():
+        annotate(f'alloc_{key}', value)
+    return {'label': label, 'confidence': confidence, 'meta': meta, 'features': features,
+            'explanation': explanation}
+
+
+# ---- worker process side ----
+
+def _init_worker(loaded):
+    # One core per pool process: keep BLAS/numba single-threaded here
+    apply_native_limits()
+    model_module.install_model(loaded)
+    model_module.load_fast_model()
+    # Run one short clip so librosa/numba compile before the first real request
+    t = np.arange(4000, dtype=np.float32) / 16000
+    analyze(0.1 * np.sin(2 * np.pi * 150 * t), 16000)
+
+
+def _analyze_shared(shm_name: str, n_samples: int, sr: int, sampled: bool, language: str | None = None,
+                    profile: str = 'accurate', scratch: bool = True) -> dict:
+    shm = shared_memory.SharedMemory(name=shm_name)
+    trace = Trace('inference-worker', sampled=sampled)
+    try:
+        with trace_scope(trace):
+            model_module.refresh_secondary_models()
+            y = np.ndarray((n_samples,), dtype=np.float32, buffer=shm.buf)
+            # classify() only reads the signal and keeps no reference to it once analyze() returns
+            result = analyze(y, sr, language, profile, scratch)
+            del y
+    finally:
+        shm.close()
+    result['spans'] = trace.spans
+    result['attrs'] = trace.attrs
+    return result
+
+
+# ---- front-end side ----
+
+class InferenceEngine:
+    """Fixed pool of worker processes, each holding one warm model and feature backend.
+
+    The front-end copies decoded float32 PCM into a SharedMemory block and submits only
+    its name; results come back over the executor's result queue. On a global model swap
+    the pool is replaced; in-flight jobs finish on the old pool. Language and fast-profile
+    models are re-checked inside each process (model.refresh_secondary_models).
+    """
+
+    def __init__(self, workers: int | None = INFERENCE_WORKERS):
+        self.workers = max(1, workers or get_budget().inference_workers)
+        self._lock = threading.Lock()
+        self._executor = self._start(model_module.active_model())
+        model_module.add_swap_listener(self._on_swap)
+
+    def _start(self, loaded):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=(loaded,))
+
+    def _on_swap(self, loaded):
+        new = self._start(loaded)
+        with self._lock:
+            old, self._executor = self._executor, new
+        old.shutdown(wait=False)
+
+    async def analyze(self, y: np.ndarray, sr: int, language: str | None = None, profile: str = 'accurate',
+                      scratch: bool = True) -> dict:
+        y = np.ascontiguousarray(y, dtype=np.float32)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, y.nbytes))
+        try:
+            np.ndarray(y.shape, dtype=np.float32, buffer=shm.buf)[:] = y
+            trace = current_trace()
+            submitted = time.perf_counter()
+            with self._lock:
+                future = self._executor.submit(_analyze_shared, shm.name, len(y), sr,
+                                               bool(trace is not None and trace.sampled), language, profile, scratch)
+            result = await asyncio.wrap_future(future)
+        finally:
+            shm.close()
+            shm.unlink()
+        spans = result.pop('spans')
+        attrs = result.pop('attrs')
+        if trace is not None:
+            # Worker span offsets are relative to the job start; shift them onto the request timeline
+            base = (submitted - trace.start) * 1000.0
+            trace.spans.extend((name, base + offset, duration) for name, offset, duration in spans)
+            trace.attrs.update(attrs)
+        return result
+
+    def shutdown(self):
+        model_module.remove_swap_listener(self._on_swap)
+        with self._lock:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+_engine = None
+
+
+def get_engine() -> InferenceEngine | None:
+    """The process-pool engine when INFERENCE_MODE=pool, else None."""
+    global _engine
+    if INFERENCE_MODE == 'pool' and _engine is None:
+        _engine = InferenceEngine()
+    return _engine
+
+
+async def run_analysis(y: np.ndarray, sr: int, language: str | None = None, profile: str = 'accurate',
+                       scratch: bool = True) -> dict:
+    engine = get_engine()
+    if engine is not None:
+        return await engine.analyze(y, sr, language, profile, scratch)
+    return await run_cpu_bound(analyze, y, sr, language, profile, scratch)
+
+
+def shutdown_engine():
+    global _engine
+    if _engine is not None:
+        _engine.shutdown()
+        _engine = None
@@ -1,4 +1,7 @@
+import os
 import numpy as np
+from app.tracing import span
+from app.arena import get_arena
 
 # Prefer librosa if available, but provide a lightweight fallback to avoid hard dependency
 try:
@@ -7,22 +10,34 @@ try:
 except Exception:
     _HAS_LIBROSA = False
 
+# 'librosa', or 'numpy' for the dependency-free fallback. The two produce different vectors,
+# so a model must be served with the backend it was trained on (see tests/test_feature_parity.py)
+FEATURE_BACKEND = os.getenv('FEATURE_BACKEND', 'librosa' if _HAS_LIBROSA else 'numpy')
+if FEATURE_BACKEND == 'librosa' and not _HAS_LIBROSA:
+    print('FEATURE_BACKEND=librosa but librosa is not importable; using the NumPy backend')
+    FEATURE_BACKEND = 'numpy'
+
+
+def _use_librosa():
+    return FEATURE_BACKEND == 'librosa'
+
 
 def _safe_trim(y, sr):
-    if _HAS_LIBROSA:
+    if _use_librosa():
         return librosa.effects.trim(y)[0]
-    # simple energy-based trim
-    energy = np.abs(y)
+    # simple energy-based trim; first/last loud sample found with argmax instead of an index array
+    arena = get_arena()
+    energy = np.abs(y, out=arena.get('trim_energy', len(y)))
     thresh = np.mean(energy) * 0.1
-    idx = np.where(energy > thresh)[0]
-    if idx.size == 0:
+    loud = np.greater(energy, thresh, out=arena.get('trim_mask', len(y), np.bool_))
+    if len(y) == 0 or not loud.any():
         return y
-    return y[idx[0]:idx[-1]+1]
+    return y[int(loud.argmax()):len(y) - int(loud[::-1].argmax())]
 
 
 def _estimate_pitch_autocorr(y, sr):
     # crude autocorrelation pitch estimator
-    y = y - np.mean(y)
+    y = np.subtract(y, np.mean(y), out=get_arena().get('centered', len(y)))
     corr = np.correlate(y, y, mode='full')[len(y)-1:]
     corr[:int(sr/500)] = 0  # remove high freq
     peak = np.argmax(corr)
@@ -32,84 +47,172 @@ def _estimate_pitch_autocorr(y, sr):
     return float(f0)
 
 
-def extract_features(y: np.ndarray, sr: int = 16000):
-    y = y.astype(np.float32)
+# Model input order. The pitch features need pyin; everything else is cheap.
+FEATURE_KEYS = ['f0_mean','f0_std','jitter','shimmer','energy_mean','energy_std','mfcc_mean_0','mfcc_std_0','spec_flat_mean','zcr_mean','duration','energy_skew']
+PITCH_FEATURE_KEYS = ['f0_mean','f0_std','jitter']
+CHEAP_FEATURE_KEYS = [k for k in FEATURE_KEYS if k not in PITCH_FEATURE_KEYS]
+
+
+# STFT geometry shared by the MFCC, flatness and fingerprint stages (librosa defaults)
+N_FFT = 2048
+HOP_LENGTH = 512
+
+# Processing profiles. 'accurate' is the pyin + 2048-point path; 'fast' uses yin with
+# RMS voicing and 1024-point windows, and needs a model trained on 'fast' features.
+# (The NumPy backend is already cheap and ignores the profile.)
+PROFILES = ('accurate', 'fast')
+FAST_N_FFT = 1024
+FAST_N_MELS = 64
+FAST_PITCH_FRAME = 1024
+# Frames quieter than this fraction of the loudest frame count as unvoiced (f0 = 0) in the fast profile
+FAST_VOICING_RMS = 0.1
+
+
+def _stft_magnitude(y):
+    # NumPy equivalent of abs(librosa.stft(y, center=True, pad_mode='constant'))
+    y = np.pad(y, N_FFT // 2)
+    if len(y) < N_FFT:
+        y = np.pad(y, (0, N_FFT - len(y)))
+    frames = np.lib.stride_tricks.sliding_window_view(y, N_FFT)[::HOP_LENGTH]
+    window = np.hanning(N_FFT + 1)[:-1].astype(np.float32)
+    return np.abs(np.fft.rfft(frames * window, axis=1)).T
+
+
+def extract_cheap_features(y: np.ndarray, sr: int = 16000, want_spectrogram: bool = False,
+                           profile: str = 'accurate'):
+    """Trim and compute the energy/MFCC/flatness/ZCR/duration features.
+
+    Returns the trimmed signal (for a later `add_pitch_features` call), the partial feature
+    dict and the magnitude spectrogram (n_fft=2048, hop=512; n_fft=1024 under the 'fast'
+    profile). The spectrogram is always computed on the librosa path, where MFCC and
+    flatness share it; on the NumPy path it is only computed when `want_spectrogram` is
+    set, and is None otherwise.
+    """
+    n_fft = FAST_N_FFT if profile == 'fast' else N_FFT
+    # Only read from here on, so float32 input is used as is; temporaries come from the thread's arena
+    y = np.asarray(y, dtype=np.float32)
+    arena = get_arena()
     features = {}
 
     # Trim
-    y = _safe_trim(y, sr)
+    with span('trim'):
+        y = _safe_trim(y, sr)
+
+    S_mag = None
+    with span('spectral'):
+        if _use_librosa():
+            # One STFT feeds MFCC, flatness and the fingerprint instead of one per feature
+            S_mag = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=HOP_LENGTH))
+        elif want_spectrogram:
+            S_mag = _stft_magnitude(y)
+
+        # Energy / shimmer
+        if _use_librosa():
+            hop_length = 512
+            frame_energy = librosa.feature.rms(y=y, frame_length=1024, hop_length=hop_length)[0]
+            features['energy_mean'] = float(np.mean(frame_energy))
+            features['energy_std'] = float(np.std(frame_energy))
+            features['shimmer'] = float(features['energy_std'] / (features['energy_mean'] + 1e-8))
+        else:
+            frame_energy = np.abs(y, out=arena.get('energy', len(y)))
+            features['energy_mean'] = float(np.mean(frame_energy))
+            features['energy_std'] = float(np.std(frame_energy))
+            features['shimmer'] = float(features['energy_std'] / (features['energy_mean'] + 1e-8))
+
+        # MFCCs or approximations
+        if _use_librosa():
+            mel = librosa.feature.melspectrogram(S=np.square(S_mag, out=arena.get('power', S_mag.shape)), sr=sr,
+                                                 n_mels=FAST_N_MELS if profile == 'fast' else 128)
+            mfcc = librosa.feature.mfcc(S=librosa.power_to_db(mel), sr=sr, n_mfcc=13)
+            features['mfcc_mean_0'] = float(np.mean(mfcc[0]))
+            features['mfcc_std_0'] = float(np.std(mfcc[0]))
+        else:
+            # Use mean log-spectrum bins as a coarse replacement. One rfft magnitude serves this and
+            # flatness; numpy's rfft has no out=, so its complex output is the one fresh allocation
+            spectrum = np.fft.rfft(y)
+            mag = np.abs(spectrum, out=arena.get('rfft_mag', len(spectrum), np.float64))
+            del spectrum
+            work = arena.get('rfft_work', len(mag), np.float64)
+            logS = np.log(np.add(mag, 1e-8, out=work), out=work)
+            bins = np.array_split(logS, 13)
+            bmeans = [float(np.mean(b)) for b in bins]
+            features['mfcc_mean_0'] = bmeans[0]
+            features['mfcc_std_0'] = float(np.std(bmeans))
+
+        # Spectral flatness
+        if _use_librosa():
+            spec_flat = librosa.feature.spectral_flatness(S=S_mag)[0]
+            features['spec_flat_mean'] = float(np.mean(spec_flat))
+        else:
+            S = np.add(mag, 1e-12, out=work)
+            arith = np.mean(S)
+            geo = np.exp(np.mean(np.log(S, out=work)))
+            features['spec_flat_mean'] = float(geo / (arith + 1e-12))
+
+        # Zero crossing rate
+        if _use_librosa():
+            zcr = librosa.feature.zero_crossing_rate(y, frame_length=n_fft, hop_length=HOP_LENGTH)[0]
+            features['zcr_mean'] = float(np.mean(zcr))
+        else:
+            signs = np.sign(y, out=arena.get('signs', len(y)))
+            steps = np.subtract(signs[1:], signs[:-1], out=arena.get('sign_steps', max(0, len(y) - 1)))
+            crossings = np.sum(np.abs(steps, out=steps)) / 2
+            features['zcr_mean'] = float(crossings / max(1, len(y)))
+
+    # Duration
+    features['duration'] = float(len(y) / sr)
+
+    # Energy skew
+    deviation = np.subtract(frame_energy, np.mean(frame_energy),
+                            out=arena.get('energy_dev', frame_energy.shape, frame_energy.dtype))
+    features['energy_skew'] = float(np.mean(np.power(deviation, 3, out=deviation)))
 
+    return y, features, S_mag
+
+
+def _yin_with_voicing(y, sr):
+    # yin has no voicing decision; zero quiet frames the way pyin's unvoiced (NaN) frames end up
+    f0 = librosa.yin(y, fmin=50, fmax=500, sr=sr, frame_length=FAST_PITCH_FRAME, hop_length=HOP_LENGTH)
+    rms = librosa.feature.rms(y=y, frame_length=FAST_PITCH_FRAME, hop_length=HOP_LENGTH)[0][:len(f0)]
+    return np.where(rms > FAST_VOICING_RMS * (rms.max() + 1e-12), f0, 0.0)
+
+
+def add_pitch_features(y: np.ndarray, sr: int, features: dict, profile: str = 'accurate'):
+    """Add f0_mean/f0_std/jitter to `features` for an already trimmed signal. This is the expensive stage
+    under the 'accurate' profile (pyin); the 'fast' profile uses yin, roughly 30x cheaper."""
     # Pitch mean/std/jitter
-    if _HAS_LIBROSA:
-        try:
-            f0, voiced_flag, voiced_probs = librosa.pyin(y, fmin=50, fmax=500, sr=sr)
-            f0 = np.nan_to_num(f0)
-            features['f0_mean'] = float(np.mean(f0))
-            features['f0_std'] = float(np.std(f0))
-            diffs = np.abs(np.diff(f0))
-            features['jitter'] = float(np.mean(diffs) / (np.mean(f0) + 1e-8))
-        except Exception:
-            features['f0_mean'] = 0.0
+    with span('pitch'):
+        if _use_librosa():
+            try:
+                if profile == 'fast':
+                    f0 = _yin_with_voicing(y, sr)
+                else:
+                    f0, voiced_flag, voiced_probs = librosa.pyin(y, fmin=50, fmax=500, sr=sr)
+                    f0 = np.nan_to_num(f0, copy=False)
+                features['f0_mean'] = float(np.mean(f0))
+                features['f0_std'] = float(np.std(f0))
+                diffs = np.diff(f0)
+                np.abs(diffs, out=diffs)
+                # a clip shorter than two pyin frames has no frame-to-frame variation (not NaN)
+                features['jitter'] = float(np.mean(diffs) / (np.mean(f0) + 1e-8)) if diffs.size else 0.0
+            except Exception:
+                features['f0_mean'] = 0.0
+                features['f0_std'] = 0.0
+                features['jitter'] = 0.0
+        else:
+            f0 = _estimate_pitch_autocorr(y, sr)
+            features['f0_mean'] = f0
             features['f0_std'] = 0.0
             features['jitter'] = 0.0
-    else:
-        f0 = _estimate_pitch_autocorr(y, sr)
-        features['f0_mean'] = f0
-        features['f0_std'] = 0.0
-        features['jitter'] = 0.0
-
-    # Energy / shimmer
-    if _HAS_LIBROSA:
-        hop_length = 512
-        frame_energy = librosa.feature.rms(y=y, frame_length=1024, hop_length=hop_length)[0]
-        features['energy_mean'] = float(np.mean(frame_energy))
-        features['energy_std'] = float(np.std(frame_energy))
-        features['shimmer'] = float(features['energy_std'] / (features['energy_mean'] + 1e-8))
-    else:
-        frame_energy = np.abs(y)
-        features['energy_mean'] = float(np.mean(frame_energy))
-        features['energy_std'] = float(np.std(frame_energy))
-        features['shimmer'] = float(features['energy_std'] / (features['energy_mean'] + 1e-8))
-
-    # MFCCs or approximations
-    if _HAS_LIBROSA:
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        features['mfcc_mean_0'] = float(np.mean(mfcc[0]))
-        features['mfcc_std_0'] = float(np.std(mfcc[0]))
-    else:
-        # Use mean log-spectrum bins as a coarse replacement
-        S = np.abs(np.fft.rfft(y))
-        S = S + 1e-8
-        logS = np.log(S)
-        bins = np.array_split(logS, 13)
-        bmeans = [float(np.mean(b)) for b in bins]
-        features['mfcc_mean_0'] = bmeans[0]
-        features['mfcc_std_0'] = float(np.std(bmeans))
-
-    # Spectral flatness
-    if _HAS_LIBROSA:
-        spec_flat = librosa.feature.spectral_flatness(y=y)[0]
-        features['spec_flat_mean'] = float(np.mean(spec_flat))
-    else:
-        S = np.abs(np.fft.rfft(y)) + 1e-12
-        geo = np.exp(np.mean(np.log(S)))
-        arith = np.mean(S)
-        features['spec_flat_mean'] = float(geo / (arith + 1e-12))
-
-    # Zero crossing rate
-    if _HAS_LIBROSA:
-        zcr = librosa.feature.zero_crossing_rate(y)[0]
-        features['zcr_mean'] = float(np.mean(zcr))
-    else:
-        crossings = np.sum(np.abs(np.diff(np.sign(y)))) / 2
-        features['zcr_mean'] = float(crossings / max(1, len(y)))
+    return features
 
-    # Duration
-    features['duration'] = float(len(y) / sr)
 
-    # Energy skew
-    features['energy_skew'] = float(np.mean((frame_energy - np.mean(frame_energy))**3))
+def feature_vector(features: dict, keys=FEATURE_KEYS) -> np.ndarray:
+    return np.array([features[k] for k in keys], dtype=np.float32)
+
 
+def extract_features(y: np.ndarray, sr: int = 16000, profile: str = 'accurate'):
+    y, features, _ = extract_cheap_features(y, sr, profile=profile)
+    add_pitch_features(y, sr, features, profile)
     # Return in fixed order
-    keys = ['f0_mean','f0_std','jitter','shimmer','energy_mean','energy_std','mfcc_mean_0','mfcc_std_0','spec_flat_mean','zcr_mean','duration','energy_skew']
-    return np.array([features[k] for k in keys], dtype=np.float32), features
+    return feature_vector(features), features
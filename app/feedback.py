@@ -0,0 +1,267 @@
+import os
+import copy
+import glob
+import json
+import time
+import sqlite3
+import threading
+import joblib
+import numpy as np
+from app import metrics
+from app import model as model_module
+from app.features import FEATURE_KEYS, CHEAP_FEATURE_KEYS
+
+# Feature vectors of recent verdicts and analyst labels, shared by every worker on the host. Labels are
+# the dataset this feature collects, so the default lives next to the model artifacts, not in /tmp
+FEEDBACK_DB = os.getenv('FEEDBACK_DB', 'app/artifacts/feedback.sqlite3')
+# Verdicts can be labelled for this long after they were served
+FEEDBACK_VERDICT_TTL = float(os.getenv('FEEDBACK_VERDICT_TTL', str(7 * 24 * 3600)))
+# ... and at most this many are kept (oldest dropped first; about 600 bytes each on disk)
+FEEDBACK_MAX_VERDICTS = int(os.getenv('FEEDBACK_MAX_VERDICTS', '500000'))
+# 'auto' (partial_fit when the model supports it, else refit), 'partial', 'refit' or 'off'
+FEEDBACK_UPDATE_MODE = os.getenv('FEEDBACK_UPDATE_MODE', 'auto')
+FEEDBACK_UPDATE_INTERVAL = float(os.getenv('FEEDBACK_UPDATE_INTERVAL', '300'))
+# Unapplied labels needed before a new model version is built
+FEEDBACK_MIN_BATCH = int(os.getenv('FEEDBACK_MIN_BATCH', '20'))
+# Training feature matrix written by scripts/train.py; refits train on it plus all feedback
+FEEDBACK_BASE_FEATURES = os.getenv('FEEDBACK_BASE_FEATURES', 'app/artifacts/features_cache.npz')
+# Published feedback versions (<MODEL_PATH stem>.<version>.joblib) kept on disk for rollback
+FEEDBACK_KEEP_ARTIFACTS = int(os.getenv('FEEDBACK_KEEP_ARTIFACTS', '3'))
+
+_PRUNE_EVERY = 1000
+_SERVED_BY = ('profile', 'language', 'model_scope')
+# Feedback the updater trains on: only the global model scores accurate-profile features
+_TRAINABLE = "profile = 'accurate' AND model_scope = 'global'"
+
+
+class FeedbackStore:
+    """SQLite tables of served verdicts (features by trace id) and analyst labels for them."""
+
+    def __init__(self, path: str = FEEDBACK_DB, max_verdicts: int = FEEDBACK_MAX_VERDICTS):
+        self.path = path
+        self.max_verdicts = max_verdicts
+        self._local = threading.local()
+        self._inserts = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._conn()
+        conn.execute('CREATE TABLE IF NOT EXISTS verdicts (trace_id TEXT PRIMARY KEY, features TEXT, '
+                     'label TEXT, model_version TEXT, created REAL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS verdicts_created ON verdicts (created)')
+        conn.execute('CREATE TABLE IF NOT EXISTS feedback (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                     'trace_id TEXT UNIQUE, features TEXT, label TEXT, created REAL)')
+        # Which profile and model produced the features; rows from before these columns stay NULL
+        # and are never trained on
+        for table in ('verdicts', 'feedback'):
+            columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+            for column in _SERVED_BY:
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} TEXT')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def record_verdict(self, trace_id: str, features: dict, label: str, model_version: str,
+                       profile: str = 'accurate', language: str | None = None, model_scope: str = 'global'):
+        now = time.time()
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO verdicts (trace_id, features, label, model_version, created, '
+                     'profile, language, model_scope) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                     (trace_id, json.dumps({k: features[k] for k in FEATURE_KEYS if k in features}),
+                      label, model_version, now, profile, language, model_scope))
+        self._inserts += 1
+        if self._inserts % _PRUNE_EVERY == 0:
+            self.prune(now)
+
+    def prune(self, now: float | None = None):
+        """Drop verdicts past FEEDBACK_VERDICT_TTL and the oldest beyond `max_verdicts`; labels are kept."""
+        conn = self._conn()
+        conn.execute('DELETE FROM verdicts WHERE created < ?', ((now or time.time()) - FEEDBACK_VERDICT_TTL,))
+        conn.execute('DELETE FROM verdicts WHERE created < (SELECT created FROM verdicts '
+                     'ORDER BY created DESC LIMIT 1 OFFSET ?)', (self.max_verdicts - 1,))
+
+    def add_feedback(self, trace_id: str, label: str):
+        """Store `label` for a served verdict. Returns the original verdict row, or None if unknown."""
+        conn = self._conn()
+        row = conn.execute('SELECT features, label, model_version, profile, language, model_scope FROM verdicts '
+                           'WHERE trace_id = ?', (trace_id,)).fetchone()
+        if row is None:
+            return None
+        # A relabel gets a new id so the updater sees it as unapplied
+        conn.execute('INSERT OR REPLACE INTO feedback (trace_id, features, label, created, profile, language, '
+                     'model_scope) VALUES (?, ?, ?, ?, ?, ?, ?)', (trace_id, row[0], label, time.time(), *row[3:]))
+        return {'label': row[1], 'model_version': row[2], 'profile': row[3]}
+
+    def labelled_since(self, after_id: int = 0):
+        """(max id, [(features dict, label)]) for trainable feedback rows with id > after_id.
+
+        Fast-profile features and verdicts of language-specific models are left out: they
+        come from different estimators or a different model than the one being updated.
+        """
+        rows = self._conn().execute(f'SELECT id, features, label FROM feedback WHERE id > ? AND {_TRAINABLE} '
+                                    'ORDER BY id', (after_id,)).fetchall()
+        if not rows:
+            return after_id, []
+        return rows[-1][0], [(json.loads(f), label) for _, f, label in rows]
+
+    def pending(self, after_id: int = 0) -> int:
+        (n,) = self._conn().execute(f'SELECT COUNT(*) FROM feedback WHERE id > ? AND {_TRAINABLE}',
+                                    (after_id,)).fetchone()
+        return n
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> FeedbackStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FeedbackStore()
+    return _store
+
+
+def _matrix(rows, keys):
+    # Stage-1 answers carry no pitch features; those rows only train models that do not use them
+    usable = [(f, label) for f, label in rows if all(k in f for k in keys)]
+    X = np.array([[f[k] for k in keys] for f, _ in usable], dtype=np.float32).reshape(-1, len(keys))
+    return X, np.array([label for _, label in usable])
+
+
+def _partial_update(current, rows):
+    full = copy.deepcopy(current.model)
+    X, y = _matrix(rows, FEATURE_KEYS)
+    if len(y):
+        full.partial_fit(X, y, classes=full.classes_)
+    stage1 = current.stage1
+    if stage1 is not None and hasattr(stage1, 'partial_fit'):
+        stage1 = copy.deepcopy(stage1)
+        X1, y1 = _matrix(rows, CHEAP_FEATURE_KEYS)
+        stage1.partial_fit(X1, y1, classes=stage1.classes_)
+    return full, stage1
+
+
+def _refit(current, rows):
+    from scripts.train import make_classifier, CHEAP_IDX
+    # Never retrain on the feedback rows alone: that would replace the model with a tiny-sample one
+    if not os.path.exists(FEEDBACK_BASE_FEATURES):
+        raise FileNotFoundError(f'refit needs the training features at {FEEDBACK_BASE_FEATURES} '
+                                '(written by scripts/train.py)')
+    base = np.load(FEEDBACK_BASE_FEATURES, allow_pickle=False)
+    if list(base['feature_keys']) != FEATURE_KEYS:
+        raise ValueError(f'{FEEDBACK_BASE_FEATURES} was built for different feature keys')
+    X, y = _matrix(rows, FEATURE_KEYS)
+    X1, y1 = _matrix(rows, CHEAP_FEATURE_KEYS)
+    X, y = np.vstack([base['X'], X]), np.concatenate([base['y'], y])
+    X1, y1 = np.vstack([base['X'][:, CHEAP_IDX], X1]), np.concatenate([base['y'], y1])
+    if len(set(y)) < 2:
+        raise ValueError('refit needs labelled examples of both classes')
+    params = current.meta.get('params', {})
+    full = make_classifier(**params).fit(X, y)
+    stage1 = make_classifier(**params).fit(X1, y1) if current.stage1 is not None and len(set(y1)) == 2 else None
+    return full, stage1
+
+
+def run_update(store: FeedbackStore | None = None, min_batch: int = FEEDBACK_MIN_BATCH) -> str | None:
+    """Build and publish a model version that includes the unapplied feedback.
+
+    Partial updates continue training the active model on the new labels only; refits
+    retrain on the base training features plus every label, and refuse to run without
+    them. The artifact is published as its own versioned file next to MODEL_PATH (which
+    is never overwritten), swapped in here and announced to the other workers through
+    the model control file. Returns the new version, or None when there was nothing to do.
+    """
+    store = store or get_store()
+    current = model_module.active_model()
+    applied = int(current.meta.get('feedback_through', 0))
+    if store.pending(applied) < min_batch:
+        return None
+    mode = FEEDBACK_UPDATE_MODE
+    if mode == 'auto':
+        mode = 'partial' if hasattr(current.model, 'partial_fit') else 'refit'
+    if mode == 'partial':
+        through, rows = store.labelled_since(applied)
+        full, stage1 = _partial_update(current, rows)
+    else:
+        through, rows = store.labelled_since(0)
+        full, stage1 = _refit(current, rows)
+
+    base_version = current.version.split('+fb')[0]
+    meta = dict(current.meta, feedback_through=through, feedback_mode=mode, version=f'{base_version}+fb{through}')
+    artifact = {'model': full, 'meta': meta}
+    if stage1 is not None:
+        artifact['stage1'] = stage1
+    path = published_path(meta['version'])
+    tmp = f'{path}.{os.getpid()}.tmp'
+    joblib.dump(artifact, tmp)
+    os.replace(tmp, path)
+    # Loaded and warmed in this background thread; requests switch over with one reference swap
+    if not model_module.load_model_from(path):
+        raise RuntimeError(f'published {path} but could not load it')
+    model_module.write_model_control(model_module.active_model())
+    _prune_published()
+    metrics.inc('model_feedback_updates_total', mode=mode)
+    print(f'Published model {meta["version"]} from {len(rows)} feedback labels ({mode})')
+    return meta['version']
+
+
+def published_path(version: str) -> str:
+    root, ext = os.path.splitext(model_module.MODEL_PATH)
+    return f'{root}.{version}{ext or ".joblib"}'
+
+
+def _prune_published():
+    root, ext = os.path.splitext(model_module.MODEL_PATH)
+    paths = sorted(glob.glob(f'{glob.escape(root)}.*+fb*{ext or ".joblib"}'), key=os.path.getmtime, reverse=True)
+    status = model_module.model_status()
+    # Never delete what this worker serves or would roll back to
+    in_use = {d['path'] for d in (status['active'], status['previous']) if d}
+    for path in paths[FEEDBACK_KEEP_ARTIFACTS:]:
+        if path not in in_use:
+            os.remove(path)
+
+
+def _update_loop(interval):
+    try:
+        import fcntl
+    except ImportError:
+        # Windows dev setups: no flock, so each worker updates on its own (fine for a single worker)
+        fcntl = None
+    lock_path = FEEDBACK_DB + '.lock'
+    while True:
+        time.sleep(interval)
+        try:
+            if fcntl is None:
+                run_update()
+                continue
+            # One worker per host builds each version; the rest pick it up through the model control file
+            with open(lock_path, 'a') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                try:
+                    run_update()
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except Exception as e:
+            metrics.inc('model_feedback_update_failures_total')
+            print(f'Feedback update failed: {e}')
+
+
+_updater = None
+
+
+def start_feedback_updater(interval: float = FEEDBACK_UPDATE_INTERVAL):
+    global _updater
+    if FEEDBACK_UPDATE_MODE == 'off' or interval <= 0 or _updater is not None:
+        return
+    _updater = threading.Thread(target=_update_loop, args=(interval,), name='feedback-updater', daemon=True)
+    _updater.start()
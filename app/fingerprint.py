@@ -0,0 +1,199 @@
+import os
+import time
+import pickle
+import threading
+from collections import OrderedDict, Counter
+import numpy as np
+
+# Spectral-peak fingerprints of scored clips, used to short-circuit replays of the same utterance
+# after re-encoding, trimming or gain changes
+FINGERPRINT_ENABLED = os.getenv('FINGERPRINT_ENABLED', '1') == '1'
+# Fraction of the query's hashes that must line up (same time offset) with a stored clip
+FINGERPRINT_THRESHOLD = float(os.getenv('FINGERPRINT_THRESHOLD', '0.25'))
+FINGERPRINT_MAX_ENTRIES = int(os.getenv('FINGERPRINT_MAX_ENTRIES', '10000'))
+# Memory bound: hashes held by the whole index (each costs roughly 120 bytes of postings, so ~120 MB
+# per worker at the default) and hashes kept per clip (the first ~15 s of speech; longer clips match on those)
+FINGERPRINT_MAX_HASHES = int(os.getenv('FINGERPRINT_MAX_HASHES', '1000000'))
+FINGERPRINT_MAX_CLIP_HASHES = int(os.getenv('FINGERPRINT_MAX_CLIP_HASHES', '2000'))
+# Optional on-disk snapshot, loaded on first use and rewritten at most every FINGERPRINT_SNAPSHOT_INTERVAL seconds
+FINGERPRINT_SNAPSHOT = os.getenv('FINGERPRINT_SNAPSHOT', '')
+FINGERPRINT_SNAPSHOT_INTERVAL = float(os.getenv('FINGERPRINT_SNAPSHOT_INTERVAL', '300'))
+
+# Clips with fewer hashes than this are too short or too quiet to fingerprint reliably
+MIN_HASHES = 20
+# Peak picking: neighbourhood (frequency bins, frames) and peaks kept per frame
+PEAK_NEIGHBORHOOD = (15, 5)
+PEAKS_PER_FRAME = 5
+# Pairing: each anchor peak is paired with up to FAN_OUT later peaks at most MAX_DT frames ahead
+FAN_OUT = 5
+MAX_DT = 31
+MAX_BIN = 512
+# Hashes shared by more stored clips than this carry no information and are skipped at query time
+MAX_POSTING_CLIPS = 100
+
+
+def compute_fingerprint(S_mag: np.ndarray, max_hashes: int = FINGERPRINT_MAX_CLIP_HASHES) -> np.ndarray:
+    """Landmark hashes for a magnitude spectrogram of shape (freq_bins, frames).
+
+    Returns an (n, 2) int64 array of (hash, anchor_frame), at most `max_hashes` of them
+    from the start of the clip. Peaks are chosen relative to their neighbourhood in log
+    magnitude, so a constant gain change yields the same hashes, and anchor frames let
+    a trimmed copy match at a constant offset.
+    """
+    from scipy.ndimage import maximum_filter
+
+    logS = np.log(S_mag[:MAX_BIN] + 1e-6)
+    local_max = (logS == maximum_filter(logS, size=PEAK_NEIGHBORHOOD, mode='constant', cval=-np.inf))
+    # ignore near-silent cells: they are peaks of noise only
+    local_max &= logS > (np.median(logS) + 2.0)
+    peaks = []
+    for t in range(logS.shape[1]):
+        bins = np.flatnonzero(local_max[:, t])
+        if bins.size > PEAKS_PER_FRAME:
+            bins = bins[np.argsort(logS[bins, t])[-PEAKS_PER_FRAME:]]
+        peaks.extend((t, int(f)) for f in bins)
+    peaks.sort()
+    out = []
+    for i, (t1, f1) in enumerate(peaks):
+        if len(out) >= max_hashes:
+            break
+        paired = 0
+        for j in range(i + 1, len(peaks)):
+            t2, f2 = peaks[j]
+            dt = t2 - t1
+            if dt == 0:
+                continue
+            if dt > MAX_DT or paired >= FAN_OUT:
+                break
+            out.append(((f1 >> 1) << 13 | (f2 >> 1) << 5 | dt, t1))
+            paired += 1
+    del out[max_hashes:]
+    if not out:
+        return np.zeros((0, 2), dtype=np.int64)
+    return np.asarray(out, dtype=np.int64)
+
+
+class FingerprintIndex:
+    """Bounded in-memory inverted index from landmark hash to (clip, frame) postings.
+
+    Entries are evicted least-recently-matched first once there are more than
+    `max_entries` clips or `max_hashes` hashes in total; the hash count is what the
+    postings' memory scales with.
+    """
+
+    def __init__(self, max_entries: int = FINGERPRINT_MAX_ENTRIES, snapshot_path: str = FINGERPRINT_SNAPSHOT,
+                 max_hashes: int = FINGERPRINT_MAX_HASHES):
+        self.max_entries = max_entries
+        self.max_hashes = max_hashes
+        self.hashes = 0
+        self.snapshot_path = snapshot_path
+        self._entries = OrderedDict()   # clip_id -> (fingerprint, verdict)
+        self._postings = {}             # hash -> {clip_id: [anchor frames]}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load(snapshot_path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def query(self, fp: np.ndarray):
+        """Return (verdict, similarity) of the best stored match above the threshold, else None."""
+        if len(fp) < MIN_HASHES:
+            return None
+        votes = Counter()
+        with self._lock:
+            for h, t in fp:
+                posting = self._postings.get(int(h))
+                if not posting or len(posting) > MAX_POSTING_CLIPS:
+                    continue
+                for clip_id, times in posting.items():
+                    for t_db in times:
+                        votes[(clip_id, t_db - int(t))] += 1
+            if not votes:
+                return None
+            # A trim that is not a whole number of hops shifts peaks by up to one frame,
+            # so score each offset together with its two neighbours
+            best, clip_id = 0, None
+            for (cid, offset), count in votes.items():
+                total = count + votes.get((cid, offset - 1), 0) + votes.get((cid, offset + 1), 0)
+                if total > best:
+                    best, clip_id = total, cid
+            similarity = min(1.0, best / len(fp))
+            if similarity < FINGERPRINT_THRESHOLD:
+                return None
+            self._entries.move_to_end(clip_id)
+            return self._entries[clip_id][1], similarity
+
+    def add(self, fp: np.ndarray, verdict: dict):
+        if len(fp) < MIN_HASHES:
+            return
+        with self._lock:
+            clip_id = self._next_id
+            self._next_id += 1
+            self._insert(clip_id, fp, verdict)
+            self._shrink()
+        if self.snapshot_path and time.monotonic() - self._last_save > FINGERPRINT_SNAPSHOT_INTERVAL:
+            self._last_save = time.monotonic()
+            threading.Thread(target=self.save, args=(self.snapshot_path,), daemon=True).start()
+
+    def _insert(self, clip_id, fp, verdict):
+        self._entries[clip_id] = (fp, verdict)
+        self.hashes += len(fp)
+        for h, t in fp:
+            self._postings.setdefault(int(h), {}).setdefault(clip_id, []).append(int(t))
+
+    def _shrink(self):
+        # Never evicts the newest entry, so one clip over the hash budget is still kept
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.hashes > self.max_hashes):
+            self._evict()
+
+    def _evict(self):
+        clip_id, (fp, _) = self._entries.popitem(last=False)
+        self.hashes -= len(fp)
+        for h in np.unique(fp[:, 0]):
+            posting = self._postings.get(int(h))
+            if posting is not None:
+                posting.pop(clip_id, None)
+                if not posting:
+                    del self._postings[int(h)]
+
+    def save(self, path: str):
+        with self._lock:
+            entries = list(self._entries.values())
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def load(self, path: str):
+        try:
+            with open(path, 'rb') as f:
+                entries = pickle.load(f)
+        except Exception as e:
+            print(f'Ignoring unreadable fingerprint snapshot {path}: {e}')
+            return
+        with self._lock:
+            for fp, verdict in entries[-self.max_entries:]:
+                self._insert(self._next_id, fp, verdict)
+                self._next_id += 1
+            self._shrink()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> FingerprintIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FingerprintIndex()
+    return _index
+
+
+def save_snapshot():
+    if _index is not None and _index.snapshot_path:
+        _index.save(_index.snapshot_path)
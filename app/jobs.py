@@ -0,0 +1,394 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from starlette.concurrency import run_in_threadpool
+from app import metrics
+from app.utils import bytes_to_wav_np, AudioTooLongError
+from app.engine import run_analysis
+from app.threads import run_cpu_bound
+from app.sketches import observe_result
+
+# Queued audio and finished results, shared by every worker on the host and kept across restarts
+# (so it must live on persistent storage, not in /tmp)
+JOBS_DB = os.getenv('JOBS_DB', 'app/artifacts/jobs.sqlite3')
+# Jobs processed at once per uvicorn worker (each one occupies a threadpool slot or pool process)
+JOB_CONCURRENCY = int(os.getenv('JOB_CONCURRENCY', '1'))
+# POST /api/jobs answers 503 once this many jobs are waiting
+JOB_MAX_QUEUED = int(os.getenv('JOB_MAX_QUEUED', '1000'))
+# Finished and failed jobs (and their results) are deleted this long after they finish
+JOB_RESULT_RETENTION = float(os.getenv('JOB_RESULT_RETENTION', str(24 * 3600)))
+# A running job whose worker died is requeued after this long
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '300'))
+# A job that has been claimed this many times without finishing is failed instead of requeued
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# Jobs are for long recordings, so they get their own duration cap instead of MAX_AUDIO_SECONDS
+JOB_MAX_AUDIO_SECONDS = float(os.getenv('JOB_MAX_AUDIO_SECONDS', '1800'))
+# Longest GET /api/jobs/{id}?wait= long-poll
+JOB_MAX_WAIT = float(os.getenv('JOB_MAX_WAIT', '30'))
+# Idle workers and long-polls re-check the table this often for work/results from other workers
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+
+TERMINAL_STATES = ('done', 'failed')
+_PRUNE_EVERY = 60.0
+_COLUMNS = 'id, state, priority, language, profile, key_id, created, started, finished, attempts, result, error'
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _boot_id() -> str:
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+
+_BOOT_ID = _boot_id()
+_HAVE_PROC = os.path.exists('/proc/self/stat')
+
+
+def process_token(pid: int) -> str | None:
+    """'<boot id>:<pid>:<start time>' of a running process, or None if there is none with that pid.
+
+    Unlike a bare pid, the token of a process that died is never the token of a later process
+    that got the same pid (after a container restart pids start over). Without /proc the start
+    time is unknown and only the pid's existence is checked.
+    """
+    if not _HAVE_PROC:
+        # On Windows os.kill(pid, 0) would terminate the process, so owners are assumed alive (lease expiry)
+        if os.name != 'nt':
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return None
+            except OSError:
+                pass
+        return f'{_BOOT_ID}:{pid}:'
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Field 22 is the start time in clock ticks since boot; the command name before it may contain spaces
+    return f'{_BOOT_ID}:{pid}:{stat[stat.rindex(b")") + 2:].split()[19].decode()}'
+
+
+_owner = (None, None)
+
+
+def owner_token() -> str:
+    """This process's token, recomputed after a fork."""
+    global _owner
+    pid = os.getpid()
+    if _owner[0] != pid:
+        _owner = (pid, process_token(pid) or f'{_BOOT_ID}:{pid}:')
+    return _owner[1]
+
+
+class JobStore:
+    """SQLite job table; claiming is one IMMEDIATE transaction so workers never take the same job."""
+
+    def __init__(self, path: str = JOBS_DB):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._conn()
+        conn.execute('CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, state TEXT, priority INTEGER, '
+                     'language TEXT, profile TEXT, key_id TEXT, audio BLOB, created REAL, started REAL, '
+                     'finished REAL, lease_until REAL, owner_pid INTEGER, attempts INTEGER DEFAULT 0, '
+                     'result TEXT, error TEXT)')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (state, priority DESC, created)')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)')
+        # Owner identity that survives pid reuse (see process_token); older tables get the column added
+        if 'owner_token' not in {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}:
+            conn.execute('ALTER TABLE jobs ADD COLUMN owner_token TEXT')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def submit(self, audio: bytes, language: str, profile: str, priority: int, key_id: str,
+               max_queued: int = JOB_MAX_QUEUED) -> str:
+        job_id = uuid.uuid4().hex
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            (queued,) = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()
+            if queued >= max_queued:
+                raise QueueFull(f'{queued} jobs already queued')
+            conn.execute("INSERT INTO jobs (id, state, priority, language, profile, key_id, audio, created) "
+                         "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                         (job_id, priority, language, profile, key_id, sqlite3.Binary(audio), time.time()))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return job_id
+
+    def claim(self, lease: float = JOB_LEASE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS):
+        """Take the highest-priority queued job (oldest first). Returns (job dict, audio bytes) or None."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Expired leases belong to workers that died mid-job
+            conn.execute("UPDATE jobs SET state = 'failed', error = ?, finished = ?, audio = NULL "
+                         "WHERE state = 'running' AND lease_until < ? AND attempts >= ?",
+                         (f'Abandoned after {max_attempts} attempts', now, now, max_attempts))
+            conn.execute("UPDATE jobs SET state = 'queued' WHERE state = 'running' AND lease_until < ?", (now,))
+            row = conn.execute(f"SELECT {_COLUMNS}, audio FROM jobs WHERE state = 'queued' "
+                               'ORDER BY priority DESC, created LIMIT 1').fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET state = 'running', started = ?, lease_until = ?, owner_pid = ?, "
+                             'owner_token = ?, attempts = attempts + 1 WHERE id = ?',
+                             (now, now + lease, os.getpid(), owner_token(), row[0]))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        job = _job_dict(row[:-1])
+        job.update(state='running', startedAt=now, attempts=job['attempts'] + 1)
+        return job, bytes(row[-1])
+
+    def heartbeat(self, job_id: str, lease: float = JOB_LEASE_SECONDS) -> bool:
+        """Extend this process's lease on a running job. False once the job was taken away."""
+        cur = self._conn().execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND state = 'running' "
+                                   'AND owner_token = ?', (time.time() + lease, job_id, owner_token()))
+        return cur.rowcount > 0
+
+    def finish(self, job_id: str, result: dict | None = None, error: str | None = None) -> bool:
+        """Store the outcome, unless the job now belongs to another process (lease expired and reclaimed)."""
+        cur = self._conn().execute('UPDATE jobs SET state = ?, result = ?, error = ?, finished = ?, audio = NULL, '
+                                   "lease_until = NULL WHERE id = ? AND state = 'running' AND owner_token = ?",
+                                   ('failed' if error else 'done', json.dumps(result) if result is not None else None,
+                                    error, time.time(), job_id, owner_token()))
+        if cur.rowcount == 0:
+            metrics.inc('jobs_lease_lost_total')
+            return False
+        return True
+
+    def requeue_owned(self, owner: str | None = None):
+        """Put jobs claimed by this process (or `owner` token) back in the queue on graceful shutdown.
+
+        The claim is not counted against the job's attempts.
+        """
+        self._conn().execute("UPDATE jobs SET state = 'queued', attempts = MAX(attempts - 1, 0), lease_until = NULL "
+                             "WHERE state = 'running' AND owner_token = ?", (owner or owner_token(),))
+
+    def reclaim_dead(self, owner: str, max_attempts: int = JOB_MAX_ATTEMPTS):
+        """Requeue jobs of the crashed process with token `owner`, keeping the attempt; jobs out of attempts fail."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # A job that crashes its worker every time must not be handed to the next one forever
+            conn.execute("UPDATE jobs SET state = 'failed', error = ?, finished = ?, audio = NULL, lease_until = NULL "
+                         "WHERE state = 'running' AND owner_token = ? AND attempts >= ?",
+                         (f'Abandoned after {max_attempts} attempts', now, owner, max_attempts))
+            conn.execute("UPDATE jobs SET state = 'queued', lease_until = NULL "
+                         "WHERE state = 'running' AND owner_token = ?", (owner,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def recover(self, max_attempts: int = JOB_MAX_ATTEMPTS):
+        """Requeue running jobs whose owner process no longer exists, without waiting for their lease.
+
+        Jobs claimed before owner tokens existed have none and are left to their lease.
+        """
+        owners = self._conn().execute("SELECT DISTINCT owner_pid, owner_token FROM jobs "
+                                      "WHERE state = 'running' AND owner_token IS NOT NULL").fetchall()
+        for pid, owner in owners:
+            if owner != owner_token() and process_token(pid) != owner:
+                self.reclaim_dead(owner, max_attempts)
+
+    def get(self, job_id: str) -> dict | None:
+        row = self._conn().execute(f'SELECT {_COLUMNS} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return None if row is None else _job_dict(row)
+
+    def position(self, job: dict) -> int:
+        """Queued jobs that will run before `job`."""
+        (n,) = self._conn().execute(
+            "SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND (priority > ? OR (priority = ? AND created < ?))",
+            (job['priority'], job['priority'], job['createdAt'])).fetchone()
+        return n
+
+    def prune(self, retention: float = JOB_RESULT_RETENTION) -> int:
+        cur = self._conn().execute('DELETE FROM jobs WHERE finished < ?', (time.time() - retention,))
+        return cur.rowcount
+
+    def counts(self) -> dict:
+        return dict(self._conn().execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall())
+
+
+def _job_dict(row) -> dict:
+    job_id, state, priority, language, profile, key_id, created, started, finished, attempts, result, error = row
+    job = {'jobId': job_id, 'state': state, 'priority': priority, 'language': language, 'profile': profile,
+           'keyId': key_id, 'createdAt': created, 'startedAt': started, 'finishedAt': finished,
+           'attempts': attempts}
+    if result is not None:
+        job['result'] = json.loads(result)
+    if error is not None:
+        job['error'] = error
+    return job
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = JobStore()
+    return _store
+
+
+# ---- in-process wakeups (other workers' changes are seen by polling every JOB_POLL_INTERVAL) ----
+
+class _Wakeup:
+    # Wakes every waiter at once; waiters re-check the table, so a missed wakeup only costs one poll interval
+    def __init__(self):
+        self._event = None
+
+    def signal(self):
+        event, self._event = self._event, asyncio.Event()
+        if event is not None:
+            event.set()
+
+    async def wait(self, timeout: float):
+        if self._event is None:
+            self._event = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+_submitted = _Wakeup()
+_finished = _Wakeup()
+
+
+def notify_submitted():
+    _submitted.signal()
+
+
+async def wait_for_job(job_id: str, timeout: float) -> dict | None:
+    """Job state, waiting up to `timeout` seconds for it to finish (long-poll)."""
+    store = get_job_store()
+    deadline = time.monotonic() + max(0.0, min(timeout, JOB_MAX_WAIT))
+    while True:
+        job = await run_in_threadpool(store.get, job_id)
+        remaining = deadline - time.monotonic()
+        if job is None or job['state'] in TERMINAL_STATES or remaining <= 0:
+            return job
+        await _finished.wait(min(remaining, JOB_POLL_INTERVAL))
+
+
+# ---- worker ----
+
+async def _heartbeat(store: JobStore, job_id: str, lease: float = JOB_LEASE_SECONDS):
+    # Renews the lease at a third of its length so a slow job is never requeued while it is still running
+    while True:
+        await asyncio.sleep(lease / 3)
+        try:
+            if not await run_in_threadpool(store.heartbeat, job_id, lease):
+                print(f'Lost the lease on job {job_id}')
+                return
+        except sqlite3.Error as e:
+            print(f'Job heartbeat failed: {e}')
+
+
+async def process_job(store: JobStore, job: dict, audio: bytes):
+    try:
+        y, sr = await run_cpu_bound(bytes_to_wav_np, audio, JOB_MAX_AUDIO_SECONDS)
+    except (AudioTooLongError, ValueError) as e:
+        return await run_in_threadpool(store.finish, job['jobId'], None, str(e))
+    except Exception:
+        return await run_in_threadpool(store.finish, job['jobId'], None, 'Unable to decode audio')
+    try:
+        # Job recordings can be far longer than MAX_AUDIO_SECONDS; keep them out of the arenas and fingerprint index
+        result = await run_analysis(y, sr, job['language'], job['profile'], scratch=False)
+    except Exception:
+        return await run_in_threadpool(store.finish, job['jobId'], None, 'Model inference failed')
+    observe_result(job['language'], result['meta']['profile'], result)
+    await run_in_threadpool(store.finish, job['jobId'], {
+        'status': 'success',
+        'language': job['language'],
+        'classification': result['label'],
+        'confidenceScore': round(result['confidence'], 4),
+        'explanation': result['explanation'],
+        'modelVersion': result['meta']['model_version'],
+        'profile': result['meta']['profile'],
+    })
+
+
+async def _worker_loop():
+    store = get_job_store()
+    last_prune = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_prune > _PRUNE_EVERY:
+                last_prune = time.monotonic()
+                pruned = await run_in_threadpool(store.prune)
+                if pruned:
+                    metrics.inc('jobs_pruned_total', pruned)
+                counts = await run_in_threadpool(store.counts)
+                for state in ('queued', 'running') + TERMINAL_STATES:
+                    metrics.set_gauge('jobs', counts.get(state, 0), state=state)
+            claimed = await run_in_threadpool(store.claim)
+            if claimed is None:
+                await _submitted.wait(JOB_POLL_INTERVAL)
+                continue
+            job, audio = claimed
+            started = time.perf_counter()
+            heartbeat = asyncio.create_task(_heartbeat(store, job['jobId']))
+            try:
+                await process_job(store, job, audio)
+            finally:
+                heartbeat.cancel()
+            metrics.inc('jobs_processed_total')
+            metrics.set_gauge('job_last_duration_ms', round((time.perf_counter() - started) * 1000.0, 1))
+            _finished.signal()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f'Job worker error: {e}')
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+_workers = []
+
+
+def start_job_workers(concurrency: int = JOB_CONCURRENCY):
+    """Start this worker's job tasks on the running event loop, after requeueing orphaned jobs."""
+    if _workers or concurrency <= 0:
+        return
+    get_job_store().recover()
+    for _ in range(concurrency):
+        _workers.append(asyncio.get_running_loop().create_task(_worker_loop()))
+
+
+async def stop_job_workers():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    # Whatever this process was still working on goes back to the queue for the next worker
+    get_job_store().requeue_owned()
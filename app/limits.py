@@ -0,0 +1,68 @@
+import os
+import json
+from fastapi import HTTPException
+
+# Largest request body accepted on any HTTP route. A base64 body is ~4/3 of the audio, and the
+# string, the decoded bytes and the PCM all coexist while a request is handled
+MAX_BODY_BYTES = int(os.getenv('MAX_BODY_BYTES', str(16 * 1024 * 1024)))
+# POST /api/jobs exists for long recordings, so it gets its own, larger limit
+MAX_JOB_BODY_BYTES = int(os.getenv('MAX_JOB_BODY_BYTES', str(64 * 1024 * 1024)))
+
+
+def _too_large_message(limit: int) -> str:
+    return f'Request body exceeds the {limit} byte limit'
+
+
+class BodySizeLimitMiddleware:
+    """ASGI middleware that rejects oversized HTTP bodies with 413 before they are buffered.
+
+    A declared Content-Length over the limit is refused without reading the body. Chunked
+    bodies are counted as they arrive and the request is aborted once the running total
+    passes the limit, so at most `max_bytes` of it is ever held in memory.
+    """
+
+    def __init__(self, app, max_bytes: int | None = None, path_limits: dict | None = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        limit = self.path_limits.get(scope['path'])
+        if limit is None:
+            limit = self.max_bytes if self.max_bytes is not None else MAX_BODY_BYTES
+        for name, value in scope.get('headers') or []:
+            if name == b'content-length':
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > limit:
+                    await _send_413(send, limit)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    # Raised inside FastAPI's body read, so the app's HTTPException handler answers
+                    raise HTTPException(status_code=413, detail=_too_large_message(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def _send_413(send, limit: int):
+    body = json.dumps({'status': 'error', 'message': _too_large_message(limit)}).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': 413,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode('latin-1')),
+                            (b'connection', b'close')]})
+    await send({'type': 'http.response.body', 'body': body})
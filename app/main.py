@@ -1,20 +1,80 @@
 import os
 import base64
+import asyncio
 from fastapi import FastAPI, Request, Header, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
-from app.schemas import VoiceRequest, SuccessResponse, ErrorResponse
-from app.auth import validate_api_key
-from app.utils import b64_to_wav_np
-from app.features import extract_features
-from app.model import predict, explain
+from app.schemas import VoiceRequest, SuccessResponse, ErrorResponse, FeedbackRequest, JobRequest, Language
+from app.auth import validate_api_key, load_key_registry, require_admin, require_labeller
+from app.ratelimit import get_limiter
+from app.tracing import TraceMiddleware, current_trace
+from app.limits import BodySizeLimitMiddleware, MAX_JOB_BODY_BYTES
+from app.utils import (b64_to_wav_np, bytes_to_wav_np, decode_base64_audio, AudioBuffer, AudioTooLongError,
+                       MAX_AUDIO_SECONDS)
+from app.model import (start_model_watcher, reload_model, rollback_model, model_status, write_model_control,
+                       active_model, load_fast_model)
+from app import metrics
+from app.engine import get_engine, run_analysis, shutdown_engine
+from app.fingerprint import save_snapshot
+from app.feedback import get_store, start_feedback_updater
+from app.profiles import get_governor, PROFILE_HEADER
+from app.features import PROFILES
+from app.profiler import sample_stacks, ProfilerBusy, PROFILE_MAX_SECONDS, PROFILE_MAX_HZ
+from app.sketches import observe_result, merged_stats, write_snapshot, start_snapshot_writer
+from app.jobs import (get_job_store, start_job_workers, stop_job_workers, notify_submitted, wait_for_job,
+                      QueueFull)
+from app.threads import apply_native_limits, configure_executor, run_cpu_bound, diagnostics as thread_diagnostics
 from starlette.concurrency import run_in_threadpool
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from pathlib import Path
+from typing import get_args
 
 load_dotenv()
 
+# Per-session limits for the streaming endpoint
+WS_MAX_SESSION_BYTES = int(os.getenv('WS_MAX_SESSION_BYTES', str(25 * 1024 * 1024)))
+WS_INITIAL_BUFFER_BYTES = int(os.getenv('WS_INITIAL_BUFFER_BYTES', str(256 * 1024)))
+
+LANGUAGES = frozenset(get_args(Language))
+
 app = FastAPI(title='AI Voice Detection')
+# Body limit sits inside tracing so rejected uploads still carry a trace id
+app.add_middleware(BodySizeLimitMiddleware, path_limits={'/api/jobs': MAX_JOB_BODY_BYTES})
+app.add_middleware(TraceMiddleware, paths=('/api/voice-detection', '/ws/voice', '/api/feedback', '/api/jobs'))
+
+
+@app.on_event('startup')
+async def startup():
+    # Split the host's cores between workers, threadpool slots and BLAS/numba pools before any work runs
+    apply_native_limits()
+    configure_executor()
+    # Load the key registry and open the shared limiter state once per worker
+    load_key_registry()
+    get_limiter()
+    # Warm the fast-profile model now rather than on the first fast request
+    load_fast_model()
+    # Pick up new model artifacts (and admin reload/rollback from other workers) in the background
+    start_model_watcher()
+    # Start the CPU worker pool up front when INFERENCE_MODE=pool
+    get_engine()
+    # Fold analyst feedback into new model versions in the background
+    get_store()
+    start_feedback_updater()
+    # Periodically write this worker's feature/confidence sketches for GET /admin/feature-stats
+    start_snapshot_writer()
+    # Work through queued /api/jobs submissions, including any a previous process left unfinished
+    start_job_workers()
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    await stop_job_workers()
+    shutdown_engine()
+    save_snapshot()
+    try:
+        write_snapshot()
+    except Exception as e:
+        print(f'Unable to write feature sketch snapshot: {e}')
 
 
 @app.get('/health')
@@ -22,52 +82,194 @@ async def health():
     return {'status': 'ok'}
 
 
+@app.get('/metrics')
+async def metrics_endpoint():
+    return metrics.snapshot()
+
+
+@app.get('/admin/model')
+async def admin_model_status(x_api_key: str | None = Header(None)):
+    require_admin(x_api_key)
+    return await run_in_threadpool(model_status)
+
+
+@app.post('/admin/model/reload')
+async def admin_model_reload(x_api_key: str | None = Header(None)):
+    require_admin(x_api_key)
+    # Load and warm in a worker thread; requests keep using the current model until the swap
+    await run_in_threadpool(reload_model, True)
+    write_model_control(active_model())
+    return model_status()
+
+
+@app.post('/admin/model/rollback')
+async def admin_model_rollback(x_api_key: str | None = Header(None)):
+    require_admin(x_api_key)
+    if not rollback_model():
+        raise HTTPException(status_code=409, detail='No previous model version in memory')
+    write_model_control(active_model())
+    return model_status()
+
+
+@app.get('/admin/threads')
+async def admin_threads(x_api_key: str | None = Header(None)):
+    require_admin(x_api_key)
+    return await run_in_threadpool(thread_diagnostics)
+
+
+@app.get('/admin/feature-stats')
+async def admin_feature_stats(x_api_key: str | None = Header(None)):
+    # Feature and confidence distributions by language/profile, merged across this host's workers
+    require_admin(x_api_key)
+    return await run_in_threadpool(merged_stats)
+
+
+@app.get('/admin/profile')
+async def admin_profile(seconds: float = 10.0, hz: float = 100.0, format: str = 'json',
+                        x_api_key: str | None = Header(None)):
+    # Sample this worker's thread stacks; the sampler runs in a threadpool thread and excludes itself
+    require_admin(x_api_key)
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or not 0 < hz <= PROFILE_MAX_HZ:
+        raise HTTPException(status_code=400,
+                            detail=f'seconds must be in (0, {PROFILE_MAX_SECONDS:g}] and hz in (0, {PROFILE_MAX_HZ:g}]')
+    try:
+        result = await run_in_threadpool(sample_stacks, seconds, hz)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    result['pid'] = os.getpid()
+    if format == 'collapsed':
+        return PlainTextResponse(result['collapsed'] + '\n', headers={'x-worker-pid': str(result['pid'])})
+    return result
+
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    return JSONResponse(status_code=exc.status_code, content={'status': 'error', 'message': exc.detail})
+    return JSONResponse(status_code=exc.status_code, content={'status': 'error', 'message': exc.detail},
+                        headers=getattr(exc, 'headers', None))
 
 
-@app.post('/api/voice-detection', response_model=SuccessResponse)
-async def voice_detection(req: VoiceRequest, request: Request, x_api_key: str | None = Header(None)):
-    # Validate API key
+def _store_verdict(trace_id: str, result: dict, language: str | None):
     try:
-        validate_api_key(x_api_key)
-    except HTTPException as e:
-        raise e
+        meta = result['meta']
+        get_store().record_verdict(trace_id, result['features'], result['label'], meta['model_version'],
+                                   meta['profile'], language, meta['model_scope'])
+    except Exception as e:
+        print(f'Unable to record verdict for feedback: {e}')
+
+
+async def _record_verdict(result: dict, language: str | None):
+    # Keep the computed features under the trace id so POST /api/feedback can label them later.
+    # The sqlite write (busy timeout up to 5 s) runs in the threadpool, never on the event loop
+    trace = current_trace()
+    if trace is None:
+        return
+    await run_in_threadpool(_store_verdict, trace.trace_id, result, language)
+
+
+@app.post('/api/feedback')
+async def feedback(req: FeedbackRequest, x_api_key: str | None = Header(None)):
+    # Label a served verdict by its x-trace-id; no audio is needed, the stored features are reused.
+    # Labels retrain the model every tenant is served by, so only admin/labeller keys may post them
+    policy = require_labeller(x_api_key)
+    async with get_limiter().admit(policy):
+        verdict = await run_in_threadpool(get_store().add_feedback, req.traceId, req.label)
+    if verdict is None:
+        raise HTTPException(status_code=404, detail='Unknown or expired traceId')
+    metrics.inc('feedback_total', label=req.label, agreed=str(verdict['label'] == req.label).lower())
+    return {'status': 'success', 'traceId': req.traceId, 'label': req.label,
+            'servedLabel': verdict['label'], 'servedModelVersion': verdict['model_version']}
+
+
+@app.post('/api/voice-detection', response_model=SuccessResponse)
+async def voice_detection(req: VoiceRequest, request: Request, x_api_key: str | None = Header(None),
+                          x_processing_profile: str | None = Header(None)):
+    # Validate API key and enforce its rate limit / concurrency cap before any decoding
+    policy = validate_api_key(x_api_key)
+    if x_processing_profile not in (None, 'auto', *PROFILES):
+        raise HTTPException(status_code=400, detail=f'Unknown processing profile; use one of auto, {", ".join(PROFILES)}')
+    async with get_limiter().admit(policy):
+        return await _voice_detection(req, x_processing_profile)
+
 
+async def _voice_detection(req: VoiceRequest, requested_profile: str | None = None):
     # Validate language and format already done by pydantic
     # Decode audio
     try:
-        y, sr = b64_to_wav_np(req.audioBase64)
+        y, sr = await run_cpu_bound(b64_to_wav_np, req.audioBase64)
+    except AudioTooLongError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception:
         raise HTTPException(status_code=400, detail='Unable to decode audio')
 
-    # Extract features
-    feature_vec, features = extract_features(y, sr)
-
-    # Run model
+    # Extract features, run model and explain in one hop (threadpool or CPU worker pool);
+    # unpinned requests drop to the fast profile while this worker is overloaded
+    governor = get_governor()
+    profile, _ = governor.choose(requested_profile)
     try:
-        label, confidence, meta = predict(feature_vec)
+        with governor.track(profile):
+            result = await run_analysis(y, sr, req.language, profile)
     except Exception as e:
         raise HTTPException(status_code=500, detail='Model inference failed')
-
-    explanation = explain(features, label)
+    # 'fast' is served with the accurate profile when there is no fast model
+    profile = result['meta']['profile']
+    await _record_verdict(result, req.language)
+    observe_result(req.language, profile, result)
 
     return JSONResponse(status_code=200, content={
         'status': 'success',
         'language': req.language,
-        'classification': label,
-        'confidenceScore': round(confidence, 4),
-        'explanation': explanation
-    })
+        'classification': result['label'],
+        'confidenceScore': round(result['confidence'], 4),
+        'explanation': result['explanation']
+    }, headers={'x-model-version': result['meta']['model_version'],
+                'x-fingerprint-match': 'true' if result['meta'].get('fingerprint_match') else 'false',
+                PROFILE_HEADER: profile})
+
 
 
+@app.post('/api/jobs', status_code=202)
+async def submit_job(req: JobRequest, x_api_key: str | None = Header(None),
+                     x_processing_profile: str | None = Header(None)):
+    # Queue the clip and answer at once; the result is fetched from GET /api/jobs/{jobId}
+    policy = validate_api_key(x_api_key)
+    if x_processing_profile not in (None, 'auto', *PROFILES):
+        raise HTTPException(status_code=400, detail=f'Unknown processing profile; use one of auto, {", ".join(PROFILES)}')
+    # Jobs are background work: 'auto' means accurate, there is no load-based downgrade
+    profile = x_processing_profile if x_processing_profile in PROFILES else 'accurate'
+    async with get_limiter().admit(policy):
+        try:
+            audio = await run_in_threadpool(decode_base64_audio, req.audioBase64)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        store = get_job_store()
+        try:
+            job_id = await run_in_threadpool(store.submit, audio, req.language, profile, req.priority, policy.key_id)
+        except QueueFull:
+            raise HTTPException(status_code=503, detail='Job queue is full', headers={'Retry-After': '30'})
+    notify_submitted()
+    metrics.inc('jobs_submitted_total', priority=req.priority)
+    return JSONResponse(status_code=202, content={'status': 'success', 'jobId': job_id, 'state': 'queued'},
+                        headers={'Location': f'/api/jobs/{job_id}'})
+
+
+@app.get('/api/jobs/{job_id}')
+async def get_job(job_id: str, wait: float = 0, x_api_key: str | None = Header(None)):
+    # ?wait=N long-polls up to N seconds (capped by JOB_MAX_WAIT) for the job to finish
+    policy = validate_api_key(x_api_key)
+    job = await wait_for_job(job_id, wait)
+    # Jobs are private to the key that submitted them
+    if job is None or job.pop('keyId') != policy.key_id:
+        raise HTTPException(status_code=404, detail='Unknown or expired jobId')
+    if job['state'] == 'queued':
+        job['position'] = await run_in_threadpool(get_job_store().position, job)
+    return {'status': 'success', **job}
+
 
 @app.websocket('/ws/voice')
 async def ws_voice(websocket: WebSocket):
-    # WebSocket endpoint to receive base64-encoded audio chunks and return classification
+    # WebSocket endpoint to receive audio chunks (binary frames, or base64 text frames) and return classification
     await websocket.accept()
     # Expect API key as query param: ws://.../ws/voice?x_api_key=KEY
     x_api_key = websocket.query_params.get('x_api_key')
@@ -77,62 +279,91 @@ async def ws_voice(websocket: WebSocket):
         return
 
     try:
-        validate_api_key(x_api_key)
+        policy = validate_api_key(x_api_key)
+        lease_id = await run_in_threadpool(get_limiter().acquire, policy)
     except HTTPException as e:
         await websocket.send_json({'status': 'error', 'message': e.detail})
-        await websocket.close()
+        await websocket.close(code=1013 if e.status_code in (429, 503) else 1000)
         return
+    # A session can stay open longer than LEASE_TTL_SECONDS; keep its concurrency lease from being reclaimed
+    keep_alive = asyncio.create_task(get_limiter().keep_alive(lease_id))
 
-    chunks = []
+    # Optional ?language=...; unknown values fall back to the global model
+    language = websocket.query_params.get('language')
+    if language not in LANGUAGES:
+        language = None
+    # Optional ?profile=fast|accurate; anything else lets the server choose
+    requested_profile = websocket.query_params.get('profile')
+    buffer = AudioBuffer(WS_INITIAL_BUFFER_BYTES, max_size=WS_MAX_SESSION_BYTES)
     try:
         while True:
-            msg = await websocket.receive_text()
-            if msg == 'END':
-                break
-            if msg == 'CANCEL':
-                chunks = []
-                await websocket.send_text('CANCELLED')
-                continue
-            # Accept base64 chunk
+            msg = await websocket.receive()
+            if msg['type'] == 'websocket.disconnect':
+                raise WebSocketDisconnect(msg.get('code', 1000))
+            data = msg.get('bytes')
+            if data is None:
+                text = msg.get('text')
+                if text == 'END':
+                    break
+                if text == 'CANCEL':
+                    buffer.clear()
+                    await websocket.send_text('CANCELLED')
+                    continue
+                # Accept base64 chunk (text frames are kept for older clients)
+                try:
+                    data = base64.b64decode(text)
+                except Exception:
+                    await websocket.send_json({'status': 'error', 'message': 'Invalid base64 chunk'})
+                    continue
             try:
-                b = base64.b64decode(msg)
-                chunks.append(b)
-            except Exception:
-                await websocket.send_json({'status': 'error', 'message': 'Invalid base64 chunk'})
-
-        # Combine all received bytes
-        mp3_bytes = b''.join(chunks)
+                buffer.append(data)
+            except BufferError as e:
+                await websocket.send_json({'status': 'error', 'message': str(e)})
+                await websocket.close(code=1009)
+                return
 
         # Convert and load wav in threadpool to avoid blocking
         try:
-            # re-use existing base64-driven helper (it will run ffmpeg if necessary)
-            combined_b64 = base64.b64encode(mp3_bytes).decode('ascii')
-            y, sr = await run_in_threadpool(b64_to_wav_np, combined_b64)
+            y, sr = await run_cpu_bound(bytes_to_wav_np, buffer.view(), MAX_AUDIO_SECONDS)
+        except AudioTooLongError as e:
+            await websocket.send_json({'status': 'error', 'message': str(e)})
+            await websocket.close(code=1009)
+            return
         except Exception as e:
             await websocket.send_json({'status': 'error', 'message': 'Unable to decode audio: ' + str(e)})
             await websocket.close()
             return
 
-        # Feature extraction + model inference in threadpool
+        # Feature extraction + model inference in threadpool (or the CPU worker pool)
+        governor = get_governor()
+        profile, _ = governor.choose(requested_profile)
         try:
-            feature_vec, features = await run_in_threadpool(extract_features, y, sr)
-            label, confidence, meta = await run_in_threadpool(predict, feature_vec)
-            explanation = await run_in_threadpool(explain, features, label)
+            with governor.track(profile):
+                result = await run_analysis(y, sr, language, profile)
         except Exception as e:
             await websocket.send_json({'status': 'error', 'message': 'Model inference failed: ' + str(e)})
             await websocket.close()
             return
+        profile = result['meta']['profile']
+        await _record_verdict(result, language)
+        observe_result(language, profile, result)
 
         await websocket.send_json({
             'status': 'success',
-            'classification': label,
-            'confidenceScore': round(confidence, 4),
-            'explanation': explanation
+            'classification': result['label'],
+            'confidenceScore': round(result['confidence'], 4),
+            'explanation': result['explanation'],
+            'modelVersion': result['meta']['model_version'],
+            'fingerprintMatch': bool(result['meta'].get('fingerprint_match')),
+            'profile': profile,
+            'traceId': current_trace().trace_id
         })
 
     except WebSocketDisconnect:
         return
     finally:
+        keep_alive.cancel()
+        await run_in_threadpool(get_limiter().release, lease_id)
         try:
             await websocket.close()
         except Exception:
@@ -0,0 +1,34 @@
+import threading
+
+# Per-worker counters and gauges, exposed as JSON by GET /metrics
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0) + value
+
+
+def set_gauge(name: str, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def _render(store):
+    out = {}
+    for (name, labels), value in store.items():
+        label_str = ','.join(f'{k}={v}' for k, v in labels)
+        out.setdefault(name, {})[label_str] = value
+    return out
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {'counters': _render(_counters), 'gauges': _render(_gauges)}
@@ -1,15 +1,89 @@
 import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import Tuple
 import joblib
 import numpy as np
+from app import metrics
+from app.tracing import annotate, span
+from app import fingerprint
+from app.threads import limit_estimator
+from app.features import FEATURE_KEYS, CHEAP_FEATURE_KEYS, extract_cheap_features, add_pitch_features, feature_vector
 
 MODEL_PATH = os.getenv('MODEL_PATH', 'app/artifacts/model.joblib')
+# Model for the 'fast' processing profile; it must be trained on fast-profile features
+MODEL_PATH_FAST = os.getenv('MODEL_PATH_FAST', 'app/artifacts/model_fast.joblib')
+# How often (seconds) each worker checks MODEL_PATH and the control file for changes; 0 disables the watcher
+MODEL_RELOAD_INTERVAL = float(os.getenv('MODEL_RELOAD_INTERVAL', '5'))
+# Admin reload/rollback calls write the desired version here so every worker converges on it
+MODEL_CONTROL_PATH = os.getenv('MODEL_CONTROL_PATH', MODEL_PATH + '.control')
+MODEL_WARMUP_ROUNDS = int(os.getenv('MODEL_WARMUP_ROUNDS', '3'))
+# Two-tier cascade: when the artifact carries a stage-1 model trained on the cheap features only,
+# clips it scores at or above the threshold skip pitch extraction and the full model
+CASCADE_ENABLED = os.getenv('CASCADE_ENABLED', '1') == '1'
+# Overrides the threshold chosen at training time (meta['cascade_threshold'])
+CASCADE_THRESHOLD = os.getenv('CASCADE_THRESHOLD')
+N_FEATURES = len(FEATURE_KEYS)
+# Language-specific artifacts live at <LANGUAGE_MODEL_DIR>/<language>.joblib (e.g. tamil.joblib);
+# languages without one are served by the global MODEL_PATH model
+LANGUAGE_MODEL_DIR = os.getenv('LANGUAGE_MODEL_DIR', 'app/artifacts/languages')
+# Resident language models per worker are evicted least-recently-used beyond this many MB of artifact size
+LANGUAGE_MODEL_MEMORY_MB = float(os.getenv('LANGUAGE_MODEL_MEMORY_MB', '512'))
 
-_model = None
-_model_meta = None
 
+class LoadedModel:
+    """A model artifact held in memory together with its version and provenance."""
+    __slots__ = ('model', 'stage1', 'meta', 'version', 'path', 'signature', 'loaded_at')
 
-def _train_fallback():
+    def __init__(self, model, meta, version, path, signature, stage1=None):
+        self.model = model
+        self.stage1 = stage1
+        self.meta = meta
+        self.version = version
+        self.path = path
+        self.signature = signature
+        self.loaded_at = time.time()
+
+    @property
+    def cascade_threshold(self) -> float:
+        if CASCADE_THRESHOLD is not None:
+            return float(CASCADE_THRESHOLD)
+        return float(self.meta.get('cascade_threshold', 0.95))
+
+    def describe(self) -> dict:
+        return {'version': self.version, 'path': self.path, 'loadedAt': self.loaded_at,
+                'cascade': self.stage1 is not None}
+
+
+_active = None
+_previous = None
+_seen_signature = None
+_last_error = None
+_reload_lock = threading.Lock()
+_watcher = None
+_watcher_started = None
+_swap_listeners = []
+
+
+def _file_signature(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _artifact_version(path, meta):
+    if meta.get('version'):
+        return str(meta['version'])
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()[:12]
+
+
+def _train_fallback(profile='accurate'):
     # Train a lightweight RandomForest on synthetic samples if no model is present.
     try:
         from scripts.train import build_dataset
@@ -19,47 +93,466 @@ def _train_fallback():
         X = np.zeros((10,12), dtype=float)
         y = np.array(['HUMAN']*5 + ['AI_GENERATED']*5)
         return X, y
-    X, y = build_dataset(n=200)
+    X, y = build_dataset(n=200, profile=profile)
     return X, y
 
 
+def _write_fallback_artifact(path, profile='accurate'):
+    print(f'Model artifact {path} not found. Training fallback model (this may take a few seconds)')
+    X, y = _train_fallback(profile)
+    # Prefer RandomForest if available; otherwise use SimpleLogistic fallback
+    try:
+        from sklearn.ensemble import RandomForestClassifier
+        clf = RandomForestClassifier(n_estimators=100)
+        clf.fit(X, y)
+    except Exception:
+        print('scikit-learn not available; training SimpleLogistic fallback model')
+        from app.simple_model import SimpleLogistic
+        clf = SimpleLogistic(lr=0.5, n_iter=2000)
+        clf.fit(X, y)
+    # persist fallback model for future runs; other workers may be loading the same path
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    joblib.dump({'model': clf, 'meta': {'profile': profile}}, tmp)
+    os.replace(tmp, path)
+
+
+def _read_artifact(path) -> LoadedModel:
+    signature = _file_signature(path)
+    data = joblib.load(path)
+    meta = data.get('meta', {})
+    return LoadedModel(data['model'], meta, _artifact_version(path, meta), path, signature, stage1=data.get('stage1'))
+
+
+def _warm(loaded: LoadedModel):
+    # Run a few dummy predictions so lazy initialisation happens before the model takes traffic
+    limit_estimator(loaded.model)
+    limit_estimator(loaded.stage1)
+    x = np.zeros((1, N_FEATURES), dtype=np.float32)
+    x_cheap = np.zeros((1, len(CHEAP_FEATURE_KEYS)), dtype=np.float32)
+    for _ in range(MODEL_WARMUP_ROUNDS):
+        loaded.model.predict_proba(x)
+        if loaded.stage1 is not None:
+            loaded.stage1.predict_proba(x_cheap)
+
+
+def _activate(loaded: LoadedModel):
+    global _active, _previous
+    # A single reference assignment: requests see either the old or the new model, never a mix
+    _previous, _active = _active, loaded
+    if _previous is not None:
+        metrics.set_gauge('model_version_info', 0, version=_previous.version)
+    metrics.set_gauge('model_version_info', 1, version=loaded.version)
+    metrics.inc('model_swaps_total')
+    for listener in list(_swap_listeners):
+        try:
+            listener(loaded)
+        except Exception as e:
+            print(f'Model swap listener failed: {e}')
+
+
+def add_swap_listener(fn):
+    """Call `fn(loaded_model)` after every model swap (e.g. to refresh worker processes)."""
+    _swap_listeners.append(fn)
+
+
+def remove_swap_listener(fn):
+    if fn in _swap_listeners:
+        _swap_listeners.remove(fn)
+
+
+def install_model(loaded: LoadedModel):
+    """Make an already loaded model active in this process (used by inference worker processes)."""
+    with _reload_lock:
+        _warm(loaded)
+        _activate(loaded)
+
+
+def active_model() -> LoadedModel:
+    global _active, _seen_signature
+    if _active is None:
+        with _reload_lock:
+            if _active is None:
+                # Try to load saved model; if missing, train fallback
+                if not os.path.exists(MODEL_PATH):
+                    _write_fallback_artifact(MODEL_PATH)
+                loaded = _read_artifact(MODEL_PATH)
+                _seen_signature = loaded.signature
+                _activate(loaded)
+    return _active
+
+
 def load_model():
-    global _model, _model_meta
-    if _model is None:
-        # Try to load saved model; if missing, train fallback
-        if os.path.exists(MODEL_PATH):
-            data = joblib.load(MODEL_PATH)
-            _model = data['model']
-            _model_meta = data.get('meta', {})
-        else:
-            print('Model artifact not found. Training fallback model (this may take a few seconds)')
-            X, y = _train_fallback()
-            # Prefer RandomForest if available; otherwise use SimpleLogistic fallback
-            try:
-                from sklearn.ensemble import RandomForestClassifier
-                clf = RandomForestClassifier(n_estimators=100)
-                clf.fit(X, y)
-            except Exception:
-                print('scikit-learn not available; training SimpleLogistic fallback model')
-                from app.simple_model import SimpleLogistic
-                clf = SimpleLogistic(lr=0.5, n_iter=2000)
-                clf.fit(X, y)
-
-            _model = clf
-            # persist fallback model for future runs
-            os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
-            joblib.dump({'model': _model, 'meta': {}}, MODEL_PATH)
-    return _model
+    return active_model().model
 
 
-def predict(feature_vector: np.ndarray) -> Tuple[str, float, dict]:
-    model = load_model()
-    probs = model.predict_proba(feature_vector.reshape(1, -1))[0]
+_fast = None
+_fast_missing = False
+_fast_lock = threading.Lock()
+
+
+def load_fast_model() -> LoadedModel | None:
+    """Load and warm MODEL_PATH_FAST if it is new or changed (startup, pool processes and the watcher).
+
+    Returns None when there is no artifact. Nothing is trained here: 'fast' requests are
+    served with the accurate profile until `python -m scripts.train --profile fast` writes one.
+    """
+    global _fast, _fast_missing
+    with _fast_lock:
+        if not os.path.exists(MODEL_PATH_FAST):
+            if not _fast_missing:
+                print(f'Fast model {MODEL_PATH_FAST} not found; fast-profile requests use the accurate profile')
+            _fast_missing = True
+            return _fast
+        if _fast is None or _file_signature(MODEL_PATH_FAST) != _fast.signature:
+            loaded = _read_artifact(MODEL_PATH_FAST)
+            _warm(loaded)
+            _fast = loaded
+        _fast_missing = False
+        return _fast
+
+
+def fast_model() -> LoadedModel | None:
+    """Model for the 'fast' processing profile, or None when MODEL_PATH_FAST has no artifact."""
+    if _fast is None and not _fast_missing:
+        # Processes that skipped startup (tests, scripts); a missing artifact is not looked up again per request
+        return load_fast_model()
+    return _fast
+
+
+_secondary_checked = float('-inf')
+
+
+def refresh_secondary_models(interval: float = MODEL_RELOAD_INTERVAL):
+    """Pick up changed language and fast-model artifacts, checking at most every `interval` seconds.
+
+    For inference pool processes, which run no watcher thread: they call this before each
+    clip. The global model reaches them through a pool restart instead (see engine.py).
+    """
+    global _secondary_checked
+    now = time.monotonic()
+    if interval <= 0 or now - _secondary_checked < interval:
+        return
+    _secondary_checked = now
+    try:
+        _registry.refresh()
+        load_fast_model()
+    except Exception as e:
+        print(f'Model refresh error: {e}')
+
+
+def reload_model(force: bool = False) -> bool:
+    """Load MODEL_PATH in the calling thread, warm it and swap it in.
+
+    Returns False when the artifact is unchanged since it was last seen (unless `force`)
+    or could not be loaded; the currently active model keeps serving in both cases.
+    """
+    global _seen_signature, _last_error
+    active_model()
+    with _reload_lock:
+        try:
+            signature = _file_signature(MODEL_PATH)
+            if not force and signature == _seen_signature:
+                return False
+            loaded = _read_artifact(MODEL_PATH)
+            _warm(loaded)
+        except Exception as e:
+            _last_error = f'{type(e).__name__}: {e}'
+            metrics.inc('model_reload_failures_total')
+            print(f'Model reload failed, keeping version {_active.version}: {_last_error}')
+            return False
+        _seen_signature = loaded.signature
+        _last_error = None
+        if loaded.version != _active.version:
+            _activate(loaded)
+        return True
+
+
+def load_model_from(path: str, signature=None) -> bool:
+    """Load, warm and swap in the artifact at `path` (not necessarily MODEL_PATH).
+
+    With `signature`, the file must still be exactly that artifact; a file that has been
+    replaced since is refused so this worker does not end up on some other version.
+    """
+    global _last_error
+    active_model()
+    with _reload_lock:
+        try:
+            if signature is not None and _file_signature(path) != tuple(signature):
+                raise ValueError(f'{path} has changed since the requested version was written')
+            loaded = _read_artifact(path)
+            _warm(loaded)
+        except Exception as e:
+            _last_error = f'{type(e).__name__}: {e}'
+            metrics.inc('model_reload_failures_total')
+            print(f'Loading {path} failed, keeping version {_active.version}: {_last_error}')
+            return False
+        _last_error = None
+        if loaded.version != _active.version:
+            _activate(loaded)
+        return True
+
+
+def rollback_model() -> bool:
+    """Swap the previous in-memory model back in. Returns False if there is none."""
+    with _reload_lock:
+        if _previous is None:
+            return False
+        _activate(_previous)
+        return True
+
+
+def model_status() -> dict:
+    current = active_model()
+    return {
+        'active': current.describe(),
+        'previous': _previous.describe() if _previous is not None else None,
+        'lastError': _last_error,
+        'languages': _registry.describe(),
+        'fast': _fast.describe() if _fast is not None else None,
+    }
+
+
+def write_model_control(loaded: LoadedModel):
+    """Ask every worker's watcher to converge on `loaded` (atomic replace of the control file).
+
+    The artifact path and file signature are recorded so a worker that does not hold that
+    version in memory loads exactly that file, not whatever MODEL_PATH holds now.
+    """
+    tmp = MODEL_CONTROL_PATH + f'.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': loaded.version, 'path': loaded.path,
+                   'signature': list(loaded.signature) if loaded.signature else None, 'ts': time.time()}, f)
+    os.replace(tmp, MODEL_CONTROL_PATH)
+
+
+def _apply_control(control: dict):
+    version = control.get('version')
+    if version == _active.version:
+        return
+    if _previous is not None and _previous.version == version and _previous.path == control.get('path'):
+        rollback_model()
+    elif control.get('path'):
+        load_model_from(control['path'], control.get('signature'))
+    else:
+        print(f'Ignoring model control for {version}: no artifact path recorded')
+
+
+def _watch_loop(interval):
+    control_signature = None
+    while True:
+        time.sleep(interval)
+        try:
+            reload_model()
+            _registry.refresh()
+            load_fast_model()
+            if os.path.exists(MODEL_CONTROL_PATH):
+                signature = _file_signature(MODEL_CONTROL_PATH)
+                if signature != control_signature:
+                    control_signature = signature
+                    with open(MODEL_CONTROL_PATH, 'r', encoding='utf-8') as f:
+                        control = json.load(f)
+                    # A control written before this worker started predates the artifacts it loaded
+                    # at startup (e.g. a rollback from before a deploy); MODEL_PATH wins then
+                    if control.get('ts', 0) >= _watcher_started:
+                        _apply_control(control)
+        except Exception as e:
+            print(f'Model watcher error: {e}')
+
+
+def start_model_watcher(interval: float = MODEL_RELOAD_INTERVAL):
+    """Start the background thread that picks up new artifacts and admin reload/rollback calls."""
+    global _watcher, _watcher_started
+    if interval <= 0 or _watcher is not None:
+        return
+    _watcher_started = time.time()
+    _watcher = threading.Thread(target=_watch_loop, args=(interval,), name='model-watcher', daemon=True)
+    _watcher.start()
+
+
+class ModelRegistry:
+    """Language -> model map that loads artifacts on first use and evicts them LRU under a memory budget.
+
+    Artifact size on disk is the memory estimate (forests unpickle to roughly their
+    serialised size). Languages with no artifact are remembered as missing until the
+    next `refresh()`, which the model watcher runs, so lookups do not stat the
+    filesystem per request.
+    """
+
+    def __init__(self, directory: str = LANGUAGE_MODEL_DIR, budget_mb: float = LANGUAGE_MODEL_MEMORY_MB):
+        self.directory = directory
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self._models = OrderedDict()   # language -> (LoadedModel, size_bytes)
+        self._missing = set()
+        self._loading = {}             # language -> Lock held while its artifact loads
+        self._lock = threading.Lock()
+
+    def path_for(self, language: str) -> str:
+        return os.path.join(self.directory, f'{language.lower()}.joblib')
+
+    def resident_bytes(self) -> int:
+        return sum(size for _, size in self._models.values())
+
+    def get(self, language: str | None) -> LoadedModel | None:
+        """The model for `language`, loading it if needed; None when there is no language-specific artifact."""
+        if not language or not language.isalpha() or language in self._missing:
+            return None
+        with self._lock:
+            entry = self._models.get(language)
+            if entry is not None:
+                self._models.move_to_end(language)
+                return entry[0]
+            guard = self._loading.setdefault(language, threading.Lock())
+        # Load outside the registry lock so a cold language never stalls lookups of
+        # resident ones; the per-language guard keeps concurrent misses to one load.
+        with guard:
+            with self._lock:
+                entry = self._models.get(language)
+                if entry is not None:
+                    self._models.move_to_end(language)
+                    return entry[0]
+                if language in self._missing:
+                    return None
+            loaded = self._load(language)
+            with self._lock:
+                if self._loading.get(language) is guard:
+                    del self._loading[language]
+                if loaded is None:
+                    return None
+                size = loaded.signature[1]
+                while self._models and self.resident_bytes() + size > self.budget_bytes:
+                    evicted, _ = self._models.popitem(last=False)
+                    metrics.inc('language_model_evictions_total', language=evicted)
+                self._models[language] = (loaded, size)
+                metrics.inc('language_model_loads_total', language=language)
+                metrics.set_gauge('language_models_resident_bytes', self.resident_bytes())
+            return loaded
+
+    def _load(self, language: str) -> LoadedModel | None:
+        path = self.path_for(language)
+        if not os.path.exists(path):
+            with self._lock:
+                self._missing.add(language)
+            return None
+        try:
+            loaded = _read_artifact(path)
+            _warm(loaded)
+        except Exception as e:
+            print(f'Unable to load {language} model from {path}, using the global model: {e}')
+            metrics.inc('language_model_load_failures_total', language=language)
+            with self._lock:
+                self._missing.add(language)
+            return None
+        return loaded
+
+    def refresh(self):
+        """Forget missing languages and drop resident models whose artifact changed or disappeared."""
+        with self._lock:
+            self._missing.clear()
+            for language, (loaded, _) in list(self._models.items()):
+                try:
+                    changed = _file_signature(loaded.path) != loaded.signature
+                except OSError:
+                    changed = True
+                if changed:
+                    del self._models[language]
+            metrics.set_gauge('language_models_resident_bytes', self.resident_bytes())
+
+    def describe(self) -> dict:
+        with self._lock:
+            return {language: loaded.describe() for language, (loaded, _) in self._models.items()}
+
+
+_registry = ModelRegistry()
+
+
+def model_for(language: str | None = None) -> LoadedModel:
+    """The language-specific model when one exists, else the global model."""
+    return _registry.get(language) or active_model()
+
+
+def _predict_with(model, vec: np.ndarray):
+    probs = model.predict_proba(vec.reshape(1, -1))[0]
     # assumes classes are ordered as model.classes_
     class_idx = int(np.argmax(probs))
     label = model.classes_[class_idx]
     confidence = float(probs[class_idx])
-    return label, confidence, {'class_probs': {c: float(p) for c,p in zip(model.classes_, probs)}}
+    return label, confidence, {c: float(p) for c,p in zip(model.classes_, probs)}
+
+
+def predict(feature_vector: np.ndarray) -> Tuple[str, float, dict]:
+    current = active_model()
+    label, confidence, class_probs = _predict_with(current.model, feature_vector)
+    metrics.inc('predictions_total', model_version=current.version)
+    annotate('model_version', current.version)
+    return label, confidence, {'class_probs': class_probs, 'model_version': current.version}
+
+
+def classify(y: np.ndarray, sr: int = 16000, language: str | None = None,
+             profile: str = 'accurate', fingerprinting: bool = True) -> Tuple[str, float, dict, dict]:
+    """Features + prediction for a decoded clip, running pitch extraction only when needed.
+
+    `language` selects a language-specific model from the registry when one exists.
+    The 'fast' profile uses the cheaper feature estimators with the MODEL_PATH_FAST model
+    (not language-specific) and skips the fingerprint index; without that model the clip
+    is scored with the accurate profile. `meta['profile']` is the profile actually used and
+    `meta['model_scope']` which model served the clip ('global', 'language' or 'fast').
+    `fingerprinting=False` (job recordings) neither queries nor grows the fingerprint index.
+
+    Returns (label, confidence, meta, features). A clip whose spectral-peak fingerprint
+    matches an earlier clip scored by the same model version returns that verdict with
+    `meta['fingerprint_match']` set. Otherwise `meta['stage']` is 1 when the cheap stage-1
+    model was confident enough to answer on its own, 2 otherwise.
+    """
+    current = fast_model() if profile == 'fast' else None
+    if profile == 'fast' and current is None:
+        metrics.inc('fast_profile_unavailable_total')
+        profile = 'accurate'
+    fast = profile == 'fast'
+    scope = 'fast'
+    if current is None:
+        current = _registry.get(language)
+        scope = 'global' if current is None else 'language'
+        current = current or active_model()
+    use_fingerprint = fingerprint.FINGERPRINT_ENABLED and fingerprinting and not fast
+    y, features, S_mag = extract_cheap_features(y, sr, want_spectrogram=use_fingerprint, profile=profile)
+    fp = None
+    if use_fingerprint:
+        with span('fingerprint'):
+            fp = fingerprint.compute_fingerprint(S_mag)
+            hit = fingerprint.get_index().query(fp)
+        if hit is not None and hit[0]['model_version'] == current.version:
+            verdict, similarity = hit
+            metrics.inc('fingerprint_hits_total')
+            metrics.inc('predictions_total', model_version=current.version)
+            annotate('model_version', current.version)
+            annotate('fingerprint_similarity', round(similarity, 3))
+            meta = {'class_probs': verdict['class_probs'], 'model_version': current.version,
+                    'stage': verdict['stage'], 'fingerprint_match': True,
+                    'fingerprint_similarity': similarity, 'profile': profile, 'model_scope': scope}
+            return verdict['label'], verdict['confidence'], meta, features
+        metrics.inc('fingerprint_misses_total')
+
+    stage = 2
+    if CASCADE_ENABLED and current.stage1 is not None:
+        with span('predict_stage1'):
+            label, confidence, class_probs = _predict_with(current.stage1, feature_vector(features, CHEAP_FEATURE_KEYS))
+        if confidence >= current.cascade_threshold:
+            stage = 1
+    if stage == 2:
+        add_pitch_features(y, sr, features, profile)
+        with span('predict'):
+            label, confidence, class_probs = _predict_with(current.model, feature_vector(features))
+    if current.stage1 is not None:
+        metrics.inc('cascade_exits_total', stage=str(stage))
+    metrics.inc('predictions_total', model_version=current.version)
+    annotate('model_version', current.version)
+    annotate('cascade_stage', stage)
+    if fp is not None:
+        fingerprint.get_index().add(fp, {'label': label, 'confidence': confidence, 'class_probs': class_probs,
+                                         'model_version': current.version, 'stage': stage})
+    return label, confidence, {'class_probs': class_probs, 'model_version': current.version, 'stage': stage,
+                               'fingerprint_match': False, 'profile': profile, 'model_scope': scope}, features
 
 
 def explain(features: dict, label: str):
@@ -67,9 +560,10 @@ def explain(features: dict, label: str):
     reasons = []
     if features.get('spec_flat_mean', 0) > 0.4:
         reasons.append('high spectral flatness (noise-like timbre)')
-    if features.get('jitter', 0) < 0.005:
+    # Pitch features are absent when the cascade answered from the cheap features alone
+    if 'jitter' in features and features['jitter'] < 0.005:
         reasons.append('very low pitch jitter (stable synthetic pitch)')
-    if features.get('f0_std', 0) < 5:
+    if 'f0_std' in features and features['f0_std'] < 5:
         reasons.append('stable pitch contour')
     if features.get('shimmer', 0) < 0.02:
         reasons.append('low amplitude micro-variations')
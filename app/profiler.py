@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+# Bounds for GET /admin/profile
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+PROFILE_MAX_HZ = float(os.getenv('PROFILE_MAX_HZ', '1000'))
+
+# Innermost frame with one of these (module, function) names decides a sample's stage
+STAGE_FRAMES = {
+    ('app.utils', 'b64_to_wav_np'): 'decode',
+    ('app.utils', 'bytes_to_wav_np'): 'decode',
+    ('app.utils', 'decode_mp3_to_wav_bytes'): 'decode',
+    ('app.utils', 'load_wav_np'): 'decode',
+    ('app.features', 'extract_features'): 'features',
+    ('app.features', 'extract_cheap_features'): 'features',
+    ('app.features', 'add_pitch_features'): 'features',
+    ('app.fingerprint', 'compute_fingerprint'): 'fingerprint',
+    ('app.fingerprint', 'query'): 'fingerprint',
+    ('app.model', 'predict'): 'predict',
+    ('app.model', '_predict_with'): 'predict',
+    ('app.model', 'explain'): 'explain',
+}
+
+_running = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    # No line numbers, so a flamegraph merges all samples of one function into one box
+    return module, code.co_name, f'{module}:{code.co_name}'
+
+
+def _walk(frame):
+    # Leaf-first walk; returns root-first labels and the innermost stage found
+    labels = []
+    stage = None
+    while frame is not None:
+        module, name, label = _frame_label(frame)
+        labels.append(label)
+        if stage is None:
+            stage = STAGE_FRAMES.get((module, name))
+        frame = frame.f_back
+    labels.reverse()
+    return labels, stage
+
+
+def sample_stacks(seconds: float, hz: float) -> dict:
+    """Sample every thread's stack in this process at `hz` for `seconds`.
+
+    Returns collapsed stacks ("thread;root;...;leaf count" lines, the input format of
+    flamegraph.pl / speedscope) and a breakdown of samples by pipeline stage. Nothing
+    is installed in the interpreter, so there is no cost outside a sampling run; only
+    one run may be active per process (ProfilerBusy otherwise).
+    """
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy('A profile is already running in this worker')
+    try:
+        me = threading.get_ident()
+        interval = 1.0 / hz
+        stacks = Counter()
+        stages = Counter()
+        samples = 0
+        deadline = time.perf_counter() + seconds
+        next_tick = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels, stage = _walk(frame)
+                thread = names.get(ident, f'thread-{ident}').replace(';', '_').replace(' ', '_')
+                stacks[';'.join([thread] + labels)] += 1
+                stages[stage or 'other'] += 1
+            samples += 1
+            next_tick += interval
+            # Skip ticks we fell behind on instead of bursting to catch up
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+            if next_tick < time.perf_counter():
+                next_tick = time.perf_counter()
+        total_stage = sum(n for s, n in stages.items() if s != 'other')
+        return {
+            'seconds': seconds,
+            'hz': hz,
+            'samples': samples,
+            'stages': {s: {'samples': n, 'share': round(n / total_stage, 4) if total_stage and s != 'other' else None}
+                       for s, n in stages.most_common()},
+            'collapsed': '\n'.join(f'{stack} {n}' for stack, n in stacks.most_common()),
+        }
+    finally:
+        _running.release()
@@ -0,0 +1,88 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from app import metrics
+from app.features import PROFILES
+
+# Requests that do not ask for a profile ('auto') get 'accurate' unless this worker is overloaded,
+# in which case they are downgraded to 'fast'. An explicit 'accurate' or 'fast' is always honoured.
+PROFILE_AUTO_DOWNGRADE = os.getenv('PROFILE_AUTO_DOWNGRADE', '1') == '1'
+# Overloaded: at least this many analyses in flight in this worker ...
+PROFILE_DOWNGRADE_INFLIGHT = int(os.getenv('PROFILE_DOWNGRADE_INFLIGHT', str(2 * (os.cpu_count() or 1))))
+# ... or accurate-profile analyses over the last PROFILE_LATENCY_WINDOW seconds have a p95 above this
+PROFILE_DOWNGRADE_P95_MS = float(os.getenv('PROFILE_DOWNGRADE_P95_MS', '1500'))
+PROFILE_LATENCY_WINDOW = float(os.getenv('PROFILE_LATENCY_WINDOW', '30'))
+
+PROFILE_HEADER = 'x-processing-profile'
+# p95 needs a handful of samples before it means anything
+_MIN_LATENCY_SAMPLES = 10
+
+
+class LoadGovernor:
+    """Picks the processing profile per request from in-flight depth and recent accurate-profile p95.
+
+    Only accurate-profile latencies are kept, and only for `window` seconds, so once
+    traffic has been downgraded for a while the old samples age out and requests return
+    to 'accurate' (and are downgraded again if it is still too slow).
+    """
+
+    def __init__(self, max_inflight: int = PROFILE_DOWNGRADE_INFLIGHT, p95_ms: float = PROFILE_DOWNGRADE_P95_MS,
+                 window: float = PROFILE_LATENCY_WINDOW):
+        self.max_inflight = max_inflight
+        self.p95_limit_ms = p95_ms
+        self.window = window
+        self.inflight = 0
+        self._latencies = deque()   # (monotonic time, ms) of finished accurate analyses
+        self._lock = threading.Lock()
+
+    def p95_ms(self) -> float | None:
+        with self._lock:
+            self._expire(time.monotonic())
+            if len(self._latencies) < _MIN_LATENCY_SAMPLES:
+                return None
+            values = sorted(ms for _, ms in self._latencies)
+        return values[min(len(values) - 1, int(0.95 * len(values)))]
+
+    def _expire(self, now):
+        while self._latencies and now - self._latencies[0][0] > self.window:
+            self._latencies.popleft()
+
+    def overloaded(self) -> bool:
+        if self.inflight >= self.max_inflight:
+            return True
+        p95 = self.p95_ms()
+        return p95 is not None and p95 > self.p95_limit_ms
+
+    def choose(self, requested: str | None) -> tuple[str, bool]:
+        """(profile, downgraded) for a request that asked for `requested` (None/'auto' = server's choice)."""
+        if requested in PROFILES:
+            return requested, False
+        if PROFILE_AUTO_DOWNGRADE and self.overloaded():
+            metrics.inc('profile_downgrades_total')
+            return 'fast', True
+        return 'accurate', False
+
+    @contextmanager
+    def track(self, profile: str):
+        with self._lock:
+            self.inflight += 1
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            now = time.monotonic()
+            with self._lock:
+                self.inflight -= 1
+                if profile == 'accurate':
+                    self._latencies.append((now, (now - t0) * 1000.0))
+                    self._expire(now)
+            metrics.inc('profile_requests_total', profile=profile)
+
+
+_governor = LoadGovernor()
+
+
+def get_governor() -> LoadGovernor:
+    return _governor
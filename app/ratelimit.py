@@ -0,0 +1,141 @@
+import os
+import time
+import asyncio
+import sqlite3
+import tempfile
+import threading
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+# Limiter state lives in a small local SQLite file so every uvicorn worker on the host sees the same buckets
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', os.path.join(tempfile.gettempdir(), 'voice_detection_ratelimit.sqlite3'))
+# A concurrency lease left behind by a crashed worker is reclaimed after this many seconds
+LEASE_TTL_SECONDS = float(os.getenv('LEASE_TTL_SECONDS', '300'))
+
+
+class RateLimiter:
+    """Token-bucket rate limit plus concurrency cap per API key, shared across processes.
+
+    Each admission is one short IMMEDIATE transaction: expired leases are dropped, the
+    in-flight count is checked against the key's cap, the bucket is refilled and charged,
+    and a lease row is inserted. The lease is deleted when the request finishes. The
+    methods block on sqlite (busy timeout 5 s); async code calls them through the
+    threadpool (`admit`, `keep_alive`).
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_DB, lease_ttl: float = LEASE_TTL_SECONDS):
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('CREATE TABLE IF NOT EXISTS buckets (key_id TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS leases (id INTEGER PRIMARY KEY AUTOINCREMENT, key_id TEXT, expires REAL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS leases_key ON leases (key_id)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Limiter state is disposable, so skip fsyncs
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, policy) -> int | None:
+        """Admit one request for `policy` or raise HTTPException (429 over the limit, 503 if sqlite fails).
+
+        Returns a lease id.
+        """
+        if policy.rate <= 0 and policy.max_concurrent <= 0:
+            return None
+        try:
+            return self._acquire(policy)
+        except sqlite3.Error as e:
+            print(f'Rate limiter unavailable: {e}')
+            raise HTTPException(status_code=503, detail='Rate limiter unavailable, retry shortly',
+                                headers={'Retry-After': '1'})
+
+    def _acquire(self, policy) -> int | None:
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if policy.max_concurrent > 0:
+                conn.execute('DELETE FROM leases WHERE key_id = ? AND expires < ?', (policy.key_id, now))
+                (inflight,) = conn.execute('SELECT COUNT(*) FROM leases WHERE key_id = ?', (policy.key_id,)).fetchone()
+                if inflight >= policy.max_concurrent:
+                    raise HTTPException(status_code=429, detail='Too many concurrent requests for this API key',
+                                        headers={'Retry-After': '1'})
+            if policy.rate > 0:
+                row = conn.execute('SELECT tokens, updated FROM buckets WHERE key_id = ?', (policy.key_id,)).fetchone()
+                if row is None:
+                    tokens = policy.burst
+                else:
+                    tokens = min(policy.burst, row[0] + (now - row[1]) * policy.rate)
+                if tokens < 1.0:
+                    retry_after = max(1, int((1.0 - tokens) / policy.rate + 0.999))
+                    raise HTTPException(status_code=429, detail='Rate limit exceeded for this API key',
+                                        headers={'Retry-After': str(retry_after)})
+                conn.execute('INSERT OR REPLACE INTO buckets (key_id, tokens, updated) VALUES (?, ?, ?)',
+                             (policy.key_id, tokens - 1.0, now))
+            lease_id = None
+            if policy.max_concurrent > 0:
+                cur = conn.execute('INSERT INTO leases (key_id, expires) VALUES (?, ?)',
+                                   (policy.key_id, now + self.lease_ttl))
+                lease_id = cur.lastrowid
+            conn.execute('COMMIT')
+            return lease_id
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def release(self, lease_id: int | None):
+        if lease_id is None:
+            return
+        try:
+            self._conn().execute('DELETE FROM leases WHERE id = ?', (lease_id,))
+        except sqlite3.Error as e:
+            # The lease is reclaimed after its TTL instead
+            print(f'Unable to release rate limit lease: {e}')
+
+    def refresh(self, lease_id: int | None):
+        """Push the expiry of a lease that is still in use another `lease_ttl` seconds out."""
+        if lease_id is None:
+            return
+        try:
+            self._conn().execute('UPDATE leases SET expires = ? WHERE id = ?',
+                                 (time.time() + self.lease_ttl, lease_id))
+        except sqlite3.Error as e:
+            print(f'Unable to refresh rate limit lease: {e}')
+
+    @asynccontextmanager
+    async def admit(self, policy):
+        """Hold one admission for `policy` around the block, with the sqlite calls in the threadpool."""
+        lease_id = await run_in_threadpool(self.acquire, policy)
+        try:
+            yield lease_id
+        finally:
+            await run_in_threadpool(self.release, lease_id)
+
+    async def keep_alive(self, lease_id: int | None):
+        """Refresh `lease_id` until cancelled, for sessions (WebSockets) that can outlive the lease TTL."""
+        if lease_id is None:
+            return
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            await run_in_threadpool(self.refresh, lease_id)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
@@ -18,3 +18,11 @@ class SuccessResponse(BaseModel):
 class ErrorResponse(BaseModel):
     status: Literal['error']
     message: str
+
+class JobRequest(VoiceRequest):
+    # Higher runs first; equal priorities run in submission order
+    priority: int = Field(5, ge=0, le=9)
+
+class FeedbackRequest(BaseModel):
+    traceId: str = Field(..., min_length=1, max_length=64)
+    label: Literal['AI_GENERATED', 'HUMAN']
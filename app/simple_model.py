@@ -38,6 +38,19 @@ class SimpleLogistic:
                 print(f'iter={i} loss={loss:.6f}')
         return self
 
+    def partial_fit(self, X, y, classes=None, n_iter=50):
+        """Continue gradient descent from the current weights on a new batch (e.g. analyst feedback)."""
+        X = np.asarray(X, dtype=float)
+        y_bin = (np.asarray(y) == 'AI_GENERATED').astype(float)
+        if self.w is None:
+            self.w = np.zeros(X.shape[1], dtype=float)
+            self.b = 0.0
+        for _ in range(n_iter):
+            error = self._sigmoid(X.dot(self.w) + self.b) - y_bin
+            self.w -= self.lr * (X.T.dot(error)) / len(X)
+            self.b -= self.lr * np.mean(error)
+        return self
+
     def predict_proba(self, X):
         X = np.asarray(X, dtype=float)
         logits = X.dot(self.w) + self.b
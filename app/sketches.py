@@ -0,0 +1,347 @@
+import os
+import json
+import math
+import glob
+import time
+import tempfile
+import threading
+from app.features import FEATURE_KEYS
+
+# Per-worker feature/confidence sketches are written here; GET /admin/feature-stats merges every file
+SKETCH_DIR = os.getenv('SKETCH_DIR', os.path.join(tempfile.gettempdir(), 'voice_detection_sketches'))
+SKETCH_SNAPSHOT_INTERVAL = float(os.getenv('SKETCH_SNAPSHOT_INTERVAL', '60'))
+# Snapshots not rewritten for this long (workers that exited) are dropped from the merge and deleted
+SKETCH_MAX_AGE = float(os.getenv('SKETCH_MAX_AGE', str(24 * 3600)))
+# Quantiles are within this relative error of the true value
+SKETCH_RELATIVE_ACCURACY = float(os.getenv('SKETCH_RELATIVE_ACCURACY', '0.01'))
+# Caps memory per sketch; past it the smallest-magnitude buckets are folded together
+SKETCH_MAX_BUCKETS = int(os.getenv('SKETCH_MAX_BUCKETS', '2048'))
+CONFIDENCE_BINS = int(os.getenv('CONFIDENCE_BINS', '20'))
+
+QUANTILES = (0.01, 0.1, 0.5, 0.9, 0.99)
+# Magnitudes below this count as zero (log buckets cannot index them)
+_MIN_INDEXABLE = 1e-9
+
+
+class QuantileSketch:
+    """Log-bucketed quantile sketch (DDSketch): O(1) add, exact merge, relative-error quantiles.
+
+    A value x lands in bucket ceil(log_gamma |x|) with gamma = (1 + a) / (1 - a), so every
+    value in a bucket is within relative accuracy `a` of the bucket's representative.
+    Sketches with the same accuracy merge by adding bucket counts.
+    """
+
+    def __init__(self, relative_accuracy: float = SKETCH_RELATIVE_ACCURACY, max_buckets: int = SKETCH_MAX_BUCKETS):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.pos = {}
+        self.neg = {}
+        self.zero = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.nonfinite = 0
+
+    def _index(self, magnitude: float) -> int:
+        return math.ceil(math.log(magnitude) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        return 2.0 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, x: float):
+        x = float(x)
+        if not math.isfinite(x):
+            # NaN/inf features usually mean a broken decode; count them instead of poisoning the buckets
+            self.nonfinite += 1
+            return
+        if x > _MIN_INDEXABLE:
+            store = self.pos
+            i = self._index(x)
+        elif x < -_MIN_INDEXABLE:
+            store = self.neg
+            i = self._index(-x)
+        else:
+            store = None
+            self.zero += 1
+        if store is not None:
+            store[i] = store.get(i, 0) + 1
+            if len(store) > self.max_buckets:
+                self._collapse(store)
+        self.count += 1
+        self.sum += x
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def _collapse(self, store):
+        # Fold the smallest-magnitude buckets into one; only the low tail loses accuracy
+        keys = sorted(store)
+        excess = keys[:len(keys) - self.max_buckets + 1]
+        folded = sum(store.pop(k) for k in excess)
+        store[excess[-1]] = folded
+
+    def merge(self, other: 'QuantileSketch'):
+        if abs(other.gamma - self.gamma) > 1e-12:
+            raise ValueError('cannot merge sketches with different relative accuracy')
+        for mine, theirs in ((self.pos, other.pos), (self.neg, other.neg)):
+            for i, n in theirs.items():
+                mine[i] = mine.get(i, 0) + n
+            if len(mine) > self.max_buckets:
+                self._collapse(mine)
+        self.zero += other.zero
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.nonfinite += other.nonfinite
+        return self
+
+    def quantile(self, q: float) -> float | None:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        # Most negative first: largest negative magnitude is the smallest value
+        for i in sorted(self.neg, reverse=True):
+            seen += self.neg[i]
+            if seen > rank:
+                return max(self.min, -self._value(i))
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for i in sorted(self.pos):
+            seen += self.pos[i]
+            if seen > rank:
+                return min(self.max, self._value(i))
+        return self.max
+
+    def summary(self, quantiles=QUANTILES) -> dict:
+        out = {'count': self.count, 'nonfinite': self.nonfinite}
+        if self.count:
+            out.update(min=self.min, max=self.max, mean=self.sum / self.count)
+            out.update({f'p{round(q * 100):02d}': self.quantile(q) for q in quantiles})
+        return out
+
+    def to_dict(self) -> dict:
+        return {'a': self.relative_accuracy, 'pos': [[i, n] for i, n in self.pos.items()],
+                'neg': [[i, n] for i, n in self.neg.items()], 'zero': self.zero, 'count': self.count,
+                'sum': self.sum, 'min': self.min if self.count else None, 'max': self.max if self.count else None,
+                'nonfinite': self.nonfinite}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'QuantileSketch':
+        sketch = cls(data['a'])
+        sketch.pos = {int(i): n for i, n in data['pos']}
+        sketch.neg = {int(i): n for i, n in data['neg']}
+        sketch.zero = data['zero']
+        sketch.count = data['count']
+        sketch.sum = data['sum']
+        if sketch.count:
+            sketch.min, sketch.max = data['min'], data['max']
+        sketch.nonfinite = data['nonfinite']
+        return sketch
+
+
+class Histogram:
+    """Fixed-width bins over [lo, hi] plus underflow/overflow; merges by adding counts."""
+
+    def __init__(self, lo: float = 0.0, hi: float = 1.0, bins: int = CONFIDENCE_BINS):
+        self.lo = lo
+        self.hi = hi
+        self.bins = bins
+        self._scale = bins / (hi - lo)
+        self.counts = [0] * bins
+        self.under = 0
+        self.over = 0
+
+    def add(self, x: float):
+        if x < self.lo:
+            self.under += 1
+        elif x > self.hi:
+            self.over += 1
+        else:
+            # x == hi belongs to the last bin
+            self.counts[min(self.bins - 1, int((x - self.lo) * self._scale))] += 1
+
+    def merge(self, other: 'Histogram'):
+        if (other.lo, other.hi, other.bins) != (self.lo, self.hi, self.bins):
+            raise ValueError('cannot merge histograms with different bins')
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.under += other.under
+        self.over += other.over
+        return self
+
+    def to_dict(self) -> dict:
+        return {'lo': self.lo, 'hi': self.hi, 'counts': list(self.counts), 'under': self.under, 'over': self.over}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Histogram':
+        hist = cls(data['lo'], data['hi'], len(data['counts']))
+        hist.counts = list(data['counts'])
+        hist.under = data['under']
+        hist.over = data['over']
+        return hist
+
+
+class _Group:
+    # Everything kept for one (language, profile): a sketch per feature, confidence sketch + histogram, labels
+    __slots__ = ('features', 'confidence', 'confidence_hist', 'labels')
+
+    def __init__(self):
+        self.features = {k: QuantileSketch() for k in FEATURE_KEYS}
+        self.confidence = QuantileSketch()
+        self.confidence_hist = Histogram()
+        self.labels = {}
+
+    def merge(self, other: '_Group'):
+        for k, sketch in other.features.items():
+            self.features.setdefault(k, QuantileSketch()).merge(sketch)
+        self.confidence.merge(other.confidence)
+        self.confidence_hist.merge(other.confidence_hist)
+        for label, n in other.labels.items():
+            self.labels[label] = self.labels.get(label, 0) + n
+        return self
+
+    def to_dict(self) -> dict:
+        return {'features': {k: s.to_dict() for k, s in self.features.items()},
+                'confidence': self.confidence.to_dict(), 'confidence_hist': self.confidence_hist.to_dict(),
+                'labels': dict(self.labels)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> '_Group':
+        group = cls()
+        group.features = {k: QuantileSketch.from_dict(s) for k, s in data['features'].items()}
+        group.confidence = QuantileSketch.from_dict(data['confidence'])
+        group.confidence_hist = Histogram.from_dict(data['confidence_hist'])
+        group.labels = dict(data['labels'])
+        return group
+
+    def summary(self) -> dict:
+        hist = self.confidence_hist
+        width = (hist.hi - hist.lo) / hist.bins
+        return {'count': self.confidence.count, 'labels': dict(self.labels),
+                'confidence': dict(self.confidence.summary(),
+                                   histogram={'edges': [round(hist.lo + i * width, 6) for i in range(hist.bins + 1)],
+                                              'counts': list(hist.counts)}),
+                'features': {k: s.summary() for k, s in self.features.items()}}
+
+
+class FeatureSketches:
+    """Streaming distributions of served features and confidence, by language and processing profile."""
+
+    def __init__(self):
+        self._groups = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def observe(self, language: str | None, profile: str, features: dict, confidence: float, label: str):
+        key = (language or 'unknown', profile)
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = _Group()
+            # Stage-1 and fingerprint answers carry no pitch features; those sketches just see fewer values
+            for k, sketch in group.features.items():
+                if k in features:
+                    sketch.add(features[k])
+            group.confidence.add(confidence)
+            group.confidence_hist.add(confidence)
+            group.labels[label] = group.labels.get(label, 0) + 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {'pid': os.getpid(), 'started': self.started, 'written': time.time(),
+                    'groups': [[lang, profile, g.to_dict()] for (lang, profile), g in self._groups.items()]}
+
+    def merge_dict(self, data: dict):
+        with self._lock:
+            for lang, profile, g in data['groups']:
+                other = _Group.from_dict(g)
+                mine = self._groups.get((lang, profile))
+                self._groups[(lang, profile)] = other if mine is None else mine.merge(other)
+
+    def summary(self) -> dict:
+        with self._lock:
+            out = {}
+            for (lang, profile), group in sorted(self._groups.items()):
+                out.setdefault(lang, {})[profile] = group.summary()
+            return out
+
+
+_sketches = None
+_sketches_lock = threading.Lock()
+
+
+def get_sketches() -> FeatureSketches:
+    global _sketches
+    if _sketches is None:
+        with _sketches_lock:
+            if _sketches is None:
+                _sketches = FeatureSketches()
+    return _sketches
+
+
+def observe_result(language: str | None, profile: str, result: dict):
+    """Add one served analysis (as returned by engine.analyze) to this worker's sketches."""
+    get_sketches().observe(language, profile, result['features'], result['confidence'], result['label'])
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(SKETCH_DIR, f'sketch-{pid}.json')
+
+
+def write_snapshot():
+    os.makedirs(SKETCH_DIR, exist_ok=True)
+    path = _snapshot_path(os.getpid())
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(get_sketches().to_dict(), f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def merged_stats() -> dict:
+    """This worker's live sketches merged with every other worker's latest snapshot."""
+    merged = FeatureSketches()
+    merged.merge_dict(get_sketches().to_dict())
+    workers = [os.getpid()]
+    now = time.time()
+    for path in glob.glob(os.path.join(SKETCH_DIR, 'sketch-*.json')):
+        if path == _snapshot_path(os.getpid()):
+            continue
+        try:
+            if now - os.path.getmtime(path) > SKETCH_MAX_AGE:
+                os.remove(path)
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # Deleted or replaced while we looked; the next call sees the new file
+            continue
+        merged.merge_dict(data)
+        workers.append(data['pid'])
+    return {'workers': sorted(workers), 'snapshotInterval': SKETCH_SNAPSHOT_INTERVAL,
+            'relativeAccuracy': SKETCH_RELATIVE_ACCURACY, 'languages': merged.summary()}
+
+
+def _snapshot_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_snapshot()
+        except Exception as e:
+            print(f'Unable to write feature sketch snapshot: {e}')
+
+
+_writer = None
+
+
+def start_snapshot_writer(interval: float = SKETCH_SNAPSHOT_INTERVAL):
+    global _writer
+    if interval <= 0 or _writer is not None:
+        return
+    _writer = threading.Thread(target=_snapshot_loop, args=(interval,), name='sketch-snapshots', daemon=True)
+    _writer.start()
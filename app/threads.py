@@ -0,0 +1,156 @@
+import os
+import sys
+import math
+import functools
+import threading
+
+# Cores this host gives the service; by default the smaller of the CPU affinity mask and the cgroup quota
+CPU_BUDGET = os.getenv('CPU_BUDGET')
+# uvicorn worker processes sharing the budget (start.sh exports it)
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+# Concurrent decode/feature/inference tasks per worker; default = the worker's share of cores
+EXECUTOR_THREADS = os.getenv('EXECUTOR_THREADS')
+# BLAS/OpenMP/numba threads each task may use; default = share of cores / executor slots (usually 1)
+NATIVE_THREADS = os.getenv('NATIVE_THREADS')
+
+# Env vars native libraries read when they load; set so spawned pool processes inherit the limit
+_NATIVE_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS',
+                    'NUMEXPR_NUM_THREADS', 'NUMBA_NUM_THREADS')
+
+
+def _cgroup_cpu_quota() -> float | None:
+    # cgroup v2, then v1; None when there is no quota
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == 'max' else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def _affinity_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def detect_cpus() -> dict:
+    affinity = _affinity_cpus()
+    quota = _cgroup_cpu_quota()
+    usable = affinity if quota is None else max(1, min(affinity, math.ceil(quota)))
+    return {'affinity': affinity, 'cgroupQuota': quota, 'usable': usable}
+
+
+class ThreadBudget:
+    """How this worker's share of the host's cores is split between executor slots and native pools."""
+    __slots__ = ('cpus', 'workers', 'per_worker', 'executor_threads', 'native_threads', 'inference_workers')
+
+    def __init__(self, cpus, workers, executor_threads=None, native_threads=None):
+        self.cpus = max(1, int(cpus))
+        self.workers = max(1, int(workers))
+        self.per_worker = max(1, self.cpus // self.workers)
+        self.executor_threads = max(1, int(executor_threads or self.per_worker))
+        self.native_threads = max(1, int(native_threads or self.per_worker // self.executor_threads))
+        # INFERENCE_MODE=pool: processes per uvicorn worker, one core each
+        self.inference_workers = self.per_worker
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+def plan_budget() -> ThreadBudget:
+    cpus = int(CPU_BUDGET) if CPU_BUDGET else detect_cpus()['usable']
+    return ThreadBudget(cpus, WEB_CONCURRENCY, EXECUTOR_THREADS, NATIVE_THREADS)
+
+
+_budget = None
+_lock = threading.Lock()
+
+
+def get_budget() -> ThreadBudget:
+    global _budget
+    if _budget is None:
+        with _lock:
+            if _budget is None:
+                _budget = plan_budget()
+    return _budget
+
+
+def apply_native_limits(budget: ThreadBudget | None = None):
+    """Cap BLAS/OpenMP (via threadpoolctl) and numba at `native_threads` for this process and its children."""
+    budget = budget or get_budget()
+    n = str(budget.native_threads)
+    for var in _NATIVE_ENV_VARS:
+        os.environ.setdefault(var, n)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=budget.native_threads)
+    except Exception as e:
+        print(f'threadpoolctl unavailable, native thread pools not capped: {e}')
+    try:
+        import numba
+        # set_num_threads launches numba's threading layer; only pay for that when it lowers the count
+        if budget.native_threads < numba.config.NUMBA_NUM_THREADS:
+            numba.set_num_threads(budget.native_threads)
+    except Exception:
+        pass
+
+
+def limit_estimator(model, budget: ThreadBudget | None = None):
+    # sklearn forests parallelise predict_proba over trees with joblib when n_jobs is set
+    if model is not None and getattr(model, 'n_jobs', None) not in (None, 1):
+        model.n_jobs = (budget or get_budget()).native_threads
+
+
+_cpu_limiter = None
+_io_limiter = None
+
+
+def configure_executor(budget: ThreadBudget | None = None):
+    """Create the limiter for CPU-bound work (see run_cpu_bound). Must run inside the event loop (startup).
+
+    anyio's default limiter (40 threads) is left alone: it also serves blocking I/O such as
+    sqlite calls and file reads, which must not queue behind analyses.
+    """
+    global _cpu_limiter, _io_limiter
+    import anyio.to_thread
+    _cpu_limiter = anyio.CapacityLimiter((budget or get_budget()).executor_threads)
+    # Kept for diagnostics(), which runs in a worker thread where anyio cannot look it up
+    _io_limiter = anyio.to_thread.current_default_thread_limiter()
+
+
+async def run_cpu_bound(func, *args):
+    """run_in_threadpool for decode/feature/inference work, at most `executor_threads` at once per worker."""
+    import anyio.to_thread
+    if _cpu_limiter is None:
+        configure_executor()
+    return await anyio.to_thread.run_sync(functools.partial(func, *args), limiter=_cpu_limiter)
+
+
+def diagnostics() -> dict:
+    budget = get_budget()
+    out = {'budget': budget.to_dict(), 'cpus': detect_cpus(), 'pythonThreads': threading.active_count(),
+           'env': {var: os.environ.get(var) for var in _NATIVE_ENV_VARS}}
+    out['executor'] = None
+    if _cpu_limiter is not None:
+        out['executor'] = {'cpuTokens': _cpu_limiter.total_tokens, 'cpuBorrowed': _cpu_limiter.borrowed_tokens,
+                           'ioTokens': _io_limiter.total_tokens, 'ioBorrowed': _io_limiter.borrowed_tokens}
+    try:
+        from threadpoolctl import threadpool_info
+        out['nativePools'] = [{k: info.get(k) for k in ('user_api', 'internal_api', 'num_threads', 'version')}
+                              for info in threadpool_info()]
+    except Exception:
+        out['nativePools'] = None
+    # Read the configured ceiling: querying numba from a threadpool thread would start its thread layer
+    numba = sys.modules.get('numba')
+    out['numbaThreads'] = numba.config.NUMBA_NUM_THREADS if numba else None
+    return out
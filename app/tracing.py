@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import uuid
+import queue
+import random
+import logging
+import logging.handlers
+import contextvars
+from contextlib import contextmanager
+
+# Fraction of requests that record per-stage spans; unsampled requests only pay for a trace id and one clock read
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.1'))
+# Requests slower than this are appended to the slow log (sampled or not)
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '2000'))
+SLOW_LOG_PATH = os.getenv('SLOW_LOG_PATH', 'logs/slow_requests.jsonl')
+SLOW_LOG_MAX_BYTES = int(os.getenv('SLOW_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+SLOW_LOG_BACKUPS = int(os.getenv('SLOW_LOG_BACKUPS', '5'))
+
+TRACE_HEADER = 'x-trace-id'
+
+_current = contextvars.ContextVar('voice_trace', default=None)
+
+
+class Trace:
+    """Timing record for one request. Spans are (name, offset_ms, duration_ms) tuples."""
+    __slots__ = ('trace_id', 'name', 'sampled', 'start', 'status', 'spans', 'attrs')
+
+    def __init__(self, name: str, sampled: bool | None = None):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.sampled = (random.random() < TRACE_SAMPLE_RATE) if sampled is None else sampled
+        self.start = time.perf_counter()
+        self.status = None
+        self.spans = []
+        self.attrs = {}
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000.0
+
+    def to_record(self) -> dict:
+        return {
+            'ts': time.time(),
+            'traceId': self.trace_id,
+            'name': self.name,
+            'status': self.status,
+            'elapsedMs': round(self.elapsed_ms(), 3),
+            'sampled': self.sampled,
+            'spans': [{'name': n, 'offsetMs': round(o, 3), 'durationMs': round(d, 3)} for n, o, d in self.spans],
+            'attrs': self.attrs,
+        }
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 't0')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        t1 = time.perf_counter()
+        self.trace.spans.append((self.name, (self.t0 - self.trace.start) * 1000.0, (t1 - self.t0) * 1000.0))
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def current_trace() -> Trace | None:
+    return _current.get()
+
+
+@contextmanager
+def trace_scope(trace: Trace):
+    """Make `trace` the current trace for the enclosed block (e.g. inside a worker process)."""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def span(name: str):
+    """Time a stage of the current request. A no-op outside a sampled trace."""
+    trace = _current.get()
+    if trace is None or not trace.sampled:
+        return _NULL_SPAN
+    return _Span(trace, name)
+
+
+def annotate(key: str, value):
+    """Attach a small attribute (decoder, audio size, ...) to the current trace, sampled or not."""
+    trace = _current.get()
+    if trace is not None:
+        trace.attrs[key] = value
+
+
+_slow_logger = None
+
+
+def _get_slow_logger():
+    # Writes go through a queue so the event loop never blocks on file I/O or rotation
+    global _slow_logger
+    if _slow_logger is None:
+        os.makedirs(os.path.dirname(SLOW_LOG_PATH) or '.', exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            SLOW_LOG_PATH, maxBytes=SLOW_LOG_MAX_BYTES, backupCount=SLOW_LOG_BACKUPS, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        q = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(q, handler)
+        listener.start()
+        logger = logging.getLogger('app.slow_requests')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(logging.handlers.QueueHandler(q))
+        _slow_logger = logger
+    return _slow_logger
+
+
+def finish_trace(trace: Trace):
+    if trace.elapsed_ms() >= SLOW_REQUEST_MS:
+        _get_slow_logger().info(json.dumps(trace.to_record(), default=str))
+
+
+class TraceMiddleware:
+    """ASGI middleware that opens a trace for selected HTTP and WebSocket paths.
+
+    The trace id is returned in the `x-trace-id` header of the HTTP response or the
+    WebSocket accept message, and the trace is checked against the slow-log threshold
+    when the request finishes.
+    """
+
+    def __init__(self, app, paths=()):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] not in ('http', 'websocket') or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        trace = Trace(scope['path'])
+        header = (TRACE_HEADER.encode('latin-1'), trace.trace_id.encode('latin-1'))
+
+        async def send_with_trace(message):
+            if message['type'] in ('http.response.start', 'websocket.accept'):
+                message = dict(message)
+                message['headers'] = list(message.get('headers') or []) + [header]
+                if 'status' in message:
+                    trace.status = message['status']
+            await send(message)
+
+        token = _current.set(trace)
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            _current.reset(token)
+            finish_trace(trace)
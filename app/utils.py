@@ -1,61 +1,223 @@
+import os
 import base64
 import io
 import subprocess
 import shutil
+from math import gcd
 import numpy as np
 import soundfile as sf
+from app import metrics
+from app.tracing import span, annotate
 
+# Decoders stop after this many seconds of audio; longer input is rejected (413) or truncated
+MAX_AUDIO_SECONDS = float(os.getenv('MAX_AUDIO_SECONDS', '120'))
+# 'reject' or 'truncate'
+AUDIO_OVERLENGTH = os.getenv('AUDIO_OVERLENGTH', 'reject')
+# Extra audio decoded past the limit, so over-length input can be told apart from input exactly at it
+_OVERLENGTH_MARGIN = 0.5
 
-def decode_mp3_to_wav_bytes(mp3_bytes: bytes, target_sr: int = 16000):
+
+class AudioTooLongError(Exception):
+    pass
+
+
+# Every decoder hands the feature pipeline mono audio at this rate
+TARGET_SR = 16000
+# Containers libsndfile reads in-process; everything else goes through pydub/ffmpeg
+SOUNDFILE_FORMATS = frozenset({'wav', 'flac', 'ogg_vorbis', 'ogg_opus', 'ogg_flac', 'ogg', 'aiff'})
+
+
+def _duration_args(max_seconds):
+    return ['-t', f'{max_seconds:g}'] if max_seconds else []
+
+
+def sniff_format(data) -> str:
+    """Container/codec from the leading bytes: wav, flac, ogg_*, aiff, mp3, aac, webm, mp4 or unknown."""
+    head = bytes(data[:64])
+    if head[:4] in (b'RIFF', b'RF64') and head[8:12] == b'WAVE':
+        return 'wav'
+    if head[:4] == b'fLaC':
+        return 'flac'
+    if head[:4] == b'OggS':
+        # First page carries the codec id packet right after the 27-byte header and the segment table
+        packet = head[28:36]
+        if packet.startswith(b'\x01vorbis'):
+            return 'ogg_vorbis'
+        if packet.startswith(b'OpusHead'):
+            return 'ogg_opus'
+        if packet.startswith(b'\x7fFLAC'):
+            return 'ogg_flac'
+        return 'ogg'
+    if head[:4] == b'FORM' and head[8:12] in (b'AIFF', b'AIFC'):
+        return 'aiff'
+    if head[:3] == b'ID3':
+        return 'mp3'
+    if len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        # MPEG frame sync; layer bits 00 mean ADTS AAC rather than MPEG audio
+        return 'aac' if head[1] & 0x06 == 0 else 'mp3'
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        return 'webm'
+    if head[4:8] == b'ftyp':
+        return 'mp4'
+    return 'unknown'
+
+
+def _resample(y: np.ndarray, sr: int, target_sr: int = TARGET_SR) -> np.ndarray:
+    from scipy.signal import resample_poly
+    g = gcd(int(sr), int(target_sr))
+    return resample_poly(y, target_sr // g, int(sr) // g).astype(np.float32, copy=False)
+
+
+def _ffmpeg_to_wav(audio_bytes, max_seconds: float | None = None) -> bytes:
+    # Use ffmpeg to convert arbitrary input formats (webm/ogg/opus/etc.) to wav
+    if shutil.which('ffmpeg') is None:
+        raise RuntimeError('Neither pydub nor ffmpeg are available to decode audio')
+    proc = subprocess.Popen(
+        ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0'] + _duration_args(max_seconds) +
+        ['-f', 'wav', '-ar', str(TARGET_SR), '-ac', '1', 'pipe:1', '-y'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    out, err = proc.communicate(audio_bytes)
+    if proc.returncode != 0:
+        raise RuntimeError('ffmpeg failed to decode audio')
+    annotate('decoder', 'ffmpeg_generic')
+    return out
+
+
+def decode_mp3_to_wav_bytes(mp3_bytes: bytes, target_sr: int = 16000, max_seconds: float | None = None):
     # Try pydub first (may fail in some environments due to pyaudioop missing)
     try:
         from pydub import AudioSegment
-        audio = AudioSegment.from_file(io.BytesIO(mp3_bytes), format='mp3')
+        audio = AudioSegment.from_file(io.BytesIO(mp3_bytes), format='mp3', duration=max_seconds)
         audio = audio.set_frame_rate(target_sr).set_channels(1)
         buf = io.BytesIO()
         audio.export(buf, format='wav')
         buf.seek(0)
+        annotate('decoder', 'pydub')
         return buf.read()
     except Exception:
         # Fallback: use ffmpeg subprocess if available
         if shutil.which('ffmpeg') is None:
             raise RuntimeError('Neither pydub nor ffmpeg are available to decode mp3')
         proc = subprocess.Popen(
-            ['ffmpeg','-hide_banner','-loglevel','error','-i','pipe:0','-f','wav','-ar',str(target_sr),'-ac','1','pipe:1','-y'],
+            ['ffmpeg','-hide_banner','-loglevel','error','-i','pipe:0'] + _duration_args(max_seconds) +
+            ['-f','wav','-ar',str(target_sr),'-ac','1','pipe:1','-y'],
             stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
         out, err = proc.communicate(mp3_bytes)
         if proc.returncode != 0:
             raise RuntimeError('ffmpeg failed to decode mp3')
+        annotate('decoder', 'ffmpeg')
         return out
 
 
-def load_wav_np(wav_bytes: bytes):
-    data, sr = sf.read(io.BytesIO(wav_bytes))
+def load_wav_np(wav_bytes: bytes, max_seconds: float | None = None):
+    with sf.SoundFile(io.BytesIO(wav_bytes)) as f:
+        sr = f.samplerate
+        frames = f.frames if not max_seconds else min(f.frames, int(max_seconds * sr))
+        # Decode straight to float32 instead of float64 plus a converted copy
+        data = f.read(frames, dtype='float32')
     # ensure mono
     if data.ndim > 1:
-        data = data.mean(axis=1)
-    return data.astype(np.float32), sr
+        data = data.mean(axis=1, dtype=np.float32)
+    return data, sr
 
 
-def b64_to_wav_np(audio_base64: str):
-    try:
-        mp3_bytes = base64.b64decode(audio_base64)
-    except Exception as e:
-        raise ValueError('Invalid base64 audio data')
-    # Try mp3-specific decode first, then fall back to a general ffmpeg-based converter
-    try:
-        wav_bytes = decode_mp3_to_wav_bytes(mp3_bytes)
-    except Exception:
-        # Use ffmpeg to convert arbitrary input formats (webm/ogg/opus/etc.) to wav
-        if shutil.which('ffmpeg') is None:
-            raise RuntimeError('Neither pydub nor ffmpeg are available to decode audio')
-        proc = subprocess.Popen(
-            ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0', '-f', 'wav', '-ar', str(16000), '-ac', '1', 'pipe:1', '-y'],
-            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        out, err = proc.communicate(mp3_bytes)
-        if proc.returncode != 0:
-            raise RuntimeError('ffmpeg failed to decode audio')
-        wav_bytes = out
-    return load_wav_np(wav_bytes)
+class AudioBuffer:
+    """Append-only byte buffer for streamed audio.
+
+    Starts from a preallocated bytearray and doubles its capacity when full, so a
+    session costs O(log n) reallocations instead of one object per chunk plus a final
+    join. `view()` returns a zero-copy memoryview of the filled region; release it
+    before appending again.
+    """
+
+    def __init__(self, initial_size: int = 256 * 1024, max_size: int | None = None):
+        self._buf = bytearray(initial_size)
+        self._len = 0
+        self.max_size = max_size
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def capacity(self) -> int:
+        return len(self._buf)
+
+    def append(self, data):
+        n = len(data)
+        end = self._len + n
+        if self.max_size is not None and end > self.max_size:
+            raise BufferError(f'Audio stream exceeds {self.max_size} bytes')
+        if end > len(self._buf):
+            new_size = max(end, 2 * len(self._buf))
+            if self.max_size is not None:
+                new_size = min(new_size, self.max_size)
+            grown = bytearray(new_size)
+            grown[:self._len] = memoryview(self._buf)[:self._len]
+            self._buf = grown
+        self._buf[self._len:end] = data
+        self._len = end
+
+    def clear(self):
+        # Keep the allocation for the next utterance in the same session
+        self._len = 0
+
+    def view(self) -> memoryview:
+        return memoryview(self._buf)[:self._len]
+
+
+def bytes_to_wav_np(audio_bytes, max_seconds: float | None = None):
+    """Decode raw container bytes (mp3/webm/ogg/...) into a mono float32 array at TARGET_SR.
+
+    The format is sniffed from the leading bytes: WAV/FLAC/Ogg/AIFF are read by soundfile
+    in-process (resampled to TARGET_SR), mp3 goes to pydub/ffmpeg, other containers
+    straight to one ffmpeg process. At most `max_seconds` of audio is decoded. Longer
+    input raises AudioTooLongError, or is cut to `max_seconds` when AUDIO_OVERLENGTH=truncate.
+    There is no limit by default; the HTTP and WebSocket handlers pass MAX_AUDIO_SECONDS.
+    """
+    annotate('audio_bytes', len(audio_bytes))
+    decode_limit = max_seconds + _OVERLENGTH_MARGIN if max_seconds else None
+    fmt = sniff_format(audio_bytes)
+    annotate('audio_format', fmt)
+    metrics.inc('audio_format_total', format=fmt)
+    y = None
+    if fmt in SOUNDFILE_FORMATS:
+        with span('decode'):
+            try:
+                y, sr = load_wav_np(audio_bytes, max_seconds=decode_limit)
+                annotate('decoder', 'soundfile')
+            except Exception:
+                # e.g. an Ogg codec this libsndfile build lacks; ffmpeg below gets a chance
+                y = None
+        if y is not None and sr != TARGET_SR:
+            with span('resample'):
+                y, sr = _resample(y, sr), TARGET_SR
+    if y is None:
+        with span('decode'):
+            if fmt == 'mp3':
+                wav_bytes = decode_mp3_to_wav_bytes(audio_bytes, max_seconds=decode_limit)
+            else:
+                # ffmpeg probes the container itself, so one process handles webm/mp4/aac/unknown input
+                wav_bytes = _ffmpeg_to_wav(audio_bytes, decode_limit)
+        with span('load_wav'):
+            y, sr = load_wav_np(wav_bytes, max_seconds=decode_limit)
+    if max_seconds and len(y) > max_seconds * sr:
+        if AUDIO_OVERLENGTH != 'truncate':
+            raise AudioTooLongError(f'Audio is longer than the {max_seconds:g} s limit')
+        y = y[:int(max_seconds * sr)]
+        annotate('audio_truncated', True)
+    annotate('audio_duration', round(len(y) / sr, 3))
+    return y, sr
+
+
+def decode_base64_audio(audio_base64: str) -> bytes:
+    with span('base64_decode'):
+        try:
+            return base64.b64decode(audio_base64)
+        except Exception as e:
+            raise ValueError('Invalid base64 audio data')
+
+
+def b64_to_wav_np(audio_base64: str, max_seconds: float | None = MAX_AUDIO_SECONDS):
+    return bytes_to_wav_np(decode_base64_audio(audio_base64), max_seconds=max_seconds)
@@ -0,0 +1,198 @@
+"""Score a directory or manifest of audio files offline, in parallel, with resume support.
+
+Usage:
+    python -m scripts.score_bulk /data/archive --output results.jsonl --workers 8
+    python -m scripts.score_bulk manifest.txt --output results.csv
+
+Results are appended as they complete. Every finished path (success or error) is also
+appended to a checkpoint file (default: <output>.checkpoint); rerunning the same command
+skips those paths, so a killed run resumes where it stopped. Recordings of any length are
+scored unless --max-seconds is given (the API's MAX_AUDIO_SECONDS does not apply here).
+"""
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.ogg', '.opus', '.webm', '.m4a', '.aac')
+CSV_FIELDS = ['path', 'status', 'classification', 'confidenceScore', 'modelVersion', 'duration',
+              'decode_ms', 'features_ms', 'predict_ms', 'error']
+STAGES = ('decode_ms', 'features_ms', 'predict_ms')
+
+
+def iter_inputs(source: str, extensions=AUDIO_EXTENSIONS):
+    """Yield audio paths from a directory tree, or from a manifest (one path per line, or CSV with a `path` column)."""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(extensions):
+                    yield os.path.join(root, name)
+        return
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, 'r', encoding='utf-8', newline='') as f:
+        first = f.readline()
+        f.seek(0)
+        if first.strip().lower().startswith('path') and ',' in first:
+            rows = (row['path'] for row in csv.DictReader(f))
+        else:
+            rows = (line.strip() for line in f)
+        for p in rows:
+            if p and not p.startswith('#'):
+                yield p if os.path.isabs(p) else os.path.join(base, p)
+
+
+def load_checkpoint(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+
+def _init_worker():
+    # Load (or train) the model once per worker process instead of once per file, and run one
+    # short clip so librosa/numba compilation is not billed to the first file's timings
+    import numpy as np
+    from app.model import load_model
+    from app.features import extract_features
+    load_model()
+    t = np.arange(4000, dtype=np.float32) / 16000
+    extract_features(0.1 * np.sin(2 * np.pi * 150 * t), 16000)
+
+
+def score_file(path: str, max_seconds: float | None = None) -> dict:
+    from app.utils import bytes_to_wav_np
+    from app.features import extract_features
+    from app.model import predict
+
+    t0 = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        y, sr = bytes_to_wav_np(data, max_seconds)
+        t1 = time.perf_counter()
+        feature_vec, features = extract_features(y, sr)
+        t2 = time.perf_counter()
+        label, confidence, meta = predict(feature_vec)
+        t3 = time.perf_counter()
+    except Exception as e:
+        return {'path': path, 'status': 'error', 'error': f'{type(e).__name__}: {e}'}
+    return {
+        'path': path,
+        'status': 'success',
+        'classification': label,
+        'confidenceScore': round(confidence, 4),
+        'modelVersion': meta['model_version'],
+        'duration': round(features['duration'], 3),
+        'decode_ms': round((t1 - t0) * 1000, 2),
+        'features_ms': round((t2 - t1) * 1000, 2),
+        'predict_ms': round((t3 - t2) * 1000, 2),
+    }
+
+
+class ResultWriter:
+    def __init__(self, path: str, fmt: str):
+        self.fmt = fmt
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._f = open(path, 'a', encoding='utf-8', newline='')
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(self._f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+            if new_file:
+                self._csv.writeheader()
+
+    def write(self, result: dict):
+        if self.fmt == 'csv':
+            self._csv.writerow(result)
+        else:
+            self._f.write(json.dumps(result) + '\n')
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def run(source, output, fmt=None, workers=None, checkpoint=None, progress_every=10.0, max_inflight=None,
+        max_seconds=None):
+    """Score every pending file under `source`; returns a summary dict."""
+    fmt = fmt or ('csv' if output.lower().endswith('.csv') else 'jsonl')
+    checkpoint = checkpoint or output + '.checkpoint'
+    workers = workers or os.cpu_count() or 1
+    max_inflight = max_inflight or workers * 4
+
+    done = load_checkpoint(checkpoint)
+    pending = (p for p in iter_inputs(source) if p not in done)
+    writer = ResultWriter(output, fmt)
+    ckpt = open(checkpoint, 'a', encoding='utf-8')
+    stats = {'processed': 0, 'errors': 0, 'skipped': len(done)}
+    stage_totals = dict.fromkeys(STAGES, 0.0)
+    started = last_report = time.perf_counter()
+
+    def report(final=False):
+        elapsed = time.perf_counter() - started
+        ok = stats['processed'] - stats['errors']
+        rate = stats['processed'] / elapsed if elapsed > 0 else 0.0
+        means = ' '.join(f'{k[:-3]}={stage_totals[k] / ok:.1f}ms' for k in STAGES) if ok else ''
+        label = 'done' if final else 'progress'
+        print(f'[{label}] {stats["processed"]} files ({stats["errors"]} errors, {stats["skipped"]} skipped) '
+              f'in {elapsed:.1f}s, {rate:.2f} files/s {means}', file=sys.stderr, flush=True)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            inflight = set()
+            exhausted = False
+            while inflight or not exhausted:
+                # Keep a bounded window of submitted files so huge manifests are never fully materialised
+                while not exhausted and len(inflight) < max_inflight:
+                    try:
+                        inflight.add(pool.submit(score_file, next(pending), max_seconds))
+                    except StopIteration:
+                        exhausted = True
+                if not inflight:
+                    break
+                finished, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    result = fut.result()
+                    writer.write(result)
+                    ckpt.write(result['path'] + '\n')
+                    ckpt.flush()
+                    stats['processed'] += 1
+                    if result['status'] == 'success':
+                        for k in STAGES:
+                            stage_totals[k] += result[k]
+                    else:
+                        stats['errors'] += 1
+                if time.perf_counter() - last_report >= progress_every:
+                    last_report = time.perf_counter()
+                    report()
+    finally:
+        writer.close()
+        ckpt.close()
+    report(final=True)
+    elapsed = time.perf_counter() - started
+    ok = stats['processed'] - stats['errors']
+    stats['elapsed_s'] = round(elapsed, 3)
+    stats['files_per_s'] = round(stats['processed'] / elapsed, 3) if elapsed > 0 else 0.0
+    stats['mean_stage_ms'] = {k: round(stage_totals[k] / ok, 2) if ok else 0.0 for k in STAGES}
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk-score audio files for AI-generated voice detection.')
+    parser.add_argument('source', help='directory to scan recursively, or a manifest file')
+    parser.add_argument('--output', '-o', required=True, help='results file (.jsonl or .csv)')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help='output format (default: from extension)')
+    parser.add_argument('--workers', '-j', type=int, help='worker processes (default: CPU count)')
+    parser.add_argument('--checkpoint', help='checkpoint file (default: <output>.checkpoint)')
+    parser.add_argument('--progress-every', type=float, default=10.0, help='seconds between progress lines')
+    parser.add_argument('--max-seconds', type=float, help='report longer recordings as errors (default: no limit)')
+    args = parser.parse_args(argv)
+    stats = run(args.source, args.output, fmt=args.format, workers=args.workers,
+                checkpoint=args.checkpoint, progress_every=args.progress_every, max_seconds=args.max_seconds)
+    print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
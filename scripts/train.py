@@ -1,7 +1,9 @@
 import os
+import time
+import argparse
 import numpy as np
 import joblib
-from app.features import extract_features
+from app.features import extract_features, FEATURE_KEYS, CHEAP_FEATURE_KEYS
 import soundfile as sf
 import tempfile
 
@@ -69,45 +71,200 @@ def to_mp3_bytes(y, sr=16000):
     return out.getvalue()
 
 
-def build_dataset(n=400):
+def build_dataset(n=400, profile='accurate'):
     X = []
     y = []
     for _ in range(n//2):
         s = synth_sample(human=True)
-        feat, _ = extract_features(s, sr=16000)
+        feat, _ = extract_features(s, sr=16000, profile=profile)
         X.append(feat)
         y.append('HUMAN')
     for _ in range(n//2):
         s = synth_sample(human=False)
-        feat, _ = extract_features(s, sr=16000)
+        feat, _ = extract_features(s, sr=16000, profile=profile)
         X.append(feat)
         y.append('AI_GENERATED')
     return np.vstack(X), np.array(y)
 
 
-def train_and_save():
-    X, Y = build_dataset()
-    X_train, X_test, y_train, y_test = train_test_split(X, Y, test_size=0.2, stratify=Y)
+# Columns of the full feature matrix used by the cascade's stage-1 model
+CHEAP_IDX = [FEATURE_KEYS.index(k) for k in CHEAP_FEATURE_KEYS]
+
+# Feature matrix cache, so model search reruns skip the pyin extraction
+FEATURES_CACHE = 'app/artifacts/features_cache.npz'
+# Largest acceptable single-row predict_proba latency of the saved model, in microseconds
+LATENCY_BUDGET_US = float(os.getenv('TRAIN_LATENCY_BUDGET_US', '5000'))
+# RandomForest configurations tried by the search; forest size drives serving predict cost
+SEARCH_SPACE = [
+    {'n_estimators': n, 'max_depth': d, 'min_samples_leaf': leaf}
+    for n in (10, 25, 50, 100, 200)
+    for d in (None, 8)
+    for leaf in (1, 3)
+]
+LATENCY_ROWS = 50
+
+
+def load_or_build_dataset(n=400, cache_path=FEATURES_CACHE, rebuild=False, profile='accurate'):
+    """Feature matrix and labels, read from `cache_path` when it was built with the same settings."""
+    from app.features import FEATURE_BACKEND
+    if not rebuild and os.path.exists(cache_path):
+        cached = np.load(cache_path, allow_pickle=False)
+        cached_profile = str(cached['profile']) if 'profile' in cached.files else 'accurate'
+        if (list(cached['feature_keys']) == FEATURE_KEYS and str(cached['backend']) == FEATURE_BACKEND
+                and cached_profile == profile and len(cached['y']) == n):
+            print(f'Loaded {len(cached["y"])} cached feature rows from {cache_path}')
+            return cached['X'], cached['y']
+        print(f'Ignoring stale feature cache {cache_path}')
+    X, y = build_dataset(n=n, profile=profile)
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    np.savez(cache_path, X=X, y=y, feature_keys=np.array(FEATURE_KEYS), backend=np.array(FEATURE_BACKEND),
+             profile=np.array(profile))
+    print(f'Saved feature cache to {cache_path}')
+    return X, y
+
+
+def make_classifier(n_estimators=200, **params):
     # Try to use scikit-learn RandomForest if available; otherwise fall back to pure-numpy logistic
     try:
         from sklearn.ensemble import RandomForestClassifier
-        clf = RandomForestClassifier(n_estimators=200)
+        return RandomForestClassifier(n_estimators=n_estimators, **params)
     except Exception:
         print('scikit-learn not available; using SimpleLogistic fallback')
         from app.simple_model import SimpleLogistic
-        clf = SimpleLogistic(lr=0.5, n_iter=2000)
+        return SimpleLogistic(lr=0.5, n_iter=2000)
+
 
+def measure_latency_us(clf, X, rows=LATENCY_ROWS):
+    """Median wall time of a single-row predict_proba, the call `app.model.predict` makes per request."""
+    X = np.asarray(X, dtype=np.float32)
+    for i in range(min(5, len(X))):
+        clf.predict_proba(X[i:i + 1])
+    timings = []
+    for i in range(rows):
+        row = X[i % len(X)][None, :]
+        t0 = time.perf_counter()
+        clf.predict_proba(row)
+        timings.append(time.perf_counter() - t0)
+    return float(np.median(timings) * 1e6)
+
+
+def _fit_candidate(params, X_train, y_train, X_test, y_test):
+    # n_jobs=1 inside each fit: the search parallelises across candidates, and serving predicts with one thread
+    clf = make_classifier(**params, n_jobs=1, random_state=0)
     clf.fit(X_train, y_train)
+    accuracy = float(np.mean(clf.predict(X_test) == y_test))
+    return params, clf, accuracy
+
+
+def search_models(X_train, y_train, X_test, y_test, space=SEARCH_SPACE, n_jobs=-1):
+    """Fit every configuration in `space` in parallel and time each one's single-row inference.
+
+    Returns a list of dicts (params, model, accuracy, latency_us). Latency is measured
+    serially afterwards so concurrent fits do not distort it.
+    """
+    from joblib import Parallel, delayed
+    fitted = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_candidate)(params, X_train, y_train, X_test, y_test) for params in space)
+    results = []
+    for params, clf, accuracy in fitted:
+        latency = measure_latency_us(clf, X_test)
+        results.append({'params': params, 'model': clf, 'accuracy': accuracy, 'latency_us': latency})
+        print(f'{params}: accuracy={accuracy:.3f} latency={latency:.0f}us')
+    return results
+
+
+def select_model(results, latency_budget_us=LATENCY_BUDGET_US):
+    """Most accurate candidate within the latency budget (faster wins ties); the fastest one if none fits."""
+    within = [r for r in results if r['latency_us'] <= latency_budget_us]
+    if not within:
+        print(f'No candidate fits the {latency_budget_us:.0f}us budget; using the fastest')
+        return min(results, key=lambda r: r['latency_us'])
+    return max(within, key=lambda r: (r['accuracy'], -r['latency_us']))
+
+
+def choose_cascade_threshold(stage1, X_cheap, y_true, target_accuracy,
+                             candidates=(0.8, 0.85, 0.9, 0.95, 0.97, 0.99)):
+    """Lowest confidence threshold at which stage-1 answers are at least as accurate as the full model.
+
+    Returns (threshold, hit_rate). A threshold above 1.0 means stage 1 never answers alone.
+    """
+    probs = stage1.predict_proba(X_cheap)
+    conf = probs.max(axis=1)
+    preds = np.asarray(stage1.classes_)[probs.argmax(axis=1)]
+    for t in candidates:
+        accepted = conf >= t
+        if not accepted.any():
+            continue
+        if np.mean(preds[accepted] == y_true[accepted]) >= target_accuracy:
+            return t, float(np.mean(accepted))
+    return 1.01, 0.0
+
+
+def train_and_save(cascade=True, n=400, cache_path=FEATURES_CACHE, rebuild_features=False,
+                   latency_budget_us=LATENCY_BUDGET_US, n_jobs=-1, output='app/artifacts/model.joblib',
+                   profile='accurate'):
+    X, Y = load_or_build_dataset(n=n, cache_path=cache_path, rebuild=rebuild_features, profile=profile)
+    X_train, X_test, y_train, y_test = train_test_split(X, Y, test_size=0.2, stratify=Y, random_state=42)
+
+    meta = {'profile': profile}
+    try:
+        from sklearn.ensemble import RandomForestClassifier  # noqa: F401
+        results = search_models(X_train, y_train, X_test, y_test, n_jobs=n_jobs)
+        best = select_model(results, latency_budget_us)
+        clf, params = best['model'], best['params']
+        meta.update({'params': params, 'accuracy': best['accuracy'], 'latency_us': round(best['latency_us'], 1),
+                     'latency_budget_us': latency_budget_us})
+        print(f'Selected {params}: accuracy={best["accuracy"]:.3f} latency={best["latency_us"]:.0f}us')
+    except ImportError:
+        params = {}
+        clf = make_classifier()
+        clf.fit(X_train, y_train)
+
     try:
+        from sklearn.metrics import classification_report
         preds = clf.predict(X_test)
         print(classification_report(y_test, preds))
     except Exception:
         print('Unable to print sklearn style report for fallback model')
 
-    os.makedirs('app/artifacts', exist_ok=True)
-    joblib.dump({'model': clf, 'meta': {}}, 'app/artifacts/model.joblib')
-    print('Saved model to app/artifacts/model.joblib')
+    artifact = {'model': clf, 'meta': meta}
+    if cascade:
+        # Stage 1: same learner on the cheap (no-pyin) columns; only confident clips stop there
+        stage1 = make_classifier(**params, random_state=0) if params else make_classifier()
+        stage1.fit(X_train[:, CHEAP_IDX], y_train)
+        full_acc = float(np.mean(clf.predict(X_test) == y_test))
+        threshold, hit_rate = choose_cascade_threshold(stage1, X_test[:, CHEAP_IDX], y_test, full_acc)
+        print(f'Cascade: threshold={threshold} stage-1 hit rate={hit_rate:.1%} (full model accuracy {full_acc:.3f})')
+        artifact['stage1'] = stage1
+        artifact['meta']['cascade_threshold'] = threshold
+
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    joblib.dump(artifact, output)
+    print(f'Saved model to {output}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the voice classifier with a latency-bounded model search.')
+    parser.add_argument('--samples', type=int, default=400, help='synthetic clips to generate (default: 400)')
+    parser.add_argument('--profile', choices=['accurate', 'fast'], default='accurate',
+                        help='feature profile to train for; fast models are saved to app/artifacts/model_fast.joblib')
+    parser.add_argument('--features-cache', help=f'feature matrix cache (default: {FEATURES_CACHE}, '
+                                                 'or features_cache_fast.npz for --profile fast)')
+    parser.add_argument('--rebuild-features', action='store_true', help='ignore the cache and re-extract features')
+    parser.add_argument('--latency-budget-us', type=float, default=LATENCY_BUDGET_US,
+                        help='max single-row predict latency of the saved model, in microseconds')
+    parser.add_argument('--jobs', '-j', type=int, default=-1, help='parallel fits (default: all cores)')
+    parser.add_argument('--output', '-o',
+                        help='artifact path, e.g. app/artifacts/languages/tamil.joblib for a language model')
+    parser.add_argument('--no-cascade', action='store_true', help='do not train the stage-1 model')
+    args = parser.parse_args(argv)
+    fast = args.profile == 'fast'
+    cache_path = args.features_cache or (FEATURES_CACHE.replace('.npz', '_fast.npz') if fast else FEATURES_CACHE)
+    output = args.output or ('app/artifacts/model_fast.joblib' if fast else 'app/artifacts/model.joblib')
+    train_and_save(cascade=not args.no_cascade, n=args.samples, cache_path=cache_path,
+                   rebuild_features=args.rebuild_features, latency_budget_us=args.latency_budget_us,
+                   n_jobs=args.jobs, output=output, profile=args.profile)
 
 
 if __name__ == '__main__':
-    train_and_save()
+    main()
@@ -1,3 +1,10 @@
 #!/usr/bin/env bash
 # Start server with 4 workers for concurrency
-uvicorn app.main:app --host 0.0.0.0 --port ${PORT:-10000} --workers 4
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-4}
+# Each worker sizes its threadpool and native pools from its share of the cores (app/threads.py);
+# these keep BLAS/OpenMP/numba from spawning a thread per core before that runs
+export OMP_NUM_THREADS=${OMP_NUM_THREADS:-1}
+export OPENBLAS_NUM_THREADS=${OPENBLAS_NUM_THREADS:-1}
+export MKL_NUM_THREADS=${MKL_NUM_THREADS:-1}
+export NUMBA_NUM_THREADS=${NUMBA_NUM_THREADS:-1}
+uvicorn app.main:app --host 0.0.0.0 --port ${PORT:-10000} --workers $WEB_CONCURRENCY
@@ -69,3 +69,116 @@ def test_valid_human_request():
     assert j['classification'] in ['AI_GENERATED', 'HUMAN']
     assert 0.0 <= j['confidenceScore'] <= 1.0
     assert isinstance(j['explanation'], str)
+
+
+def test_trace_id_header_on_error_response():
+    r = client.post('/api/voice-detection', json={'language': 'English', 'audioFormat': 'mp3', 'audioBase64': 'A' * 100})
+    assert r.status_code == 401
+    assert len(r.headers['x-trace-id']) == 32
+
+
+def test_ws_binary_session_limit(monkeypatch):
+    import app.main as main
+    monkeypatch.setattr(main, 'WS_MAX_SESSION_BYTES', 1024)
+    with client.websocket_connect(f'/ws/voice?x_api_key={API_KEY}') as ws:
+        ws.send_bytes(b'\x00' * 800)
+        ws.send_bytes(b'\x00' * 800)
+        msg = ws.receive_json()
+    assert msg['status'] == 'error'
+    assert '1024' in msg['message']
+
+
+def test_audio_buffer_grows_geometrically():
+    from app.utils import AudioBuffer
+    buf = AudioBuffer(4)
+    for i in range(10):
+        buf.append(bytes([i]) * 3)
+    assert len(buf) == 30
+    assert buf.capacity == 32
+    assert bytes(buf.view()[:6]) == b'\x00\x00\x00\x01\x01\x01'
+
+
+def test_oversized_body_rejected_before_parsing(monkeypatch):
+    import app.limits as limits
+    monkeypatch.setattr(limits, 'MAX_BODY_BYTES', 1000)
+    payload = {'language': 'English', 'audioFormat': 'mp3', 'audioBase64': 'A' * 2000}
+    r = client.post('/api/voice-detection', json=payload, headers={'x-api-key': API_KEY})
+    assert r.status_code == 413
+    assert r.json()['status'] == 'error'
+
+
+def test_decode_stops_at_max_duration(monkeypatch):
+    import app.utils as utils
+    b64 = synth_mp3_base64()
+    with pytest.raises(utils.AudioTooLongError):
+        utils.b64_to_wav_np(b64, max_seconds=0.5)
+    monkeypatch.setattr(utils, 'AUDIO_OVERLENGTH', 'truncate')
+    y, sr = utils.b64_to_wav_np(b64, max_seconds=0.5)
+    assert len(y) == sr // 2
+
+
+def test_admin_profile_returns_collapsed_stacks():
+    import threading
+    import time
+    stop = threading.Event()
+
+    def spin():
+        while not stop.is_set():
+            time.sleep(0.001)
+
+    t = threading.Thread(target=spin, name='spinner')
+    t.start()
+    try:
+        r = client.get('/admin/profile?seconds=0.2&hz=100', headers={'x-api-key': API_KEY})
+    finally:
+        stop.set()
+        t.join()
+    assert r.status_code == 200
+    body = r.json()
+    assert body['samples'] > 0
+    assert any(line.startswith('spinner;') for line in body['collapsed'].splitlines())
+    assert client.get('/admin/profile?seconds=0', headers={'x-api-key': API_KEY}).status_code == 400
+
+
+def test_thread_budget_split_and_diagnostics(monkeypatch):
+    import asyncio
+    from app import threads
+    from app.threads import ThreadBudget
+    budget = ThreadBudget(cpus=8, workers=4)
+    assert (budget.per_worker, budget.executor_threads, budget.native_threads) == (2, 2, 1)
+    assert ThreadBudget(cpus=8, workers=1, executor_threads=2).native_threads == 4
+    assert ThreadBudget(cpus=2, workers=4).per_worker == 1
+    r = client.get('/admin/threads', headers={'x-api-key': API_KEY})
+    assert r.status_code == 200
+    body = r.json()
+    assert body['budget']['executor_threads'] >= 1 and body['cpus']['usable'] >= 1
+
+    # CPU work gets its own limiter; the default one keeps anyio's size for blocking I/O
+    monkeypatch.setattr(threads, '_cpu_limiter', None)
+    monkeypatch.setattr(threads, '_io_limiter', None)
+
+    async def configure():
+        threads.configure_executor(budget)
+        return threads.diagnostics()['executor']
+    executor = asyncio.run(configure())
+    assert executor['cpuTokens'] == 2 and executor['ioTokens'] == 40
+
+
+def test_sniffed_wav_and_flac_decode_in_process():
+    import soundfile as sf
+    from app.tracing import Trace, trace_scope
+    from app.utils import bytes_to_wav_np, sniff_format
+    sr = 44100
+    y = 0.4 * np.sin(2 * np.pi * 200 * np.arange(sr) / sr)
+    for fmt in ('WAV', 'FLAC'):
+        buf = io.BytesIO()
+        sf.write(buf, y, sr, format=fmt)
+        trace = Trace('test', sampled=True)
+        with trace_scope(trace):
+            out, out_sr = bytes_to_wav_np(buf.getvalue())
+        assert sniff_format(buf.getvalue()) == fmt.lower()
+        assert trace.attrs['decoder'] == 'soundfile'
+        assert out_sr == 16000 and len(out) == 16000
+    assert sniff_format(b'ID3\x04' + b'\x00' * 60) == 'mp3'
+    assert sniff_format(b'\x1a\x45\xdf\xa3' + b'\x00' * 60) == 'webm'
+    assert sniff_format(b'\x00\x00\x00\x20ftypM4A ') == 'mp4'
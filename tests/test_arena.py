@@ -0,0 +1,63 @@
+import io
+import numpy as np
+import soundfile as sf
+from app import features as features_module
+from app.arena import ScratchArena, get_arena, bypass_arena, measure_allocations
+from app.features import extract_features
+from app.utils import load_wav_np
+
+SR = 16000
+
+
+def _clip(seconds):
+    t = np.arange(int(SR * seconds)) / SR
+    rng = np.random.default_rng(0)
+    return (0.4 * np.sin(2 * np.pi * 140 * t) + 0.02 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def test_arena_reuses_grows_and_caps():
+    arena = ScratchArena(max_bytes=4096)
+    a = arena.get('x', 100)
+    assert arena.get('x', 50).base is a.base
+    assert arena.get('x', (10, 10)).shape == (10, 10) and arena.grows == 1
+    arena.get('x', 101)
+    # Grows to double the old size so a slowly increasing size does not reallocate every call
+    assert arena.grows == 2 and arena.nbytes == 200 * 4
+    big = arena.get('y', 2000)
+    assert arena.oversize == 1 and big.shape == (2000,) and arena.nbytes == 800
+
+
+def test_numpy_features_reuse_scratch_and_leave_input_alone(monkeypatch):
+    monkeypatch.setattr(features_module, 'FEATURE_BACKEND', 'numpy')
+    y = _clip(2.0)
+    original = y.copy()
+    extract_features(y, SR)
+    with measure_allocations() as allocs:
+        vec, _ = extract_features(y, SR)
+    np.testing.assert_array_equal(y, original)
+    assert allocs['arena_grows'] == 0 and get_arena().nbytes > 0
+    assert allocs['blocks'] < 1000
+    # What is left is numpy's float64 rfft input and output (about 4x the float32 clip)
+    assert allocs['peak_bytes'] < 6 * y.nbytes
+    assert np.all(np.isfinite(vec))
+
+
+def test_bypass_leaves_the_arena_alone():
+    arena = get_arena()
+    held, grows = arena.nbytes, arena.grows
+    with bypass_arena():
+        extract_features(_clip(3.0), SR)
+        assert arena.get('never-kept', 10).base is None
+    assert (arena.nbytes, arena.grows) == (held, grows) and arena.enabled
+
+
+def test_load_wav_decodes_straight_to_float32():
+    y = _clip(2.0)
+    buf = io.BytesIO()
+    sf.write(buf, np.stack([y, y], axis=1), SR, format='WAV', subtype='PCM_16')
+    wav = buf.getvalue()
+    with measure_allocations() as allocs:
+        data, sr = load_wav_np(wav)
+    assert data.dtype == np.float32 and data.shape == y.shape and sr == SR
+    # Stereo float32 frames plus the mono mix; the float64 read and copy are gone
+    assert allocs['peak_bytes'] < 3.5 * data.nbytes
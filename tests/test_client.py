@@ -0,0 +1,62 @@
+import json
+import asyncio
+import base64
+import threading
+import httpx
+import pytest
+from app.main import app
+from voice_client import AsyncVoiceDetectionClient, VoiceDetectionClient, VoiceDetectionError
+from test_api import synth_mp3_base64, API_KEY
+
+
+def test_async_client_detects_many_in_process():
+    clips = [base64.b64decode(synth_mp3_base64(human=h)) for h in (True, False, True)]
+
+    async def run():
+        async with AsyncVoiceDetectionClient('http://test', API_KEY, transport=httpx.ASGITransport(app=app)) as client:
+            return [r async for r in client.detect_many(clips, 'English', concurrency=2)]
+
+    results = asyncio.run(run())
+    assert len(results) == 3
+    for _, result in results:
+        assert result['classification'] in ('AI_GENERATED', 'HUMAN')
+        assert len(result['traceId']) == 32 and result['modelVersion']
+
+
+def test_sync_client_retries_429_with_retry_after():
+    calls = []
+
+    def handler(request):
+        calls.append(request.headers['x-api-key'])
+        if len(calls) < 3:
+            return httpx.Response(429, headers={'Retry-After': '0'}, json={'status': 'error', 'message': 'slow down'})
+        return httpx.Response(200, headers={'x-trace-id': 't' * 32},
+                              json={'status': 'success', 'classification': 'HUMAN', 'confidenceScore': 0.9})
+
+    with VoiceDetectionClient('http://test', 'k', transport=httpx.MockTransport(handler)) as client:
+        assert client.detect(b'\x00' * 100, 'English')['classification'] == 'HUMAN'
+        assert calls == ['k'] * 3
+        client.max_retries = 0
+        calls.clear()
+        results = list(client.detect_many([b'\x00' * 100], 'English'))
+        assert isinstance(results[0][1], VoiceDetectionError) and results[0][1].status_code == 429
+
+
+def test_stream_rejected_mid_upload_raises_server_message():
+    from websockets.sync.server import serve
+
+    def reject(ws):
+        # What /ws/voice does for a key over its concurrency cap
+        ws.send(json.dumps({'status': 'error', 'message': 'Too many concurrent requests for this API key'}))
+        ws.close(code=1013)
+
+    with serve(reject, '127.0.0.1', 0) as server:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.socket.getsockname()[1]
+        client = VoiceDetectionClient(f'http://127.0.0.1:{port}', 'k')
+        try:
+            with pytest.raises(VoiceDetectionError, match='Too many concurrent'):
+                client.stream(b'\x00' * (8 << 20), chunk_size=1 << 16)
+        finally:
+            client.close()
+            server.shutdown()
@@ -0,0 +1,17 @@
+import asyncio
+import numpy as np
+from app.engine import InferenceEngine, analyze
+
+
+def test_process_pool_matches_inline():
+    t = np.arange(16000, dtype=np.float32) / 16000
+    clip = (0.5 * np.sin(2 * np.pi * 150 * t)).astype(np.float32)
+    expected = analyze(clip, 16000)
+    engine = InferenceEngine(workers=1)
+    try:
+        result = asyncio.run(engine.analyze(clip, 16000))
+    finally:
+        engine.shutdown()
+    assert result['label'] == expected['label']
+    assert abs(result['confidence'] - expected['confidence']) < 1e-6
+    assert result['meta']['model_version'] == expected['meta']['model_version']
@@ -0,0 +1,143 @@
+"""Numerical parity of feature backends against stored golden vectors.
+
+Every backend in BACKENDS is run on a fixed set of deterministic signals. Each of the 12
+features must match the golden value for that backend's reference within FEATURE_TOLERANCES,
+and a reference classifier fitted on the golden synth clips must give the same label.
+An optimised engine is accepted by adding it to BACKENDS with the reference it has to
+reproduce (e.g. 'librosa') and getting this test green.
+
+Regenerate the golden file after an intentional change with:
+    UPDATE_GOLDEN=1 python -m pytest -q tests/test_feature_parity.py
+"""
+import os
+import json
+import numpy as np
+import pytest
+from app import features as features_module
+from app.features import extract_features, FEATURE_KEYS
+from app.simple_model import SimpleLogistic
+from scripts.train import synth_sample
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), 'golden', 'features.json')
+SR = 16000
+
+# backend name -> (golden reference it must reproduce, FEATURE_BACKEND value that selects it)
+BACKENDS = {
+    'librosa': ('librosa', 'librosa'),
+    'numpy': ('numpy', 'numpy'),
+}
+
+# (rtol, atol) per feature; atol covers values that are legitimately near zero
+DEFAULT_TOLERANCE = (1e-4, 1e-6)
+FEATURE_TOLERANCES = {
+    'f0_mean': (1e-3, 1e-3),
+    'f0_std': (1e-3, 1e-3),
+    'jitter': (1e-3, 1e-5),
+    'mfcc_mean_0': (1e-4, 1e-3),
+    'mfcc_std_0': (1e-4, 1e-3),
+    'duration': (0.0, 1e-9),
+    'energy_skew': (1e-3, 1e-9),
+}
+# Reference classifier probabilities may move by this much before the label is at risk
+PROBA_TOLERANCE = 1e-3
+
+
+def _seeded_synth(seed, human):
+    np.random.seed(seed)
+    return synth_sample(human=human)
+
+
+def _tone(freq, seconds, amplitude=0.5):
+    t = np.arange(int(SR * seconds)) / SR
+    return amplitude * np.sin(2 * np.pi * freq * t)
+
+
+def _signals():
+    rng = np.random.default_rng(1234)
+    return {
+        'synth_human_0': _seeded_synth(0, True),
+        'synth_human_1': _seeded_synth(1, True),
+        'synth_human_2': _seeded_synth(2, True),
+        'synth_ai_0': _seeded_synth(10, False),
+        'synth_ai_1': _seeded_synth(11, False),
+        'synth_ai_2': _seeded_synth(12, False),
+        'tone_220': _tone(220, 1.0),
+        'tone_sweep': 0.5 * np.sin(2 * np.pi * (100 + 150 * np.arange(SR) / SR) * np.arange(SR) / SR),
+        'white_noise': 0.1 * rng.standard_normal(SR),
+        'silence': np.zeros(SR),
+        'short_tone': _tone(150, 0.05),
+        'very_short': _tone(150, 0.005),
+    }
+
+
+def _reference_labels(golden):
+    """Labels from a logistic model fitted on one reference's standardised synth vectors."""
+    names = sorted(n for n in golden if n.startswith('synth_'))
+    X = np.array([[golden[n]['features'][k] for k in FEATURE_KEYS] for n in names])
+    y = np.array(['HUMAN' if '_human_' in n else 'AI_GENERATED' for n in names])
+    mean, std = X.mean(axis=0), X.std(axis=0) + 1e-12
+    clf = SimpleLogistic(lr=0.5, n_iter=500).fit((X - mean) / std, y)
+
+    def classify(feats):
+        x = (np.array([[feats[k] for k in FEATURE_KEYS]]) - mean) / std
+        p_ai = float(clf.predict_proba(x)[0, 0])
+        return ('AI_GENERATED' if p_ai >= 0.5 else 'HUMAN'), p_ai
+    return classify
+
+
+def _run_backend(monkeypatch, backend):
+    monkeypatch.setattr(features_module, 'FEATURE_BACKEND', backend)
+    out = {}
+    for name, y in _signals().items():
+        _, feats = extract_features(np.asarray(y, dtype=np.float32), SR)
+        out[name] = {'features': {k: float(feats[k]) for k in FEATURE_KEYS}}
+    return out
+
+
+def _load_golden():
+    with open(GOLDEN_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='module', autouse=True)
+def golden():
+    if os.getenv('UPDATE_GOLDEN') != '1':
+        return _load_golden()
+    mp = pytest.MonkeyPatch()
+    data = {}
+    try:
+        for reference in sorted({ref for ref, _ in BACKENDS.values()}):
+            data[reference] = _run_backend(mp, reference)
+            classify = _reference_labels(data[reference])
+            for entry in data[reference].values():
+                entry['label'], entry['p_ai'] = classify(entry['features'])
+    finally:
+        mp.undo()
+    os.makedirs(os.path.dirname(GOLDEN_PATH), exist_ok=True)
+    with open(GOLDEN_PATH, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    return data
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+def test_backend_matches_golden(backend, golden, monkeypatch):
+    reference, value = BACKENDS[backend]
+    if value == 'librosa' and not features_module._HAS_LIBROSA:
+        pytest.skip('librosa not installed')
+    expected = golden[reference]
+    got = _run_backend(monkeypatch, value)
+    classify = _reference_labels(expected)
+    assert set(got) == set(expected)
+
+    mismatches = []
+    for name, entry in got.items():
+        for k in FEATURE_KEYS:
+            rtol, atol = FEATURE_TOLERANCES.get(k, DEFAULT_TOLERANCE)
+            g, e = entry['features'][k], expected[name]['features'][k]
+            if not np.isclose(g, e, rtol=rtol, atol=atol):
+                mismatches.append(f'{name}.{k}: got {g!r}, golden {e!r}')
+        label, p_ai = classify(entry['features'])
+        if label != expected[name]['label'] or abs(p_ai - expected[name]['p_ai']) > PROBA_TOLERANCE:
+            mismatches.append(f'{name}: classified {label} (p_ai={p_ai:.4f}), golden '
+                              f'{expected[name]["label"]} (p_ai={expected[name]["p_ai"]:.4f})')
+    assert not mismatches, '\n'.join(mismatches)
@@ -0,0 +1,82 @@
+import os
+import json
+import joblib
+import pytest
+import numpy as np
+from app import model, feedback
+from app.features import FEATURE_KEYS
+from app.simple_model import SimpleLogistic
+
+
+def _features(value):
+    return {k: value for k in FEATURE_KEYS}
+
+
+def test_feedback_publishes_partial_fit_version(tmp_path, monkeypatch):
+    path = str(tmp_path / 'model.joblib')
+    X = np.vstack([np.zeros((4, 12)), np.ones((4, 12))])
+    y = np.array(['HUMAN'] * 4 + ['AI_GENERATED'] * 4)
+    joblib.dump({'model': SimpleLogistic(n_iter=50).fit(X, y), 'meta': {'version': 'v1'}}, path)
+    monkeypatch.setattr(model, 'MODEL_PATH', path)
+    monkeypatch.setattr(model, '_active', None)
+    monkeypatch.setattr(model, '_previous', None)
+    monkeypatch.setattr(model, '_seen_signature', None)
+    monkeypatch.setattr(model, 'MODEL_CONTROL_PATH', str(tmp_path / 'model.control'))
+    store = feedback.FeedbackStore(str(tmp_path / 'feedback.sqlite3'))
+
+    store.record_verdict('t1', _features(1.0), 'AI_GENERATED', 'v1')
+    store.record_verdict('t2', _features(1.0), 'AI_GENERATED', 'v1')
+    assert store.add_feedback('missing', 'HUMAN') is None
+    assert store.add_feedback('t1', 'HUMAN') == {'label': 'AI_GENERATED', 'model_version': 'v1', 'profile': 'accurate'}
+    assert feedback.run_update(store, min_batch=2) is None
+    # Fast-profile features and language-model verdicts never train the global model
+    store.record_verdict('f1', _features(1.0), 'AI_GENERATED', 'fast-v1', 'fast', 'Tamil', 'fast')
+    store.record_verdict('l1', _features(1.0), 'AI_GENERATED', 'tamil-v1', 'accurate', 'Tamil', 'language')
+    store.add_feedback('f1', 'HUMAN')
+    store.add_feedback('l1', 'HUMAN')
+    assert store.pending() == 1 and len(store.labelled_since()[1]) == 1
+
+    store.add_feedback('t2', 'HUMAN')
+    before = model.predict(np.ones(12, dtype=np.float32))[2]['class_probs']['HUMAN']
+    assert feedback.run_update(store, min_batch=2) == 'v1+fb4'
+    label, _, meta = model.predict(np.ones(12, dtype=np.float32))
+    assert meta['model_version'] == 'v1+fb4'
+    assert meta['class_probs']['HUMAN'] > before
+    assert model.active_model().meta['feedback_through'] == 4
+    assert feedback.run_update(store, min_batch=1) is None
+    # Published as its own file and announced to the other workers; MODEL_PATH is untouched
+    published = feedback.published_path('v1+fb4')
+    assert model.active_model().path == published == str(tmp_path / 'model.v1+fb4.joblib')
+    assert joblib.load(published)['meta']['version'] == 'v1+fb4'
+    assert joblib.load(path)['meta']['version'] == 'v1'
+    with open(model.MODEL_CONTROL_PATH) as f:
+        assert json.load(f)['path'] == published
+
+
+def test_refit_refuses_without_base_features(tmp_path, monkeypatch):
+    path = str(tmp_path / 'model.joblib')
+    X = np.vstack([np.zeros((4, 12)), np.ones((4, 12))])
+    y = np.array(['HUMAN'] * 4 + ['AI_GENERATED'] * 4)
+    joblib.dump({'model': SimpleLogistic(n_iter=50).fit(X, y), 'meta': {'version': 'v1'}}, path)
+    monkeypatch.setattr(model, 'MODEL_PATH', path)
+    monkeypatch.setattr(model, '_active', None)
+    monkeypatch.setattr(feedback, 'FEEDBACK_UPDATE_MODE', 'refit')
+    monkeypatch.setattr(feedback, 'FEEDBACK_BASE_FEATURES', str(tmp_path / 'missing.npz'))
+    store = feedback.FeedbackStore(str(tmp_path / 'feedback.sqlite3'))
+    for i, label in enumerate(('HUMAN', 'AI_GENERATED')):
+        store.record_verdict(f't{i}', _features(float(i)), label, 'v1')
+        store.add_feedback(f't{i}', label)
+    with pytest.raises(FileNotFoundError):
+        feedback.run_update(store, min_batch=1)
+    assert model.active_model().version == 'v1'
+    assert not any('+fb' in p for p in os.listdir(tmp_path))
+
+
+def test_verdicts_are_capped_but_labels_kept(tmp_path):
+    store = feedback.FeedbackStore(str(tmp_path / 'data' / 'feedback.sqlite3'), max_verdicts=3)
+    for i in range(5):
+        store.record_verdict(f't{i}', _features(float(i)), 'HUMAN', 'v1')
+    store.add_feedback('t0', 'AI_GENERATED')
+    store.prune()
+    traces = [t for (t,) in store._conn().execute('SELECT trace_id FROM verdicts ORDER BY created')]
+    assert traces == ['t2', 't3', 't4'] and store.pending() == 1
@@ -0,0 +1,125 @@
+import os
+import time
+import asyncio
+import subprocess
+import sys
+from fastapi.testclient import TestClient
+from app import jobs
+from app.jobs import JobStore, QueueFull
+from test_api import synth_mp3_base64
+
+API_KEY = os.getenv('API_KEY', 'testkey')
+
+
+def test_claim_order_leases_and_retention(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    low = store.submit(b'a', 'Tamil', 'accurate', 1, 'k')
+    high = store.submit(b'b', 'Tamil', 'accurate', 9, 'k')
+    second = store.submit(b'c', 'Tamil', 'accurate', 9, 'k')
+    assert store.position(store.get(low)) == 2
+    try:
+        store.submit(b'd', 'Tamil', 'accurate', 5, 'k', max_queued=3)
+        assert False, 'queue cap not enforced'
+    except QueueFull:
+        pass
+
+    job, audio = store.claim()
+    assert (job['jobId'], audio) == (high, b'b')
+    store.finish(high, {'classification': 'HUMAN'})
+    assert store.get(high)['result'] == {'classification': 'HUMAN'}
+
+    # An expired lease is requeued until the job runs out of attempts
+    job, _ = store.claim(lease=-1)
+    assert job['jobId'] == second
+    for attempt in range(2, 4):
+        job, _ = store.claim(lease=-1)
+        assert job['jobId'] == second and job['attempts'] == attempt
+    job, _ = store.claim()
+    assert job['jobId'] == low
+    failed = store.get(second)
+    assert failed['state'] == 'failed' and 'Abandoned' in failed['error']
+
+    assert store.prune(retention=-1) == 2
+    assert store.get(high) is None and store.get(low)['state'] == 'running'
+
+
+def test_heartbeat_extends_lease_and_finish_checks_owner(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    job_id = store.submit(b'a', 'Tamil', 'accurate', 5, 'k')
+    store.claim(lease=-1)
+    assert store.heartbeat(job_id, lease=60)
+    # Renewed, so another worker's claim leaves it running
+    assert store.claim() is None and store.get(job_id)['state'] == 'running'
+
+    # Taken over by another process after its lease ran out: the old owner's result is dropped
+    store._conn().execute("UPDATE jobs SET owner_token = 'other'")
+    assert not store.heartbeat(job_id)
+    assert not store.finish(job_id, {'classification': 'HUMAN'})
+    assert store.get(job_id)['state'] == 'running'
+
+
+def _orphan(store, pid):
+    # As left behind by a process with this pid that has since died
+    store._conn().execute('UPDATE jobs SET owner_pid = ?, owner_token = ?', (pid, f'{jobs._BOOT_ID}:{pid}:1'))
+
+
+def test_recover_requeues_jobs_of_dead_process(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    job_id = store.submit(b'a', 'Hindi', 'fast', 5, 'k')
+    store.claim()
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+    _orphan(store, dead.pid)
+    store.recover(max_attempts=2)
+    job = store.get(job_id)
+    assert job['state'] == 'queued' and job['attempts'] == 1
+
+    # A job that keeps crashing its worker is failed once it is out of attempts
+    store.claim()
+    _orphan(store, dead.pid)
+    store.recover(max_attempts=2)
+    job = store.get(job_id)
+    assert job['state'] == 'failed' and 'Abandoned' in job['error']
+
+    # Graceful shutdown does not count the claim
+    other = store.submit(b'b', 'Hindi', 'fast', 5, 'k')
+    store.claim()
+    store.requeue_owned()
+    assert store.get(other)['attempts'] == 0
+
+
+def test_submit_process_and_poll(tmp_path, monkeypatch):
+    from app.main import app
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    monkeypatch.setattr(jobs, '_store', store)
+    client = TestClient(app)
+    headers = {'x-api-key': API_KEY}
+    r = client.post('/api/jobs', headers=headers, json={
+        'language': 'English', 'audioFormat': 'mp3', 'audioBase64': synth_mp3_base64(), 'priority': 7})
+    assert r.status_code == 202
+    job_id = r.json()['jobId']
+    assert r.headers['location'] == f'/api/jobs/{job_id}'
+
+    started = time.monotonic()
+    r = client.get(f'/api/jobs/{job_id}?wait=0.3', headers=headers)
+    assert r.json()['state'] == 'queued' and r.json()['position'] == 0
+    assert time.monotonic() - started >= 0.3
+
+    job, audio = store.claim()
+    asyncio.run(jobs.process_job(store, job, audio))
+    body = client.get(f'/api/jobs/{job_id}?wait=5', headers=headers).json()
+    assert body['state'] == 'done' and body['priority'] == 7
+    assert body['result']['classification'] in ('AI_GENERATED', 'HUMAN')
+    assert 'keyId' not in body
+    assert client.get('/api/jobs/unknown', headers=headers).status_code == 404
+
+
+def test_recover_does_not_trust_a_reused_pid(tmp_path):
+    # After a container restart the dead owner's pid can belong to a live process (here: this one)
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    job_id = store.submit(b'a', 'Hindi', 'fast', 5, 'k')
+    store.claim()
+    _orphan(store, os.getpid())
+    store.recover()
+    assert store.get(job_id)['state'] == 'queued'
+    assert jobs.process_token(os.getpid()) == jobs.owner_token()
@@ -0,0 +1,212 @@
+import os
+import json
+import threading
+import joblib
+import numpy as np
+from app import model
+from app.simple_model import SimpleLogistic
+
+
+def _dump(path, version):
+    X = np.vstack([np.zeros((4, 12)), np.ones((4, 12))])
+    y = np.array(['HUMAN'] * 4 + ['AI_GENERATED'] * 4)
+    joblib.dump({'model': SimpleLogistic(n_iter=50).fit(X, y), 'meta': {'version': version}}, path)
+    # make sure the signature changes even on coarse-mtime filesystems
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + hash(version) % 10**9 + 1))
+
+
+def test_reload_swaps_and_rollback_restores(tmp_path, monkeypatch):
+    path = str(tmp_path / 'model.joblib')
+    _dump(path, 'v1')
+    monkeypatch.setattr(model, 'MODEL_PATH', path)
+    monkeypatch.setattr(model, '_active', None)
+    monkeypatch.setattr(model, '_previous', None)
+    monkeypatch.setattr(model, '_seen_signature', None)
+
+    assert model.active_model().version == 'v1'
+    assert model.reload_model() is False
+
+    _dump(path, 'v2')
+    assert model.reload_model() is True
+    _, _, meta = model.predict(np.zeros(12, dtype=np.float32))
+    assert meta['model_version'] == 'v2'
+
+    assert model.rollback_model() is True
+    assert model.model_status()['active']['version'] == 'v1'
+    assert model.model_status()['previous']['version'] == 'v2'
+
+
+def test_cascade_skips_pitch_when_stage1_is_confident(monkeypatch):
+    from app.features import CHEAP_FEATURE_KEYS
+    rng = np.random.default_rng(0)
+    y_labels = np.array(['HUMAN'] * 4 + ['AI_GENERATED'] * 4)
+    full = SimpleLogistic(n_iter=50).fit(rng.normal(size=(8, 12)), y_labels)
+    stage1 = SimpleLogistic(n_iter=50).fit(rng.normal(size=(8, len(CHEAP_FEATURE_KEYS))), y_labels)
+    monkeypatch.setattr(model, '_active', model.LoadedModel(full, {}, 'vc', 'mem', None, stage1=stage1))
+    monkeypatch.setattr(model.fingerprint, 'FINGERPRINT_ENABLED', False)
+    clip = 0.5 * np.sin(2 * np.pi * 150 * np.arange(8000) / 16000)
+
+    monkeypatch.setattr(model, 'CASCADE_THRESHOLD', '0.0')
+    _, _, meta, features = model.classify(clip, 16000)
+    assert meta['stage'] == 1
+    assert 'f0_mean' not in features
+
+    monkeypatch.setattr(model, 'CASCADE_THRESHOLD', '1.01')
+    _, _, meta, features = model.classify(clip, 16000)
+    assert meta['stage'] == 2
+    assert 'f0_mean' in features
+
+
+def test_fingerprint_match_returns_cached_verdict(monkeypatch):
+    from app import fingerprint
+    rng = np.random.default_rng(1)
+    full = SimpleLogistic(n_iter=50).fit(rng.normal(size=(8, 12)), np.array(['HUMAN'] * 4 + ['AI_GENERATED'] * 4))
+    monkeypatch.setattr(model, '_active', model.LoadedModel(full, {}, 'vf', 'mem', None))
+    monkeypatch.setattr(fingerprint, '_index', fingerprint.FingerprintIndex(max_entries=10, snapshot_path=''))
+    # a sequence of random harmonic notes, like a short utterance
+    sr, seg = 16000, 2400
+    t = np.arange(seg) / sr
+    clip = np.concatenate([sum(np.sin(2 * np.pi * f * h * t) / h for h in range(1, 5))
+                           for f in rng.uniform(100, 300, 20)]).astype(np.float32) * 0.2
+
+    label, confidence, meta, _ = model.classify(clip, sr)
+    assert meta['fingerprint_match'] is False
+    # quieter, trimmed replay of the same utterance
+    label2, confidence2, meta2, _ = model.classify(0.5 * clip[1000:], sr)
+    assert meta2['fingerprint_match'] is True
+    assert (label2, confidence2) == (label, confidence)
+
+
+def test_fingerprint_index_is_bounded_by_hashes():
+    from app import fingerprint
+    rng = np.random.default_rng(2)
+    S = np.abs(rng.normal(size=(513, 400))) ** 4
+    assert len(fingerprint.compute_fingerprint(S, max_hashes=50)) == 50
+    fp = fingerprint.compute_fingerprint(S, max_hashes=100)
+    index = fingerprint.FingerprintIndex(max_entries=100, snapshot_path='', max_hashes=250)
+    for i in range(3):
+        index.add(fp, {'label': str(i)})
+    assert len(index) == 2 and index.hashes == 200
+    assert index.query(fp)[0]['label'] in ('1', '2')
+
+
+def test_unfingerprinted_analysis_leaves_index_alone(monkeypatch):
+    from app import fingerprint
+    index = fingerprint.FingerprintIndex(max_entries=10, snapshot_path='')
+    monkeypatch.setattr(fingerprint, '_index', index)
+    clip = (0.2 * np.sin(2 * np.pi * 150 * np.arange(32000) / 16000)).astype(np.float32)
+    model.classify(clip, 16000, fingerprinting=False)
+    assert len(index) == 0 and index.hashes == 0
+
+
+def test_language_registry_lazy_loads_and_evicts(tmp_path, monkeypatch):
+    global_path = str(tmp_path / 'model.joblib')
+    _dump(global_path, 'global')
+    monkeypatch.setattr(model, 'MODEL_PATH', global_path)
+    monkeypatch.setattr(model, '_active', None)
+    langs = tmp_path / 'languages'
+    langs.mkdir()
+    _dump(str(langs / 'tamil.joblib'), 'ta1')
+    _dump(str(langs / 'hindi.joblib'), 'hi1')
+    size = os.path.getsize(langs / 'tamil.joblib')
+    registry = model.ModelRegistry(str(langs), budget_mb=1.5 * size / (1024 * 1024))
+    monkeypatch.setattr(model, '_registry', registry)
+
+    assert registry.describe() == {}
+    assert model.model_for('Tamil').version == 'ta1'
+    assert model.model_for('English').version == 'global'
+    assert model.model_for(None).version == 'global'
+    assert model.model_for('Hindi').version == 'hi1'
+    # only one artifact fits the budget, so Tamil was evicted when Hindi loaded
+    assert list(registry.describe()) == ['Hindi']
+
+    _dump(str(langs / 'hindi.joblib'), 'hi2')
+    registry.refresh()
+    assert model.model_for('Hindi').version == 'hi2'
+
+
+def test_language_registry_serves_resident_models_during_a_cold_load(tmp_path, monkeypatch):
+    langs = tmp_path / 'languages'
+    langs.mkdir()
+    _dump(str(langs / 'tamil.joblib'), 'ta1')
+    _dump(str(langs / 'hindi.joblib'), 'hi1')
+    registry = model.ModelRegistry(str(langs), budget_mb=64)
+    assert registry.get('Tamil').version == 'ta1'
+
+    reads = []
+    started, release = threading.Event(), threading.Event()
+    read_artifact = model._read_artifact
+
+    def slow_read(path):
+        reads.append(path)
+        started.set()
+        assert release.wait(10)
+        return read_artifact(path)
+
+    monkeypatch.setattr(model, '_read_artifact', slow_read)
+    results = []
+    loaders = [threading.Thread(target=lambda: results.append(registry.get('Hindi'))) for _ in range(2)]
+    for t in loaders:
+        t.start()
+    assert started.wait(10)
+    # Hindi is mid-load; Tamil is still served without waiting for it
+    assert registry.get('Tamil').version == 'ta1'
+    assert registry.describe().keys() == {'Tamil'}
+    release.set()
+    for t in loaders:
+        t.join(10)
+    assert [r.version for r in results] == ['hi1', 'hi1']
+    assert len(reads) == 1
+
+
+def test_control_loads_exact_artifact_on_worker_without_previous(tmp_path, monkeypatch):
+    path = str(tmp_path / 'model.joblib')
+    old = str(tmp_path / 'model.v1.joblib')
+    _dump(old, 'v1')
+    _dump(path, 'v2')
+    monkeypatch.setattr(model, 'MODEL_PATH', path)
+    monkeypatch.setattr(model, 'MODEL_CONTROL_PATH', str(tmp_path / 'model.control'))
+    monkeypatch.setattr(model, '_active', None)
+    monkeypatch.setattr(model, '_previous', None)
+    monkeypatch.setattr(model, '_seen_signature', None)
+    assert model.active_model().version == 'v2'
+
+    # Another worker rolled back to v1, which this worker never had in memory
+    model.write_model_control(model._read_artifact(old))
+    with open(model.MODEL_CONTROL_PATH) as f:
+        control = json.load(f)
+    assert control['path'] == old
+    model._apply_control(control)
+    assert model.active_model().version == 'v1'
+    # The watcher's MODEL_PATH poll does not undo it
+    assert model.reload_model() is False and model.active_model().version == 'v1'
+
+    # A control whose artifact has been replaced since is refused instead of loading another version
+    model._apply_control({'version': 'v2', 'path': path})
+    _dump(old, 'v3')
+    model._apply_control(dict(control, version='v1b'))
+    assert model.active_model().version == 'v2'
+    assert 'has changed' in model.model_status()['lastError']
+
+
+def test_secondary_refresh_picks_up_new_fast_and_language_artifacts(tmp_path, monkeypatch):
+    # What pool processes run instead of the watcher thread
+    fast_path = str(tmp_path / 'model_fast.joblib')
+    _dump(fast_path, 'fast-v1')
+    monkeypatch.setattr(model, 'MODEL_PATH_FAST', fast_path)
+    monkeypatch.setattr(model, '_fast', None)
+    monkeypatch.setattr(model, '_fast_missing', False)
+    registry = model.ModelRegistry(str(tmp_path))
+    monkeypatch.setattr(model, '_registry', registry)
+    monkeypatch.setattr(model, '_secondary_checked', float('-inf'))
+    assert model.fast_model().version == 'fast-v1' and registry.get('Tamil') is None
+
+    _dump(fast_path, 'fast-v2')
+    _dump(str(tmp_path / 'tamil.joblib'), 'tamil-v1')
+    model.refresh_secondary_models(interval=3600)
+    assert model.fast_model().version == 'fast-v2' and registry.get('Tamil').version == 'tamil-v1'
+    # Throttled: the next lookup within the interval does not stat the artifacts again
+    _dump(fast_path, 'fast-v3')
+    model.refresh_secondary_models(interval=3600)
+    assert model.fast_model().version == 'fast-v2'
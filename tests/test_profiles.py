@@ -0,0 +1,40 @@
+import numpy as np
+from app import model, profiles
+from app.simple_model import SimpleLogistic
+
+
+def test_governor_downgrades_unpinned_requests_under_load():
+    gov = profiles.LoadGovernor(max_inflight=2, p95_ms=50, window=30)
+    assert gov.choose(None) == ('accurate', False)
+    with gov.track('accurate'), gov.track('accurate'):
+        assert gov.choose('auto') == ('fast', True)
+        assert gov.choose('accurate') == ('accurate', False)
+    assert gov.choose(None) == ('accurate', False)
+    now = profiles.time.monotonic()
+    gov._latencies.extend((now, 100.0) for _ in range(20))
+    assert gov.p95_ms() == 100.0
+    assert gov.choose(None) == ('fast', True)
+    gov.window = 0
+    assert gov.p95_ms() is None
+
+
+def test_fast_profile_uses_fast_model(monkeypatch):
+    X = np.vstack([np.zeros((4, 12)), np.ones((4, 12))])
+    y = np.array(['HUMAN'] * 4 + ['AI_GENERATED'] * 4)
+    fast = model.LoadedModel(SimpleLogistic(n_iter=50).fit(X, y), {}, 'fast-v1', 'mem', None)
+    monkeypatch.setattr(model, '_fast', fast)
+    clip = 0.5 * np.sin(2 * np.pi * 150 * np.arange(16000) / 16000)
+    _, _, meta, features = model.classify(clip, 16000, profile='fast')
+    assert meta['model_version'] == 'fast-v1'
+    assert meta['profile'] == 'fast'
+    assert 140 < features['f0_mean'] < 160
+
+
+def test_missing_fast_model_serves_accurate_without_training(tmp_path, monkeypatch):
+    monkeypatch.setattr(model, 'MODEL_PATH_FAST', str(tmp_path / 'model_fast.joblib'))
+    monkeypatch.setattr(model, '_fast', None)
+    monkeypatch.setattr(model, '_fast_missing', False)
+    clip = 0.5 * np.sin(2 * np.pi * 150 * np.arange(16000) / 16000)
+    _, _, meta, _ = model.classify(clip, 16000, profile='fast')
+    assert meta['profile'] == 'accurate' and meta['model_version'] == model.active_model().version
+    assert not (tmp_path / 'model_fast.joblib').exists()
@@ -0,0 +1,76 @@
+import os
+import time
+import sqlite3
+import pytest
+from fastapi import HTTPException
+from app.auth import KeyPolicy, validate_api_key
+from app.ratelimit import RateLimiter
+
+
+def test_token_bucket_exhausts_burst(tmp_path):
+    limiter = RateLimiter(str(tmp_path / 'rl.sqlite3'))
+    policy = KeyPolicy('tenant', rate=0.01, burst=2, max_concurrent=0)
+    limiter.release(limiter.acquire(policy))
+    limiter.release(limiter.acquire(policy))
+    with pytest.raises(HTTPException) as e:
+        limiter.acquire(policy)
+    assert e.value.status_code == 429
+    assert 'Retry-After' in e.value.headers
+
+
+def test_concurrency_cap_is_shared_between_limiters(tmp_path):
+    path = str(tmp_path / 'rl.sqlite3')
+    a, b = RateLimiter(path), RateLimiter(path)
+    policy = KeyPolicy('tenant', rate=0, max_concurrent=1)
+    lease = a.acquire(policy)
+    with pytest.raises(HTTPException) as e:
+        b.acquire(policy)
+    assert e.value.status_code == 429
+    a.release(lease)
+    b.release(b.acquire(policy))
+
+
+def test_lease_refresh_and_sqlite_errors(tmp_path, monkeypatch):
+    limiter = RateLimiter(str(tmp_path / 'rl.sqlite3'), lease_ttl=1)
+    policy = KeyPolicy('tenant', rate=0, max_concurrent=1)
+    lease = limiter.acquire(policy)
+    limiter.lease_ttl = 60
+    limiter.refresh(lease)
+    (expires,) = limiter._conn().execute('SELECT expires FROM leases WHERE id = ?', (lease,)).fetchone()
+    assert expires > time.time() + 30
+
+    def broken():
+        raise sqlite3.OperationalError('database is locked')
+    monkeypatch.setattr(limiter, '_conn', broken)
+    with pytest.raises(HTTPException) as e:
+        limiter.acquire(policy)
+    assert e.value.status_code == 503 and e.value.headers['Retry-After'] == '1'
+    # A failed release is left to the TTL instead of failing the request
+    limiter.release(lease)
+
+
+def test_validate_api_key_returns_policy():
+    policy = validate_api_key(os.getenv('API_KEY', 'testkey'))
+    assert policy.key_id == 'default'
+    # The operator key keeps the unlimited behaviour existing clients rely on
+    assert policy.rate == 0 and policy.max_concurrent == 0
+    with pytest.raises(HTTPException) as e:
+        validate_api_key('nope')
+    assert e.value.status_code == 403
+
+
+def test_feedback_requires_labeller_or_admin_key(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app import auth
+    from app.main import app
+    registry = list(auth.load_key_registry())
+    registry.append((auth._digest('tenant-key'), KeyPolicy('tenant')))
+    registry.append((auth._digest('labeller-key'), KeyPolicy('labeller', labeller=True)))
+    monkeypatch.setattr(auth, '_registry', registry)
+    client = TestClient(app)
+    body = {'traceId': 'no-such-trace', 'label': 'HUMAN'}
+    assert client.post('/api/feedback', json=body, headers={'x-api-key': 'tenant-key'}).status_code == 403
+    # Authorised keys get past the check (the trace id is unknown, hence 404)
+    assert client.post('/api/feedback', json=body, headers={'x-api-key': 'labeller-key'}).status_code == 404
+    assert client.post('/api/feedback', json=body,
+                       headers={'x-api-key': os.getenv('API_KEY', 'testkey')}).status_code == 404
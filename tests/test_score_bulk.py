@@ -0,0 +1,34 @@
+import json
+import numpy as np
+import soundfile as sf
+from app.utils import MAX_AUDIO_SECONDS
+from scripts.score_bulk import run, score_file
+
+
+def test_bulk_scoring_resumes_from_checkpoint(tmp_path):
+    audio = tmp_path / 'audio'
+    audio.mkdir()
+    t = np.arange(16000) / 16000
+    for i, f0 in enumerate((120, 150)):
+        sf.write(str(audio / f'clip{i}.wav'), 0.5 * np.sin(2 * np.pi * f0 * t), 16000)
+    (audio / 'broken.mp3').write_bytes(b'not audio')
+    out = str(tmp_path / 'results.jsonl')
+
+    stats = run(str(audio), out, workers=1)
+    assert stats['processed'] == 3 and stats['errors'] == 1
+    rows = [json.loads(line) for line in open(out)]
+    assert sorted(r['status'] for r in rows) == ['error', 'success', 'success']
+    assert all(r['classification'] in ('AI_GENERATED', 'HUMAN') for r in rows if r['status'] == 'success')
+
+    stats = run(str(audio), out, workers=1)
+    assert stats['processed'] == 0 and stats['skipped'] == 3
+
+
+def test_bulk_scoring_has_no_request_duration_cap(tmp_path):
+    path = str(tmp_path / 'long.wav')
+    t = np.arange(int(16000 * (MAX_AUDIO_SECONDS + 1))) / 16000
+    sf.write(path, 0.5 * np.sin(2 * np.pi * 150 * t), 16000)
+    result = score_file(path)
+    assert result['status'] == 'success' and result['duration'] > MAX_AUDIO_SECONDS
+    result = score_file(path, max_seconds=10)
+    assert result['status'] == 'error' and 'AudioTooLongError' in result['error']
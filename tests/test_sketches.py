@@ -0,0 +1,66 @@
+import os
+import json
+import numpy as np
+from fastapi.testclient import TestClient
+from app import sketches
+from app.sketches import QuantileSketch, Histogram, FeatureSketches
+from app.features import FEATURE_KEYS
+
+API_KEY = os.getenv('API_KEY', 'testkey')
+
+
+def test_quantiles_within_relative_accuracy_and_merge_is_exact():
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.lognormal(0, 2, 5000), -rng.lognormal(1, 1, 2000), np.zeros(100)])
+    whole, a, b = QuantileSketch(0.01), QuantileSketch(0.01), QuantileSketch(0.01)
+    for i, v in enumerate(values):
+        whole.add(v)
+        (a if i % 2 else b).add(v)
+    a.merge(b)
+    a = QuantileSketch.from_dict(json.loads(json.dumps(a.to_dict())))
+    ordered = np.sort(values)
+    for q in (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+        exact = ordered[int(q * (len(values) - 1))]
+        assert a.quantile(q) == whole.quantile(q)
+        assert abs(a.quantile(q) - exact) <= 0.01 * abs(exact) + 1e-12
+    whole.add(float('nan'))
+    assert whole.nonfinite == 1 and whole.count == len(values)
+
+
+def test_bucket_cap_and_histogram_edges():
+    sketch = QuantileSketch(0.01, max_buckets=50)
+    for v in np.geomspace(1e-6, 1e6, 2000):
+        sketch.add(v)
+    assert len(sketch.pos) <= 50
+    # Only the low tail is folded; upper quantiles keep their accuracy
+    exact = np.geomspace(1e-6, 1e6, 2000)[1979]
+    assert abs(sketch.quantile(0.99) - exact) <= 0.01 * exact
+    hist = Histogram(0.0, 1.0, 4)
+    for v in (0.0, 0.3, 0.5, 1.0, 1.2, -0.1):
+        hist.add(v)
+    assert hist.counts == [1, 1, 1, 1] and hist.over == 1 and hist.under == 1
+
+
+def test_feature_stats_merges_worker_snapshots(tmp_path, monkeypatch):
+    from app.main import app
+    monkeypatch.setattr(sketches, 'SKETCH_DIR', str(tmp_path))
+    monkeypatch.setattr(sketches, '_sketches', FeatureSketches())
+    features = {k: 1.0 for k in FEATURE_KEYS}
+    sketches.observe_result('Tamil', 'accurate', {'features': features, 'confidence': 0.9, 'label': 'HUMAN'})
+    # Another worker's snapshot on the same host
+    other = FeatureSketches()
+    other.observe('Tamil', 'accurate', dict(features, f0_mean=200.0), 0.2, 'AI_GENERATED')
+    other.observe('Hindi', 'fast', features, 0.6, 'HUMAN')
+    data = other.to_dict()
+    data['pid'] = -1
+    (tmp_path / 'sketch-99999999.json').write_text(json.dumps(data))
+
+    r = TestClient(app).get('/admin/feature-stats', headers={'x-api-key': API_KEY})
+    assert r.status_code == 200
+    body = r.json()
+    assert -1 in body['workers'] and os.getpid() in body['workers']
+    tamil = body['languages']['Tamil']['accurate']
+    assert tamil['count'] == 2 and tamil['labels'] == {'HUMAN': 1, 'AI_GENERATED': 1}
+    assert tamil['features']['f0_mean']['max'] == 200.0
+    assert sum(tamil['confidence']['histogram']['counts']) == 2
+    assert body['languages']['Hindi']['fast']['count'] == 1
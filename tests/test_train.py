@@ -0,0 +1,30 @@
+import numpy as np
+import scripts.train as train
+
+
+def test_feature_cache_skips_extraction(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_build(n, profile='accurate'):
+        calls.append(n)
+        return np.arange(n * 12, dtype=float).reshape(n, 12), np.array(['HUMAN', 'AI_GENERATED'] * (n // 2))
+
+    monkeypatch.setattr(train, 'build_dataset', fake_build)
+    cache = str(tmp_path / 'features.npz')
+    X1, y1 = train.load_or_build_dataset(n=4, cache_path=cache)
+    X2, y2 = train.load_or_build_dataset(n=4, cache_path=cache)
+    assert calls == [4]
+    assert np.array_equal(X1, X2) and list(y1) == list(y2)
+    train.load_or_build_dataset(n=6, cache_path=cache)
+    assert calls == [4, 6]
+
+
+def test_select_model_respects_latency_budget():
+    results = [
+        {'params': {'n_estimators': 200}, 'accuracy': 0.99, 'latency_us': 9000.0},
+        {'params': {'n_estimators': 50}, 'accuracy': 0.97, 'latency_us': 2500.0},
+        {'params': {'n_estimators': 25}, 'accuracy': 0.97, 'latency_us': 1200.0},
+    ]
+    assert train.select_model(results, 5000)['params'] == {'n_estimators': 25}
+    assert train.select_model(results, 10000)['params'] == {'n_estimators': 200}
+    assert train.select_model(results, 100)['params'] == {'n_estimators': 25}
@@ -0,0 +1,9 @@
+"""Python client for the AI voice detection service.
+
+    from voice_client import VoiceDetectionClient
+    with VoiceDetectionClient('http://localhost:8000', 'testkey') as client:
+        print(client.detect('clip.mp3', 'English'))
+"""
+from voice_client.client import AsyncVoiceDetectionClient, VoiceDetectionClient, VoiceDetectionError
+
+__all__ = ['AsyncVoiceDetectionClient', 'VoiceDetectionClient', 'VoiceDetectionError']
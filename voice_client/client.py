@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import random
+import base64
+import asyncio
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import httpx
+
+DEFAULT_TIMEOUT = 60.0
+# Statuses worth retrying: rate limited / over the concurrency cap, and temporarily unavailable
+RETRY_STATUSES = (429, 503)
+STREAM_CHUNK_BYTES = 32 * 1024
+
+
+class VoiceDetectionError(Exception):
+    """A request the service rejected (or that still failed after retries)."""
+
+    def __init__(self, message, status_code=None, trace_id=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.trace_id = trace_id
+
+
+def _read_audio(audio) -> bytes:
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return bytes(audio)
+    with open(audio, 'rb') as f:
+        return f.read()
+
+
+def _payload(audio_bytes: bytes, language: str, audio_format: str) -> dict:
+    return {'language': language, 'audioFormat': audio_format,
+            'audioBase64': base64.b64encode(audio_bytes).decode('ascii')}
+
+
+def _headers(profile):
+    return {'x-processing-profile': profile} if profile else {}
+
+
+def _retry_delay(response, attempt, backoff_base, backoff_max) -> float:
+    # Honour Retry-After (seconds) when present, else exponential backoff with full jitter
+    if response is not None:
+        retry_after = response.headers.get('retry-after')
+        if retry_after:
+            try:
+                return min(backoff_max, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+    return random.uniform(0, min(backoff_max, backoff_base * (2 ** attempt)))
+
+
+def _result(response) -> dict:
+    try:
+        body = response.json()
+    except ValueError:
+        body = {'status': 'error', 'message': response.text}
+    if response.status_code >= 400 or body.get('status') != 'success':
+        raise VoiceDetectionError(body.get('message') or f'HTTP {response.status_code}',
+                                  status_code=response.status_code, trace_id=response.headers.get('x-trace-id'))
+    for key, header in (('traceId', 'x-trace-id'), ('modelVersion', 'x-model-version'),
+                        ('profile', 'x-processing-profile')):
+        if header in response.headers:
+            body.setdefault(key, response.headers[header])
+    return body
+
+
+def _ws_url(base_url, api_key, language, profile):
+    url = base_url.rstrip('/').replace('https://', 'wss://', 1).replace('http://', 'ws://', 1)
+    params = {'x_api_key': api_key}
+    if language:
+        params['language'] = language
+    if profile:
+        params['profile'] = profile
+    return f'{url}/ws/voice?{urlencode(params)}'
+
+
+def _iter_chunks(audio, chunk_size):
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        view = memoryview(audio)
+        for i in range(0, len(view), chunk_size):
+            yield bytes(view[i:i + chunk_size])
+    elif isinstance(audio, (str, os.PathLike)):
+        with open(audio, 'rb') as f:
+            for block in iter(lambda: f.read(chunk_size), b''):
+                yield block
+    else:
+        yield from audio
+
+
+def _stream_reply(message) -> dict:
+    reply = json.loads(message)
+    if reply.get('status') != 'success':
+        raise VoiceDetectionError(reply.get('message', 'Streaming request failed'))
+    return reply
+
+
+def _closed_error(closed, message=None) -> VoiceDetectionError:
+    # The server says why it rejects a session (rate limit, oversize clip) in one last message before closing
+    if message is not None:
+        try:
+            _stream_reply(message)
+        except VoiceDetectionError as e:
+            return e
+        except ValueError:
+            pass
+    return VoiceDetectionError(f'WebSocket closed by the server: {closed}')
+
+
+class AsyncVoiceDetectionClient:
+    """Async client with a pooled keep-alive connection set; use one instance per process.
+
+        async with AsyncVoiceDetectionClient('https://host', api_key) as client:
+            result = await client.detect('clip.mp3', 'English')
+            async for path, result in client.detect_many(paths, 'Tamil', concurrency=8):
+                ...
+    """
+
+    def __init__(self, base_url: str, api_key: str, timeout: float = DEFAULT_TIMEOUT, max_connections: int = 16,
+                 max_retries: int = 5, backoff_base: float = 0.5, backoff_max: float = 30.0, transport=None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._http = httpx.AsyncClient(
+            base_url=base_url, timeout=timeout, headers={'x-api-key': api_key}, transport=transport,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def _post(self, path, payload, headers=None):
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = await self._http.post(path, json=payload, headers=headers)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+            if attempt >= self.max_retries:
+                return response
+            await asyncio.sleep(_retry_delay(response, attempt, self.backoff_base, self.backoff_max))
+            attempt += 1
+
+    async def detect(self, audio, language: str, profile: str | None = None, audio_format: str = 'mp3') -> dict:
+        """Classify one clip (bytes or a file path). Returns the response body plus traceId/modelVersion/profile."""
+        if not isinstance(audio, (bytes, bytearray, memoryview)):
+            audio = await asyncio.to_thread(_read_audio, audio)
+        payload = await asyncio.to_thread(_payload, bytes(audio), language, audio_format)
+        return _result(await self._post('/api/voice-detection', payload, _headers(profile)))
+
+    async def detect_many(self, items, language: str, concurrency: int = 8, profile: str | None = None):
+        """Classify many clips with at most `concurrency` requests in flight.
+
+        `items` may be any (lazy) iterable of paths or bytes, or of (item, language) pairs.
+        Yields (item, result) as requests finish; result is a VoiceDetectionError on failure.
+        """
+        items = iter(items)
+        results = asyncio.Queue()
+        lock = asyncio.Lock()
+
+        async def worker():
+            while True:
+                async with lock:
+                    item = next(items, None)
+                if item is None:
+                    return
+                audio, lang = item if isinstance(item, tuple) else (item, language)
+                try:
+                    result = await self.detect(audio, lang, profile)
+                except (VoiceDetectionError, httpx.HTTPError, OSError) as e:
+                    result = e if isinstance(e, VoiceDetectionError) else VoiceDetectionError(str(e))
+                await results.put((item, result))
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+        done = asyncio.gather(*workers)
+        try:
+            while not (done.done() and results.empty()):
+                getter = asyncio.ensure_future(results.get())
+                await asyncio.wait({getter, done}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            await done
+        finally:
+            for w in workers:
+                w.cancel()
+
+    async def feedback(self, trace_id: str, label: str) -> dict:
+        response = await self._post('/api/feedback', {'traceId': trace_id, 'label': label})
+        return _result(response)
+
+    async def stream(self, audio, language: str | None = None, profile: str | None = None,
+                     chunk_size: int = STREAM_CHUNK_BYTES) -> dict:
+        """Send audio over /ws/voice as binary frames and return the verdict.
+
+        `audio` may be bytes, a file path, or an (async) iterable of byte chunks, e.g. from a microphone.
+        """
+        import websockets
+        from websockets.exceptions import ConnectionClosed
+        url = _ws_url(self.base_url, self.api_key, language, profile)
+        async with websockets.connect(url, max_size=None) as ws:
+            try:
+                if hasattr(audio, '__aiter__'):
+                    async for chunk in audio:
+                        await ws.send(bytes(chunk))
+                else:
+                    for chunk in _iter_chunks(audio, chunk_size):
+                        await ws.send(chunk)
+                await ws.send('END')
+                return _stream_reply(await ws.recv())
+            except ConnectionClosed as closed:
+                try:
+                    message = await ws.recv()
+                except ConnectionClosed:
+                    message = None
+                raise _closed_error(closed, message) from closed
+
+
+class VoiceDetectionClient:
+    """Blocking counterpart of AsyncVoiceDetectionClient; safe to share between threads."""
+
+    def __init__(self, base_url: str, api_key: str, timeout: float = DEFAULT_TIMEOUT, max_connections: int = 16,
+                 max_retries: int = 5, backoff_base: float = 0.5, backoff_max: float = 30.0, transport=None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._http = httpx.Client(
+            base_url=base_url, timeout=timeout, headers={'x-api-key': api_key}, transport=transport,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._http.close()
+
+    def _post(self, path, payload, headers=None):
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = self._http.post(path, json=payload, headers=headers)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+            if attempt >= self.max_retries:
+                return response
+            time.sleep(_retry_delay(response, attempt, self.backoff_base, self.backoff_max))
+            attempt += 1
+
+    def detect(self, audio, language: str, profile: str | None = None, audio_format: str = 'mp3') -> dict:
+        payload = _payload(_read_audio(audio), language, audio_format)
+        return _result(self._post('/api/voice-detection', payload, _headers(profile)))
+
+    def detect_many(self, items, language: str, concurrency: int = 8, profile: str | None = None):
+        """Thread-pool version of AsyncVoiceDetectionClient.detect_many; yields (item, result) as they finish."""
+        def one(item):
+            audio, lang = item if isinstance(item, tuple) else (item, language)
+            try:
+                return item, self.detect(audio, lang, profile)
+            except VoiceDetectionError as e:
+                return item, e
+            except (httpx.HTTPError, OSError) as e:
+                return item, VoiceDetectionError(str(e))
+
+        items = iter(items)
+        concurrency = max(1, min(concurrency, self.max_connections))
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            inflight = set()
+            exhausted = False
+            while inflight or not exhausted:
+                # Bounded window: files are read only when a slot frees up
+                while not exhausted and len(inflight) < concurrency:
+                    item = next(items, None)
+                    if item is None:
+                        exhausted = True
+                    else:
+                        inflight.add(pool.submit(one, item))
+                if not inflight:
+                    break
+                finished, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    yield fut.result()
+
+    def feedback(self, trace_id: str, label: str) -> dict:
+        return _result(self._post('/api/feedback', {'traceId': trace_id, 'label': label}))
+
+    def stream(self, audio, language: str | None = None, profile: str | None = None,
+               chunk_size: int = STREAM_CHUNK_BYTES) -> dict:
+        from websockets.exceptions import ConnectionClosed
+        from websockets.sync.client import connect
+        with connect(_ws_url(self.base_url, self.api_key, language, profile), max_size=None) as ws:
+            try:
+                for chunk in _iter_chunks(audio, chunk_size):
+                    ws.send(chunk)
+                ws.send('END')
+                return _stream_reply(ws.recv())
+            except ConnectionClosed as closed:
+                try:
+                    message = ws.recv()
+                except ConnectionClosed:
+                    message = None
+                raise _closed_error(closed, message) from closed